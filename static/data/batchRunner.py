@@ -0,0 +1,205 @@
+"""
+Exécution groupée des traitements décrits dans un fichier de jobs.
+
+Chaque export (treePositions_ThinTrunkPlane.json, treePositions_ThreeRoof1.json,
+treePositions_ThreeRoof2.json, treePositions.json, ...) a ses propres paramètres,
+jusqu'ici codés en dur dans le __main__ de chaque script. Le fichier de jobs les
+regroupe :
+
+    {"jobs": [
+        {"name": "roof2", "tool": "roof",
+         "input": "treePositions_ThreeRoof2.json", "output": "output_ThreeRoof.json",
+         "params": {"threshold": 0.02, "min_height": 5.25}},
+        {"name": "forest", "tool": "forest",
+         "input": "treePositions.json", "output": "output_treePositions.filtered.json",
+         "category_config": {"TreeRoof": {"threshold": 0.02}}, "default_config": {"threshold": 0.0}}
+    ]}
+
+'tool' vaut 'roof', 'thinplane' ou 'forest' (voir watchMode.run_tool) ; les
+chemins sont relatifs au dossier du fichier de jobs. L'outil 'forest' ne produit
+ici que le JSON filtré : les sorties binaires et les chunks restent le rôle de
+clearerForest.process_forest_file.
+
+Les lectures et écritures passent par une boucle asyncio et un pool de threads :
+l'attente disque d'un fichier recouvre le traitement des autres (le décodage
+JSON lui-même reste limité par le GIL). Chaque fichier d'entrée n'est lu qu'une
+fois, même s'il sert à plusieurs jobs. Le filtrage, limité par le CPU, est
+confié à un pool de processus. Le débit de chaque job (objets par seconde de
+filtrage, durées de lecture, de filtrage et d'écriture) est journalisé et peut
+être écrit dans un rapport JSON.
+"""
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Any, List, NamedTuple
+
+from clearerReport import configure_logging, logger
+from jsonStream import load_positions
+from watchMode import check_tool_params, join_document, run_tool, split_document, write_json_atomic
+
+BATCH_REPORT_VERSION = 1
+
+# Lectures et écritures simultanées
+IO_THREADS = 4
+
+
+class BatchJob(NamedTuple):
+    """
+    Un traitement du fichier de jobs (chemins absolus).
+    """
+    name: str
+    input_file: str
+    output_file: str
+    tool: str = 'roof'
+    params: Dict[str, Any] = None
+    category_config: Dict[str, Dict[str, Any]] = None
+    default_config: Dict[str, Any] = None
+
+
+def load_jobs(job_file: str) -> List[BatchJob]:
+    """
+    Lit un fichier de jobs ({"jobs": [...]} ou directement la liste).
+
+    Raises:
+        ValueError: outil ou paramètre inconnu, entrée ou sortie manquante, sortie écrite par deux jobs
+    """
+    with open(job_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    entries = data.get('jobs', []) if isinstance(data, dict) else data
+    base_dir = os.path.dirname(os.path.abspath(job_file))
+
+    jobs = []
+    outputs = set()
+    for k, entry in enumerate(entries):
+        tool = entry.get('tool', 'roof')
+        try:
+            check_tool_params(tool, entry.get('params'), entry.get('category_config'), entry.get('default_config'))
+        except ValueError as e:
+            raise ValueError(f"Job {k}: {e}") from None
+        if 'input' not in entry or 'output' not in entry:
+            raise ValueError(f"Job {k}: 'input' et 'output' sont obligatoires")
+        output_file = os.path.join(base_dir, entry['output'])
+        if output_file in outputs:
+            raise ValueError(f"Job {k}: la sortie {entry['output']} est déjà écrite par un autre job")
+        outputs.add(output_file)
+        jobs.append(BatchJob(name=entry.get('name') or os.path.splitext(os.path.basename(output_file))[0],
+                             input_file=os.path.join(base_dir, entry['input']),
+                             output_file=output_file,
+                             tool=tool,
+                             params=entry.get('params'),
+                             category_config=entry.get('category_config'),
+                             default_config=entry.get('default_config')))
+    return jobs
+
+
+def _run_job_task(task):
+    tool, parts, params, category_config, default_config = task
+    start = time.perf_counter()
+    results = {key: run_tool(tool, key, objects, params, category_config, default_config)
+               for key, objects in parts.items()}
+    return results, time.perf_counter() - start
+
+
+async def _load_input(loop, io_pool, input_file: str):
+    start = time.perf_counter()
+    data = await loop.run_in_executor(io_pool, load_positions, input_file)
+    return data, split_document(data), time.perf_counter() - start
+
+
+async def _run_job(loop, job: BatchJob, loading, cpu_pool, io_pool, batch_start: float) -> Dict[str, Any]:
+    try:
+        data, parts, load_time = await loading
+        task = (job.tool, parts, job.params, job.category_config, job.default_config)
+        results, process_time = await loop.run_in_executor(cpu_pool, _run_job_task, task)
+        write_start = time.perf_counter()
+        await loop.run_in_executor(io_pool, write_json_atomic, job.output_file, join_document(data, results))
+        write_time = time.perf_counter() - write_start
+    except Exception as e:
+        # Un job en échec (fichier illisible, JSON invalide, paramètre refusé...)
+        # n'interrompt pas les autres
+        logger.error(f"{job.name}: {type(e).__name__}: {e}")
+        return {'name': job.name, 'tool': job.tool, 'input': job.input_file, 'output': job.output_file,
+                'error': str(e)}
+
+    count = sum(len(objects) for objects in parts.values())
+    kept = sum(len(objects) for objects in results.values())
+    stats = {
+        'name': job.name,
+        'tool': job.tool,
+        'input': job.input_file,
+        'output': job.output_file,
+        'objects': count,
+        'kept': kept,
+        'bytes': os.path.getsize(job.input_file),
+        'loadMs': load_time * 1000.0,
+        'processMs': process_time * 1000.0,
+        'writeMs': write_time * 1000.0,
+        'totalMs': (time.perf_counter() - batch_start) * 1000.0,
+        'objectsPerSecond': count / process_time if process_time > 0 else None,
+    }
+    rate = f"{stats['objectsPerSecond']:.0f} objets/s" if stats['objectsPerSecond'] is not None else "instantané"
+    logger.info(f"{job.name}: {count} → {kept} objets, {rate} (lecture {stats['loadMs']:.0f} ms, "
+                f"filtrage {stats['processMs']:.0f} ms, écriture {stats['writeMs']:.0f} ms) → {job.output_file}")
+    return stats
+
+
+async def run_batch_async(jobs: List[BatchJob], max_workers: int = None) -> List[Dict[str, Any]]:
+    """
+    Version asynchrone de run_batch (à attendre depuis une boucle déjà lancée).
+    """
+    loop = asyncio.get_running_loop()
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    batch_start = time.perf_counter()
+
+    # Un seul processus : le filtrage reste dans un thread, sans coût de transfert
+    cpu_pool = ProcessPoolExecutor(max_workers=max_workers) if max_workers > 1 else ThreadPoolExecutor(max_workers=1)
+    with cpu_pool, ThreadPoolExecutor(max_workers=IO_THREADS) as io_pool:
+        # Une lecture par fichier d'entrée, attendue par tous les jobs qui l'utilisent
+        loads = {}
+        for job in jobs:
+            if job.input_file not in loads:
+                loads[job.input_file] = asyncio.ensure_future(_load_input(loop, io_pool, job.input_file))
+        return await asyncio.gather(*(_run_job(loop, job, loads[job.input_file], cpu_pool, io_pool, batch_start)
+                                      for job in jobs))
+
+
+def run_batch(jobs: List[BatchJob], max_workers: int = None, report_file: str = None) -> List[Dict[str, Any]]:
+    """
+    Exécute tous les jobs : lectures partagées et écritures en parallèle, filtrage sur un pool de processus.
+
+    Args:
+        jobs: Traitements à exécuter (voir load_jobs)
+        max_workers: Processus du filtrage (None = nombre de cœurs, 1 = un thread)
+        report_file: Rapport JSON des débits par job (None = aucun)
+
+    Returns:
+        Statistiques de chaque job, dans l'ordre des jobs ('error' pour un job en échec)
+    """
+    start = time.perf_counter()
+    results = asyncio.run(run_batch_async(jobs, max_workers))
+    elapsed = time.perf_counter() - start
+
+    succeeded = sum('error' not in stats for stats in results)
+    inputs = len({job.input_file for job in jobs})
+    logger.info(f"\n{succeeded}/{len(jobs)} job(s) terminé(s) en {elapsed:.2f} s ({inputs} fichier(s) d'entrée lu(s))")
+
+    if report_file:
+        with open(report_file, 'w', encoding='utf-8') as f:
+            json.dump({'version': BATCH_REPORT_VERSION, 'elapsedMs': elapsed * 1000.0, 'jobs': results},
+                      f, indent=2, ensure_ascii=False)
+        logger.info(f"Rapport écrit: {report_file}")
+    return results
+
+
+if __name__ == "__main__":
+    # Fichier de jobs (chemins relatifs à son dossier)
+    JOB_FILE = 'batchJobs.json'
+    MAX_WORKERS = None  # Nombre de processus du filtrage (None = nombre de cœurs)
+    REPORT_FILE = None  # Rapport JSON des débits par job (ex: 'batch_report.json')
+    LOG_LEVEL = 'INFO'  # 'WARNING' n'affiche plus que les erreurs
+
+    configure_logging(LOG_LEVEL)
+    run_batch(load_jobs(JOB_FILE), max_workers=MAX_WORKERS, report_file=REPORT_FILE)
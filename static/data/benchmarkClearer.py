@@ -0,0 +1,466 @@
+"""
+Banc d'essai des scripts de nettoyage sur des scènes synthétiques reproductibles.
+
+Les scènes reprennent le schéma des exports Blender (x, y, z, rotation*, scale*)
+et la répartition par catégorie de treePositions.json, avec quatre répartitions au
+sol : uniforme, en bosquets (clustered), grille avec bruit (grid) et dense (même
+densité quelle que soit la taille : le filtrage y retire une part stable des
+objets, même sur les petites scènes). Chaque scène est filtrée avec chaque mesure
+de distance de DISTANCE_MODES (normalisée, et brute pondérée par les rotations et
+échelles comme calculate_distance de clearerRoof). Pour chaque
+scène, les étapes load (json.load et conversion en colonnes), dedupe, transform
+et write (reconstruction des objets et json.dump) sont chronométrées avec
+clearerProfile, ainsi que le pic mémoire de chaque étape (tracemalloc, optionnel).
+
+La vérification compare les objets conservés par chaque moteur de filtrage à
+l'implémentation de référence O(n²) (parcours de tous les objets conservés, avec
+la fonction de distance des scripts d'origine correspondant à la mesure), ou au
+moteur 'grid' pour les catégories trop grandes pour la référence.
+"""
+import json
+import math
+import os
+import tempfile
+from typing import Dict, Any, List, Tuple, Callable
+
+import numpy as np
+
+from clearerPipeline import DedupeStage, build_pipeline, config_to_spec
+from clearerProfile import profiling
+from clearerRoof import calculate_distance, calculate_normalized_distance
+from clearerReport import logger
+from positionArrays import PositionArrays
+from shardedDedupe import sharded_select
+from spatialIndex import iter_greedy_decisions, search_radius
+
+# Nombre d'objets par catégorie dans treePositions.json (proportions des scènes)
+CATEGORY_WEIGHTS = {
+    'TreeRoof': 487, 'Server': 50, 'ScreenOld': 26, 'ScreenOldEmission': 26, 'ScreenEmission': 142,
+    'Screen': 142, 'TreeNaked': 134, 'TrunkLarge': 74, 'TrunkThin': 2251, 'BranchTree': 3480,
+    'BranchEucalyptus': 186, 'BranchFig': 367, 'BushBlueberry': 284, 'BushRaspberry': 67,
+    'BushTrunk': 79, 'BushStrawberry': 67, 'FlowerBell': 44, 'FlowerChicory': 64, 'FlowerClover': 127,
+    'MushroomDuo': 86, 'MushroomSolo': 87, 'PlantClematis': 67, 'PineCone': 83, 'PlantMiscanthus': 52,
+    'PlantPuccinellia': 61, 'PlantReed': 78,
+}
+
+# Emprise de treePositions.json : (min, max) en X, Y et Z
+SCENE_BOUNDS = ((-72.0, 46.0), (-3.1, 7.4), (-164.0, 84.0))
+
+DISTRIBUTIONS = ('uniform', 'clustered', 'grid', 'dense')
+DEFAULT_SIZES = (1_000, 10_000, 100_000, 1_000_000)
+
+# Nombre moyen d'objets par bosquet et écart type de leur position (scène 'clustered')
+CLUSTER_SIZE = 200
+CLUSTER_SPREAD = 2.0
+
+# Bruit de la scène 'grid', en fraction du pas de la grille
+GRID_JITTER = 0.25
+
+# Espacement moyen des objets d'une catégorie dans la scène 'dense' (unités de scène) :
+# l'emprise grandit avec le nombre d'objets
+DENSE_SPACING = 1.0
+
+# Au-delà, la référence O(n²) est remplacée par le moteur 'grid' pour la vérification
+REFERENCE_MAX_COUNT = 5_000
+
+# Paramètres appliqués à chaque catégorie (voir clearerForest.DEFAULT_CONFIG) ; seuil
+# normalisé de 1 unité (0.005 x 200), de l'ordre de DENSE_SPACING
+BENCHMARK_CONFIG = {
+    'threshold': 0.005,
+    'scale_factor': 1.2,
+    'rotation_offset': {'rotationX': 0.1},
+    'y_offset': 0.5,
+    'min_height': 0.0,
+}
+
+# Mesures de distance du filtrage (paramètres de DedupeStage, seuil adapté à la mesure) ;
+# 'weighted' : position brute + 0.1 x rotations + 0.01 x échelles, les rotations
+# aléatoires des scènes y ajoutent en moyenne ~0.3 unité
+DISTANCE_MODES = {
+    'normalized': {'use_normalized': True, 'weighted': False},
+    'weighted': {'use_normalized': False, 'weighted': True, 'threshold': 1.5},
+}
+
+STAGES = ('load', 'dedupe', 'transform', 'write')
+
+# Tailles d'une couche unique (une seule catégorie) pour vérifier la montée en charge du filtrage
+SCALING_SIZES = (100_000, 1_000_000)
+
+# Répartitions de densité indépendante de la taille (même proportion d'objets retirés)
+SCALING_DISTRIBUTIONS = ('dense', 'clustered')
+
+# Coût par objet toléré à chaque taille, rapporté à celui de la plus petite (1 = linéaire)
+SCALING_TOLERANCE = 2.0
+
+
+def generate_positions(count: int, distribution: str, rng: np.random.Generator) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Coordonnées au sol (x, z) de count objets, dans un ordre aléatoire.
+    """
+    (x_min, x_max), _, (z_min, z_max) = SCENE_BOUNDS
+
+    if distribution == 'uniform':
+        return rng.uniform(x_min, x_max, count), rng.uniform(z_min, z_max, count)
+
+    if distribution == 'clustered':
+        clusters = max(1, count // CLUSTER_SIZE)
+        centers_x = rng.uniform(x_min, x_max, clusters)
+        centers_z = rng.uniform(z_min, z_max, clusters)
+        cluster = rng.integers(0, clusters, count)
+        return (centers_x[cluster] + rng.normal(0.0, CLUSTER_SPREAD, count),
+                centers_z[cluster] + rng.normal(0.0, CLUSTER_SPREAD, count))
+
+    if distribution == 'grid':
+        # Grille de même rapport d'aspect que la scène, avec assez de points pour count
+        width, depth = x_max - x_min, z_max - z_min
+        step = math.sqrt(width * depth / count)
+        columns = max(1, math.ceil(width / step))
+        rows = math.ceil(count / columns)
+        cell = rng.permutation(columns * rows)[:count]
+        jitter = GRID_JITTER * step
+        return (x_min + (cell % columns + 0.5) * step + rng.uniform(-jitter, jitter, count),
+                z_min + (cell // columns + 0.5) * step + rng.uniform(-jitter, jitter, count))
+
+    if distribution == 'dense':
+        # Carré centré sur la scène, d'emprise count x DENSE_SPACING²
+        half = math.sqrt(count) * DENSE_SPACING / 2.0
+        center_x, center_z = (x_min + x_max) / 2.0, (z_min + z_max) / 2.0
+        return (rng.uniform(center_x - half, center_x + half, count),
+                rng.uniform(center_z - half, center_z + half, count))
+
+    raise ValueError(f"Répartition inconnue: {distribution} (disponibles: {', '.join(DISTRIBUTIONS)})")
+
+
+def generate_scene(count: int, distribution: str = 'uniform', seed: int = 0) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Scène synthétique {catégorie: [objets]} au format de treePositions.json.
+
+    Args:
+        count: Nombre total d'objets, réparti selon CATEGORY_WEIGHTS
+        distribution: 'uniform', 'clustered', 'grid' ou 'dense'
+        seed: Graine (même graine = même scène)
+    """
+    rng = np.random.default_rng(seed)
+    weights = np.array(list(CATEGORY_WEIGHTS.values()), dtype=np.float64)
+    counts = np.floor(weights / weights.sum() * count).astype(np.int64)
+    counts[np.argmax(weights)] += count - counts.sum()
+
+    scene = {}
+    _, (y_min, y_max), _ = SCENE_BOUNDS
+    for category, category_count in zip(CATEGORY_WEIGHTS, counts.tolist()):
+        x, z = generate_positions(category_count, distribution, rng)
+        scale = rng.uniform(0.1, 5.0, category_count)
+        columns = {
+            'x': x,
+            'y': rng.uniform(y_min, y_max, category_count),
+            'z': z,
+            'rotationX': rng.uniform(-math.pi, math.pi, category_count),
+            'rotationY': rng.uniform(-math.pi, math.pi, category_count),
+            'rotationZ': rng.uniform(-math.pi, math.pi, category_count),
+        }
+        # Échelle quasi uniforme, comme dans les exports (écarts d'arrondi de Blender)
+        for field in ('scaleX', 'scaleY', 'scaleZ'):
+            columns[field] = scale * (1.0 + rng.normal(0.0, 1e-7, category_count))
+        scene[category] = PositionArrays(columns, category_count).to_objects()
+
+    return scene
+
+
+def _position_distance(obj1: Dict[str, float], obj2: Dict[str, float]) -> float:
+    return math.sqrt((obj1['x'] - obj2['x']) ** 2 + (obj1['y'] - obj2['y']) ** 2 + (obj1['z'] - obj2['z']) ** 2)
+
+
+def reference_distance(use_normalized: bool = True, weighted: bool = False) -> Callable[[Dict, Dict], float]:
+    """
+    Distance objet à objet des scripts d'origine correspondant à une mesure de DedupeStage.
+    """
+    if use_normalized:
+        return calculate_normalized_distance
+    return calculate_distance if weighted else _position_distance
+
+
+def reference_kept(objects: List[Dict[str, Any]],
+                   threshold: float,
+                   use_normalized: bool = True,
+                   weighted: bool = False) -> np.ndarray:
+    """
+    Filtrage de référence : chaque objet est comparé à tous les objets déjà conservés
+    (parcours O(n²) des scripts d'origine, voir reference_distance).
+
+    Returns:
+        Indices des objets conservés
+    """
+    distance_func = reference_distance(use_normalized, weighted)
+    filtered_objects = []
+    kept = []
+    for i, current_obj in enumerate(objects):
+        if all(distance_func(current_obj, kept_obj) >= threshold for kept_obj in filtered_objects):
+            filtered_objects.append(current_obj)
+            kept.append(i)
+    return np.array(kept, dtype=np.int64)
+
+
+def grid_kept(objects: List[Dict[str, Any]],
+              threshold: float,
+              use_normalized: bool = True,
+              weighted: bool = False) -> np.ndarray:
+    """
+    Filtrage objet par objet avec la grille spatiale (spatialIndex.iter_greedy_decisions).
+    """
+    decisions = iter_greedy_decisions(objects, threshold, reference_distance(use_normalized, weighted),
+                                      search_radius(threshold, use_normalized))
+    return np.array([i for i, closest_index, _ in decisions if closest_index == -1], dtype=np.int64)
+
+
+def vectorized_kept(objects: List[Dict[str, Any]],
+                    threshold: float,
+                    use_normalized: bool = True,
+                    weighted: bool = False) -> np.ndarray:
+    """
+    Filtrage vectorisé par lots (clearerPipeline.DedupeStage).
+    """
+    if not objects:
+        return np.zeros(0, dtype=np.int64)
+    dedupe = DedupeStage(threshold=threshold, use_normalized=use_normalized, weighted=weighted)
+    blocker, _ = dedupe.select(PositionArrays.from_objects(objects))
+    return np.flatnonzero(blocker == -1)
+
+
+def sharded_kept(objects: List[Dict[str, Any]],
+                 threshold: float,
+                 use_normalized: bool = True,
+                 weighted: bool = False) -> np.ndarray:
+    """
+    Filtrage réparti par bandes sur deux processus (shardedDedupe.sharded_select).
+    """
+    if not objects:
+        return np.zeros(0, dtype=np.int64)
+    blocker, _ = sharded_select(PositionArrays.from_objects(objects), threshold, use_normalized, weighted,
+                                max_workers=2)
+    return np.flatnonzero(blocker == -1)
+
+
+# Moteurs de filtrage comparés par verify_engines
+ENGINES: Dict[str, Callable[[List[Dict[str, Any]], float, bool, bool], np.ndarray]] = {
+    'grid': grid_kept,
+    'vectorized': vectorized_kept,
+    'sharded': sharded_kept,
+}
+
+
+def verify_engines(scene: Dict[str, List[Dict[str, Any]]],
+                   threshold: float,
+                   use_normalized: bool = True,
+                   weighted: bool = False) -> Dict[str, Any]:
+    """
+    Vérifie que chaque moteur conserve exactement les mêmes objets que la référence,
+    avec la mesure de distance donnée (voir DedupeStage).
+
+    Returns:
+        {'reference': nombre de catégories vérifiées contre la référence O(n²),
+         'grid': nombre vérifiées contre le moteur 'grid', 'mismatches': [(moteur, catégorie)]}
+    """
+    result = {'reference': 0, 'grid': 0, 'mismatches': []}
+    for category, objects in scene.items():
+        if len(objects) <= REFERENCE_MAX_COUNT:
+            expected, baseline = reference_kept(objects, threshold, use_normalized, weighted), 'reference'
+        else:
+            expected, baseline = grid_kept(objects, threshold, use_normalized, weighted), 'grid'
+        result[baseline] += 1
+
+        for name, engine in ENGINES.items():
+            if name == baseline:
+                continue
+            if not np.array_equal(engine(objects, threshold, use_normalized, weighted), expected):
+                result['mismatches'].append((name, category))
+    return result
+
+
+def _load(path: str):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write(path: str, data: Dict[str, Any]):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+
+
+def benchmark_scene(count: int,
+                    distribution: str,
+                    seed: int = 0,
+                    config: Dict[str, Any] = None,
+                    verify: bool = False,
+                    trace_memory: bool = False) -> Dict[str, Any]:
+    """
+    Chronomètre le traitement complet d'une scène (même chaîne que process_forest_file).
+
+    Args:
+        config: Paramètres ajoutés à BENCHMARK_CONFIG (dont use_normalized et
+            weighted, la mesure de distance du filtrage, voir DISTANCE_MODES)
+
+    Returns:
+        Résultat : taille, répartition, objets conservés, secondes et pic mémoire par
+        étape, et résultat de verify_engines si verify est vrai
+    """
+    config = dict(BENCHMARK_CONFIG, **(config or {}))
+    scene = generate_scene(count, distribution, seed)
+    transforms = build_pipeline(config_to_spec(config, include_dedupe=False))
+    distance = {'use_normalized': config.get('use_normalized', True), 'weighted': config.get('weighted', False)}
+    dedupe = DedupeStage(threshold=config['threshold'], **distance)
+
+    with tempfile.TemporaryDirectory() as directory:
+        input_file = os.path.join(directory, 'scene.json')
+        output_file = os.path.join(directory, 'output.json')
+        _write(input_file, scene)
+        input_bytes = os.path.getsize(input_file)
+
+        with profiling(trace_memory=trace_memory, report=False) as profiler:
+            with profiler.stage('load'):
+                data = _load(input_file)
+            output = {}
+            kept_count = 0
+            for category, objects in data.items():
+                with profiler.stage('load'):
+                    arrays = PositionArrays.from_objects(objects)
+                with profiler.stage('dedupe'):
+                    kept = dedupe.run(arrays, {})
+                with profiler.stage('transform'):
+                    kept, _ = transforms.run(kept)
+                with profiler.stage('write'):
+                    output[category] = kept.to_objects()
+                kept_count += kept.count
+            with profiler.stage('write'):
+                _write(output_file, output)
+        output_bytes = os.path.getsize(output_file)
+
+    result = {
+        'count': count,
+        'distribution': distribution,
+        'seed': seed,
+        'threshold': config['threshold'],
+        'useNormalized': distance['use_normalized'],
+        'weighted': distance['weighted'],
+        'kept': kept_count,
+        'inputBytes': input_bytes,
+        'outputBytes': output_bytes,
+        'seconds': {stage: profiler.stages[stage]['seconds'] for stage in STAGES},
+        'counters': profiler.counters,
+    }
+    if trace_memory:
+        result['peakBytes'] = {stage: profiler.stages[stage]['peakBytes'] for stage in STAGES}
+    if verify:
+        result['verification'] = verify_engines(scene, config['threshold'], **distance)
+    return result
+
+
+def _log_result(result: Dict[str, Any], mode: str, verify: bool, trace_memory: bool):
+    peak = f"{max(result['peakBytes'].values()) / 1e6:8.1f}" if trace_memory else f"{'-':>8}"
+    check = '-'
+    if verify:
+        verification = result['verification']
+        check = 'ÉCHEC ' + str(verification['mismatches']) if verification['mismatches'] else \
+            f"ok ({verification['reference']} réf., {verification['grid']} grid)"
+    logger.info(f"{result['count']:>9} {result['distribution']:>11} {mode:>10} {result['kept']:>9} "
+                + ' '.join(f"{result['seconds'][stage]:>8.3f}s" for stage in STAGES)
+                + f" {peak} {check}")
+
+
+def run_benchmark(sizes=DEFAULT_SIZES,
+                  distributions=DISTRIBUTIONS,
+                  seed: int = 0,
+                  config: Dict[str, Any] = None,
+                  verify: bool = False,
+                  trace_memory: bool = False,
+                  output_file: str = None,
+                  distance_modes: Dict[str, Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """
+    Exécute benchmark_scene pour chaque taille, répartition et mesure de distance,
+    et affiche un tableau.
+
+    Args:
+        config: Paramètres communs à toutes les mesures (prioritaires sur DISTANCE_MODES)
+        output_file: Fichier JSON des résultats (None = aucun)
+        distance_modes: Mesures de distance essayées (DISTANCE_MODES par défaut)
+    """
+    distance_modes = DISTANCE_MODES if distance_modes is None else distance_modes
+    results = []
+    logger.info(f"{'objets':>9} {'répartition':>11} {'mesure':>10} {'conservés':>9} "
+                + ' '.join(f'{stage:>9}' for stage in STAGES) + f" {'pic Mo':>8} vérification")
+    for count in sizes:
+        for distribution in distributions:
+            for mode, mode_config in distance_modes.items():
+                result = benchmark_scene(count, distribution, seed, dict(mode_config, **(config or {})),
+                                         verify, trace_memory)
+                result['distance'] = mode
+                results.append(result)
+                _log_result(result, mode, verify, trace_memory)
+
+    if output_file:
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        logger.info(f"\nRésultats écrits: {output_file}")
+
+    return results
+
+
+def check_dedupe_scaling(sizes=SCALING_SIZES,
+                         distributions=SCALING_DISTRIBUTIONS,
+                         threshold: float = BENCHMARK_CONFIG['threshold'],
+                         seed: int = 0,
+                         tolerance: float = SCALING_TOLERANCE) -> List[Dict[str, Any]]:
+    """
+    Vérifie que le filtrage d'une couche unique (DedupeStage.select) croît
+    linéairement avec son nombre d'objets : à chaque taille, le coût par objet ne
+    dépasse pas tolerance fois celui de la plus petite taille.
+
+    Returns:
+        Mesures : taille, répartition, objets conservés, secondes, coût relatif par objet
+
+    Raises:
+        AssertionError: coût par objet au-delà de la tolérance
+    """
+    results = []
+    failures = []
+    logger.info(f"{'objets':>9} {'répartition':>11} {'conservés':>9} {'dedupe':>9} {'coût/objet':>10}")
+    for distribution in distributions:
+        base = None
+        for count in sizes:
+            rng = np.random.default_rng(seed)
+            x, z = generate_positions(count, distribution, rng)
+            arrays = PositionArrays({'x': x, 'y': np.zeros(count), 'z': z}, count)
+            with profiling(report=False) as profiler:
+                with profiler.stage('dedupe'):
+                    blocker, _ = DedupeStage(threshold=threshold).select(arrays)
+            seconds = profiler.stages['dedupe']['seconds']
+            per_object = seconds / count
+            base = per_object if base is None else base
+            result = {'count': count, 'distribution': distribution, 'threshold': threshold,
+                      'kept': int((blocker == -1).sum()), 'seconds': seconds, 'relativeCost': per_object / base}
+            results.append(result)
+            logger.info(f"{count:>9} {distribution:>11} {result['kept']:>9} {seconds:>8.3f}s "
+                        f"{result['relativeCost']:>9.2f}x")
+            if result['relativeCost'] > tolerance:
+                failures.append(f"{distribution} {count}: {result['relativeCost']:.2f}x")
+
+    if failures:
+        raise AssertionError(f"Filtrage non linéaire (coût par objet > {tolerance}x): {', '.join(failures)}")
+    return results
+
+
+if __name__ == "__main__":
+    # Configuration du banc d'essai (modifiez ces valeurs selon vos besoins)
+    SIZES = (1_000, 10_000, 100_000)  # Ajouter 1_000_000 pour la plus grande scène
+    SEED = 0
+    VERIFY = True  # Compare les moteurs à la référence O(n²) (lent sur les grandes catégories)
+    TRACE_MEMORY = False  # Pic mémoire par étape (tracemalloc ralentit les mesures)
+    CHECK_SCALING = True  # Vérifie que le filtrage d'une couche croît linéairement (SCALING_SIZES)
+
+    run_benchmark(SIZES,
+                  seed=SEED,
+                  verify=VERIFY,
+                  trace_memory=TRACE_MEMORY,
+                  output_file='benchmark_results.json')
+
+    if CHECK_SCALING:
+        check_dedupe_scaling()
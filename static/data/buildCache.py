@@ -0,0 +1,170 @@
+"""
+Cache disque adressé par contenu pour les reconstructions incrémentales.
+
+Chaque résultat est indexé par le hash de sa tranche d'entrée (colonnes d'une
+catégorie), les paramètres de l'étape et TOOL_VERSION. Les étapes sont chaînées :
+la clé de l'étape de modifications inclut celle du filtrage, si bien qu'un
+changement de MIN_HEIGHT ne relance que les modifications de la catégorie concernée.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import zipfile
+from typing import Dict, Any, Tuple
+
+import numpy as np
+
+from positionArrays import PositionArrays
+
+# À incrémenter dès que le résultat d'une étape change pour des paramètres identiques
+TOOL_VERSION = '2'
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'gobelins_clearer')
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def hash_arrays(arrays: PositionArrays) -> str:
+    """
+    Hash du contenu d'une catégorie (valeurs, champs présents, identifiants et clés annexes).
+    """
+    digest = hashlib.sha256()
+    digest.update(f'{arrays.count}:{arrays.schema}'.encode())
+    for field in sorted(arrays.columns):
+        digest.update(field.encode())
+        digest.update(str(arrays.columns[field].dtype).encode())
+        digest.update(np.ascontiguousarray(arrays.columns[field]).tobytes())
+        if field in arrays.present:
+            digest.update(np.packbits(arrays.present[field]).tobytes())
+        if field in arrays.filled:
+            digest.update(b'filled')
+            digest.update(np.packbits(arrays.filled[field]).tobytes())
+    if arrays.ids is not None:
+        digest.update(np.ascontiguousarray(arrays.ids).tobytes())
+    if arrays.extras is not None:
+        digest.update(json.dumps(arrays.extras, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def _arrays_to_npz(arrays: PositionArrays) -> Dict[str, np.ndarray]:
+    data = {'count': np.array(arrays.count), 'schema': np.array(arrays.schema)}
+    for field, column in arrays.columns.items():
+        data[f'column_{field}'] = column
+    for field, mask in arrays.present.items():
+        data[f'present_{field}'] = mask
+    for field, mask in arrays.filled.items():
+        data[f'filled_{field}'] = mask
+    if arrays.ids is not None:
+        data['ids'] = arrays.ids
+    if arrays.extras is not None:
+        data['extras'] = np.array(json.dumps(arrays.extras))
+    return data
+
+
+def _arrays_from_npz(data: Dict[str, np.ndarray]) -> PositionArrays:
+    columns = {name[len('column_'):]: data[name] for name in data if name.startswith('column_')}
+    present = {name[len('present_'):]: data[name] for name in data if name.startswith('present_')}
+    filled = {name[len('filled_'):]: data[name] for name in data if name.startswith('filled_')}
+    extras = json.loads(str(data['extras'])) if 'extras' in data else None
+    ids = data['ids'] if 'ids' in data else None
+    return PositionArrays(columns, int(data['count']), present, extras, ids, str(data['schema']), filled)
+
+
+class BuildCache:
+    """
+    Cache de résultats par étape, borné en taille (éviction des moins récemment utilisés).
+    """
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(stage: str, input_key: str, params: Dict[str, Any]) -> str:
+        """
+        Clé d'un résultat : étape, clé de l'entrée, paramètres et version de l'outil.
+        """
+        payload = json.dumps({'stage': stage, 'input': input_key, 'params': params, 'version': TOOL_VERSION},
+                             sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f'{key}.npz')
+
+    def _load(self, key: str) -> Dict[str, np.ndarray]:
+        path = self._path(key)
+        try:
+            # Tableaux copiés puis fichier refermé : aucun descripteur ne reste ouvert par lecture
+            with np.load(path, allow_pickle=False) as npz:
+                data = {name: npz[name] for name in npz.files}
+        except (OSError, ValueError, zipfile.BadZipFile):
+            self.misses += 1
+            return None
+        # La date de modification sert d'horodatage d'utilisation pour l'éviction
+        try:
+            os.utime(path)
+        except OSError:
+            # Entrée évincée par un autre processus entre-temps : les données lues restent valides
+            pass
+        self.hits += 1
+        return data
+
+    def _store(self, key: str, data: Dict[str, np.ndarray]):
+        # Écriture atomique : un processus concurrent ne lit jamais un fichier partiel
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **data)
+        os.replace(temp_path, self._path(key))
+        self.evict()
+
+    def get_indices(self, key: str) -> Tuple[np.ndarray, int]:
+        """
+        (indices conservés, nombre de doublons retirés) d'un filtrage, None si absent.
+        """
+        data = self._load(key)
+        if data is None or 'duplicates' not in data:
+            # Entrée d'une version antérieure, sans le nombre de doublons : recalculée
+            return None
+        return data['indices'], int(data['duplicates'])
+
+    def put_indices(self, key: str, indices: np.ndarray, duplicates: int = 0):
+        self._store(key, {'indices': np.asarray(indices, dtype=np.int64), 'duplicates': np.array(duplicates)})
+
+    def get_result(self, key: str) -> Tuple[PositionArrays, Dict[str, Any]]:
+        data = self._load(key)
+        if data is None:
+            return None
+        return _arrays_from_npz(data), json.loads(str(data['stats']))
+
+    def put_result(self, key: str, arrays: PositionArrays, stats: Dict[str, Any]):
+        data = _arrays_to_npz(arrays)
+        data['stats'] = np.array(json.dumps(stats))
+        self._store(key, data)
+
+    def evict(self):
+        """
+        Supprime les entrées les plus anciennes tant que le cache dépasse max_bytes.
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.npz'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                status = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((status.st_mtime, status.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
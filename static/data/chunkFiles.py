@@ -0,0 +1,231 @@
+"""
+Sortie découpée en fichiers nommés par le hash de leur contenu.
+
+Un seul treePositions.json oblige le navigateur à tout retélécharger dès qu'un
+objet change. Ici, chaque cellule de quelques chunks (ou chaque catégorie) est
+écrite dans son propre fichier `<nom>.<hash>.json`, accompagné de ses variantes
+précompressées `.json.gz` et `.json.br` (brotli, si le module est installé). Un
+fichier dont le contenu n'a pas changé garde le même nom d'une version à l'autre
+et reste donc en cache (navigateur, CDN) ; ces fichiers peuvent être servis avec
+`Cache-Control: immutable`.
+
+Le manifeste (nom fixe, petit, à ne pas mettre en cache longtemps) donne pour
+chaque cellule sa boîte englobante, ses effectifs et son fichier : le premier
+affichage n'a besoin que du manifeste et des cellules proches de la caméra.
+Chaque fichier contient {catégorie: [objets, ...]}, au schéma de la sortie JSON.
+"""
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+from typing import Dict, Any, List
+
+from chunkManifest import CHUNK_SIZE, UNDEFINED_CATEGORY, manifest_chunks, partition_chunks
+from positionArrays import PositionArrays
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CHUNK_FILES_VERSION = 1
+
+# Caractères hexadécimaux du hash conservés dans les noms de fichiers
+HASH_LENGTH = 16
+
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+MANIFEST_NAME = 'manifest.json'
+
+# Côté d'une cellule de fichier : 4 x 4 chunks de Forest.jsx, quelques Ko par fichier
+FILE_CHUNK_SIZE = 4 * CHUNK_SIZE
+
+
+def _published_mode() -> int:
+    # os.umask ne se lit qu'en le remplaçant
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o644 & ~umask
+
+
+def _write_atomic(path: str, content: bytes):
+    # Écriture atomique : un serveur ne sert jamais un fichier partiel
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(content)
+    # mkstemp crée le fichier en 0600 : lisible par le serveur web ou l'outil de déploiement
+    os.chmod(temp_path, _published_mode())
+    os.replace(temp_path, path)
+
+
+def compressed_variants(content: bytes) -> Dict[str, bytes]:
+    """
+    Variantes précompressées d'un contenu ({extension: octets}).
+
+    gzip est écrit avec une date nulle : même contenu, mêmes octets.
+    """
+    variants = {'.gz': gzip.compress(content, compresslevel=GZIP_LEVEL, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(content, quality=BROTLI_QUALITY)
+    return variants
+
+
+def write_hashed_file(output_dir: str, name: str, data: Any, compress: bool = True) -> Dict[str, Any]:
+    """
+    Écrit data (JSON compact) sous `<name>.<hash>.json` et ses variantes compressées.
+
+    Un fichier déjà présent n'est pas réécrit : son nom garantit son contenu.
+
+    Returns:
+        {'file', 'hash', 'bytes', 'written', 'encodings' {extension: octets}}
+    """
+    content = json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    digest = hashlib.sha256(content).hexdigest()[:HASH_LENGTH]
+    file_name = f"{name}.{digest}.json"
+    path = os.path.join(output_dir, file_name)
+
+    written = not os.path.exists(path)
+    if written:
+        _write_atomic(path, content)
+    else:
+        # Fichier d'une exécution précédente, peut-être encore en 0600
+        os.chmod(path, _published_mode())
+
+    encodings = {}
+    if compress:
+        for extension, variant in compressed_variants(content).items():
+            if not os.path.exists(path + extension):
+                _write_atomic(path + extension, variant)
+            else:
+                os.chmod(path + extension, _published_mode())
+            encodings[extension.lstrip('.')] = len(variant)
+
+    return {'file': file_name, 'hash': digest, 'bytes': len(content), 'written': written, 'encodings': encodings}
+
+
+def _manifest_files(manifest: Dict[str, Any]) -> List[str]:
+    files = [entry['file'] for entry in manifest.get('cells', [])]
+    files += [entry['file'] for entry in manifest.get('categories', {}).values()]
+    return files
+
+
+def _merge_cells(manifest: Dict[str, Any]) -> List[Dict[str, Any]]:
+    # partition_chunks sépare les groupes d'objets : un fichier regroupe tous les groupes d'une cellule
+    cells = {}
+    for chunk in manifest_chunks(manifest):
+        key = (chunk['chunkX'], chunk['chunkZ'])
+        cell = cells.get(key)
+        if cell is None:
+            cell = cells[key] = {
+                'cellX': chunk['chunkX'],
+                'cellZ': chunk['chunkZ'],
+                'center': chunk['center'],
+                'bounds': chunk['bounds'],
+                'instanceCount': 0,
+                'objects': {},
+            }
+        else:
+            cell['bounds'] = {'min': [min(a, b) for a, b in zip(cell['bounds']['min'], chunk['bounds']['min'])],
+                              'max': [max(a, b) for a, b in zip(cell['bounds']['max'], chunk['bounds']['max'])]}
+        cell['instanceCount'] += chunk['instanceCount']
+        cell['objects'].update(chunk['objects'])
+    return list(cells.values())
+
+
+def write_chunk_files(output_dir: str,
+                      categories: Dict[str, PositionArrays],
+                      granularity: str = 'chunk',
+                      file_chunk_size: float = FILE_CHUNK_SIZE,
+                      tier_counts: Dict[str, List[int]] = None,
+                      compress: bool = True,
+                      prune: bool = True) -> Dict[str, Any]:
+    """
+    Écrit les instances en fichiers adressés par contenu et le manifeste associé.
+
+    Args:
+        output_dir: Dossier de sortie (créé si besoin)
+        categories: Colonnes par catégorie (après filtrage et modifications)
+        granularity: 'chunk' (un fichier par cellule de file_chunk_size, toutes
+            catégories confondues) ou 'category' (un fichier par catégorie)
+        file_chunk_size: Côté d'une cellule de fichier (multiple de CHUNK_SIZE : les
+            chunks de Forest.jsx ne sont jamais coupés entre deux fichiers)
+        tier_counts: Tailles des niveaux de densité par catégorie (voir chunkManifest.partition_chunks)
+        compress: Écrit aussi les variantes .gz / .br
+        prune: Supprime les fichiers du manifeste précédent qui ne sont plus référencés
+
+    Returns:
+        Manifeste écrit dans output_dir/MANIFEST_NAME : 'cells' (mode 'chunk'), chaque
+        cellule donnant son centre, sa boîte englobante, son fichier et, par catégorie,
+        le nombre d'instances (et 'tiers') ; 'categories' {catégorie: {'file', 'count'}}
+        pour les fichiers par catégorie (mode 'category', ou catégories hors chunks
+        comme Undefined en mode 'chunk'). 'written' donne le nombre de fichiers
+        réellement écrits, 'bytes' la taille totale des fichiers JSON.
+    """
+    if granularity not in ('chunk', 'category'):
+        raise ValueError(f"Découpage inconnu: {granularity} (attendu 'chunk' ou 'category')")
+    if file_chunk_size % CHUNK_SIZE:
+        raise ValueError(f"file_chunk_size ({file_chunk_size}) doit être un multiple de {CHUNK_SIZE}")
+
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    previous = None
+    if prune and os.path.exists(manifest_path):
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                previous = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            previous = None
+
+    ordered, chunks = partition_chunks(categories, file_chunk_size, tier_counts)
+    manifest = {
+        'version': CHUNK_FILES_VERSION,
+        'granularity': granularity,
+        'chunkSize': CHUNK_SIZE,
+        'cellSize': file_chunk_size,
+        'cells': [],
+        'categories': {},
+    }
+    written = 0
+    total_bytes = 0
+
+    def record(entry, result):
+        nonlocal written, total_bytes
+        entry['file'] = result['file']
+        entry['bytes'] = result['bytes']
+        if result['encodings']:
+            entry['encodings'] = result['encodings']
+        written += result['written']
+        total_bytes += result['bytes']
+
+    if granularity == 'chunk':
+        for cell in _merge_cells(chunks):
+            data = {}
+            for category, entry in cell['objects'].items():
+                data[category] = ordered[category].block(entry['start'], entry['start'] + entry['count']).to_objects()
+                # Les plages ne servent qu'au découpage : chaque fichier commence à 0
+                del entry['start']
+            record(cell, write_hashed_file(output_dir, f"cell_{cell['cellX']}_{cell['cellZ']}", data, compress))
+            manifest['cells'].append(cell)
+
+    for category, arrays in ordered.items():
+        # Catégories absentes des chunks (Undefined, vides) : conservées en fichier par catégorie
+        if granularity == 'chunk' and category != UNDEFINED_CATEGORY and arrays.count:
+            continue
+        entry = manifest['categories'][category] = {'count': int(arrays.count)}
+        record(entry, write_hashed_file(output_dir, category, {category: arrays.to_objects()}, compress))
+
+    manifest['written'] = written
+    manifest['bytes'] = total_bytes
+    _write_atomic(manifest_path, json.dumps(manifest, separators=(',', ':'), ensure_ascii=False).encode('utf-8'))
+
+    if previous is not None:
+        kept = set(_manifest_files(manifest))
+        for file_name in set(_manifest_files(previous)) - kept:
+            for path in [os.path.join(output_dir, file_name)] + [
+                    os.path.join(output_dir, file_name + extension) for extension in ('.gz', '.br')]:
+                if os.path.exists(path):
+                    os.remove(path)
+
+    return manifest
@@ -0,0 +1,244 @@
+"""
+Découpage spatial des instances en chunks, précalculé hors ligne.
+
+Reprend exactement le regroupement de prepareLoadingQueue (Forest.jsx) :
+chunkX = floor(x / CHUNK_SIZE), chunkZ = floor(z / CHUNK_SIZE) et l'identifiant
+`${objectGroup}_${chunkX}_${chunkZ}`. Les instances de chaque catégorie sont
+réordonnées par chunk pour que chaque chunk soit une plage contiguë.
+
+Le manifeste est en colonnes (tableaux plats, comme quantizedPositions.py) pour
+rester petit devant les données qu'il permet de ne pas charger :
+- 'chunks' : [groupe, chunkX, chunkZ, instanceCount] par chunk (FIELDS_PER_CHUNK),
+  le groupe étant un indice dans 'groups' ; l'identifiant et le centre
+  ((chunkX + 0.5) x chunkSize, 0, (chunkZ + 0.5) x chunkSize) se déduisent ;
+- 'bounds' : [min x/y/z, max x/y/z] des positions de chaque chunk, arrondis vers
+  l'extérieur à BOUNDS_DECIMALS décimales ;
+- 'ranges' : par catégorie, 'chunks' (indices des chunks, dans l'ordre des plages)
+  et 'counts' ; les plages se suivent, la première commence à 0 ; 'tiers' donne
+  le nombre d'instances de chaque niveau de densité, à plat (un bloc par plage).
+"""
+import json
+from typing import Dict, Any, List, Tuple
+
+import numpy as np
+
+from positionArrays import PositionArrays
+
+# LOADING_CONFIG.CHUNK_SIZE dans Forest.jsx
+CHUNK_SIZE = 5
+
+MANIFEST_VERSION = 2
+
+# [groupe, chunkX, chunkZ, instanceCount] par chunk dans manifest['chunks']
+FIELDS_PER_CHUNK = 4
+
+# Décimales des boîtes englobantes du manifeste (arrondies vers l'extérieur)
+BOUNDS_DECIMALS = 3
+
+# templateManager.undefinedCategory : catégorie ignorée par Forest.jsx
+UNDEFINED_CATEGORY = 'Undefined'
+
+# Groupes 'screen' / 'end' déclarés dans TemplateManager.js (prioritaires)
+TEMPLATE_GROUPS = {
+    'Server': 'screen',
+    'Screen': 'screen',
+    'ScreenOld': 'screen',
+    'ScreenEmission': 'screen',
+    'ScreenOldEmission': 'screen',
+}
+
+# OBJECT_TYPE_GROUPS dans Forest.jsx
+OBJECT_TYPE_GROUPS = {
+    'trees': ['TreeNaked', 'TrunkLarge', 'TrunkThin', 'TreeStump'],
+    'bushes': ['Bush', 'BushBlueberry', 'BushRaspberry', 'BushTrunk', 'BushStrawberry'],
+    'plants': ['FlowerBell', 'FlowerClover', 'PlantClematis', 'PlantMiscanthus', 'PlantPuccinellia', 'PlantReed'],
+    'misc': ['BigRock', 'RockWater', 'RockWater2', 'MushroomDuo', 'MushroomSolo'],
+}
+
+
+def object_type_group(category: str) -> str:
+    """
+    Équivalent de getObjectTypeGroup (Forest.jsx).
+    """
+    if category in TEMPLATE_GROUPS:
+        return TEMPLATE_GROUPS[category]
+    for group, categories in OBJECT_TYPE_GROUPS.items():
+        if category in categories:
+            return group
+    return 'default'
+
+
+def chunk_coordinates(arrays: PositionArrays, chunk_size: float = CHUNK_SIZE) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Coordonnées de chunk (Math.floor) de chaque instance.
+    """
+    chunk_x = np.floor(arrays.columns['x'] / chunk_size).astype(np.int64)
+    chunk_z = np.floor(arrays.columns['z'] / chunk_size).astype(np.int64)
+    return chunk_x, chunk_z
+
+
+def chunk_order(arrays: PositionArrays, chunk_size: float = CHUNK_SIZE) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Ordre stable des instances regroupées par chunk.
+
+    Les chunks sont pris dans leur ordre de première apparition, comme le
+    regroupement JS ; l'ordre relatif des instances d'un même chunk est conservé.
+
+    Returns:
+        (order, chunk_keys, counts) : permutation des instances, coordonnées
+        (chunkX, chunkZ) de chaque chunk dans l'ordre et nombre d'instances par chunk
+    """
+    chunk_x, chunk_z = chunk_coordinates(arrays, chunk_size)
+    keys = np.stack([chunk_x, chunk_z], axis=1)
+    unique_keys, first_seen, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+    appearance = np.argsort(first_seen, kind='stable')
+    rank = np.empty(len(unique_keys), dtype=np.int64)
+    rank[appearance] = np.arange(len(unique_keys))
+
+    instance_rank = rank[inverse.reshape(-1)]
+    order = np.argsort(instance_rank, kind='stable')
+    counts = np.bincount(instance_rank, minlength=len(unique_keys))
+    return order, unique_keys[appearance], counts
+
+
+def round_outward(lows: np.ndarray, highs: np.ndarray, decimals: int = BOUNDS_DECIMALS) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Arrondit une boîte vers l'extérieur : elle englobe toujours la boîte d'origine.
+    """
+    step = 10.0 ** decimals
+    return np.floor(lows * step) / step, np.ceil(highs * step) / step
+
+
+def category_ranges(manifest: Dict[str, Any], category: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Plages d'une catégorie du manifeste.
+
+    Returns:
+        (indices des chunks, débuts, nombres d'instances)
+    """
+    ranges = manifest['ranges'][category]
+    counts = np.asarray(ranges['counts'], dtype=np.int64)
+    return np.asarray(ranges['chunks'], dtype=np.int64), np.cumsum(counts) - counts, counts
+
+
+def manifest_chunks(manifest: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Un dictionnaire par chunk (chunkId, objectGroup, chunkX, chunkZ, center,
+    bounds {min, max}, instanceCount, objects {catégorie: {start, count, tiers}}),
+    reconstruit depuis le manifeste en colonnes.
+    """
+    chunk_size = manifest['chunkSize']
+    fields = np.asarray(manifest['chunks'], dtype=np.int64).reshape(-1, FIELDS_PER_CHUNK).tolist()
+    bounds = np.asarray(manifest['bounds'], dtype=np.float64).reshape(-1, 6).tolist()
+    chunks = []
+    for (group, cx, cz, instance_count), box in zip(fields, bounds):
+        object_group = manifest['groups'][group]
+        chunks.append({
+            'chunkId': f"{object_group}_{cx}_{cz}",
+            'objectGroup': object_group,
+            'chunkX': cx,
+            'chunkZ': cz,
+            'center': [(cx + 0.5) * chunk_size, 0.0, (cz + 0.5) * chunk_size],
+            'bounds': {'min': box[:3], 'max': box[3:]},
+            'instanceCount': instance_count,
+            'objects': {},
+        })
+
+    for category, ranges in manifest['ranges'].items():
+        indices, starts, counts = category_ranges(manifest, category)
+        tiers = ranges.get('tiers')
+        levels = len(tiers) // len(indices) if tiers else 0
+        for k, (index, start, count) in enumerate(zip(indices.tolist(), starts.tolist(), counts.tolist())):
+            entry = chunks[index]['objects'][category] = {'start': start, 'count': count}
+            if levels:
+                entry['tiers'] = tiers[k * levels:(k + 1) * levels]
+    return chunks
+
+
+def partition_chunks(categories: Dict[str, PositionArrays],
+                     chunk_size: float = CHUNK_SIZE,
+                     tier_counts: Dict[str, List[int]] = None) -> Tuple[Dict[str, PositionArrays], Dict[str, Any]]:
+    """
+    Réordonne chaque catégorie par chunk et construit le manifeste des chunks.
+
+    Args:
+        categories: Colonnes par catégorie (après filtrage et modifications)
+        chunk_size: Taille d'un chunk en unités de scène
+        tier_counts: Tailles des niveaux de densité par catégorie (objets déjà ordonnés
+            par niveau, voir spatialIndex.density_tiers)
+
+    Returns:
+        (catégories réordonnées, manifeste en colonnes, voir le docstring du module ;
+        manifest_chunks en redonne une entrée par chunk)
+    """
+    ordered = {}
+    groups: List[str] = []
+    chunk_index: Dict[Tuple[str, int, int], int] = {}
+    chunk_fields: List[List[int]] = []
+    lows, highs = [], []
+    ranges: Dict[str, Dict[str, Any]] = {}
+
+    for category, arrays in categories.items():
+        if category == UNDEFINED_CATEGORY or arrays.count == 0:
+            ordered[category] = arrays
+            continue
+
+        group = object_type_group(category)
+        if group not in groups:
+            groups.append(group)
+        tiers = (tier_counts or {}).get(category)
+        # Tri stable : l'ordre des niveaux de densité est conservé dans chaque chunk
+        order, chunk_keys, counts = chunk_order(arrays, chunk_size)
+        arrays = arrays.take(order)
+        ordered[category] = arrays
+
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        positions = np.stack([arrays.columns[field] for field in ('x', 'y', 'z')], axis=1)
+        category_lows = np.minimum.reduceat(positions, starts, axis=0)
+        category_highs = np.maximum.reduceat(positions, starts, axis=0)
+
+        indices = []
+        for k, (cx, cz) in enumerate(chunk_keys.tolist()):
+            key = (group, cx, cz)
+            index = chunk_index.get(key)
+            if index is None:
+                index = chunk_index[key] = len(chunk_fields)
+                chunk_fields.append([groups.index(group), cx, cz, 0])
+                lows.append(category_lows[k])
+                highs.append(category_highs[k])
+            else:
+                lows[index] = np.minimum(lows[index], category_lows[k])
+                highs[index] = np.maximum(highs[index], category_highs[k])
+            chunk_fields[index][3] += int(counts[k])
+            indices.append(index)
+
+        entry = ranges[category] = {'chunks': indices, 'counts': counts.tolist()}
+        if tiers:
+            # Niveau le plus clairsemé contenant chaque instance (dans le nouvel ordre)
+            level = (order[:, None] < np.asarray(tiers[1:], dtype=np.int64)[None, :]).sum(axis=1)
+            # Instances de niveau >= t par plage, une ligne par plage
+            at_least = np.stack([np.add.reduceat((level >= t).astype(np.int64), starts) for t in range(len(tiers))],
+                                axis=1)
+            entry['tiers'] = at_least.reshape(-1).tolist()
+
+    bounds = np.zeros((0, 6))
+    if chunk_fields:
+        low, high = round_outward(np.array(lows), np.array(highs))
+        bounds = np.concatenate([low, high], axis=1)
+
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'chunkSize': chunk_size,
+        'groups': groups,
+        'chunkCount': len(chunk_fields),
+        'chunks': [value for fields in chunk_fields for value in fields],
+        'bounds': bounds.reshape(-1).tolist(),
+        'ranges': ranges,
+    }
+    return ordered, manifest
+
+
+def write_chunk_manifest(output_file: str, manifest: Dict[str, Any]):
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, separators=(',', ':'), ensure_ascii=False)
+
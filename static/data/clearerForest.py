@@ -0,0 +1,414 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, Tuple
+
+import numpy as np
+
+from buildCache import DEFAULT_CACHE_DIR, BuildCache, hash_arrays
+from chunkFiles import write_chunk_files
+from chunkManifest import partition_chunks, write_chunk_manifest
+from clearerPipeline import SELECTION_KEYS, DedupeStage, build_pipeline, config_to_spec
+from clearerProfile import get_profiler, worker_profiling
+from clearerReport import FilterReport, distance_histogram, logger
+from columnStore import StoreCategory, import_json, is_store, open_store
+from duplicateHash import DUPLICATE_TOLERANCE, drop_duplicates
+from instanceBounds import add_chunk_bounds
+from instanceBuffer import LAYOUT_BOUNDS, LAYOUT_MAT4, write_instance_buffer
+from instanceBudget import solve_budgets
+from jsonStream import load_positions
+from overlapCulling import cull_overlaps
+from positionArrays import PositionArrays
+from quantizedPositions import write_quantized
+from shardedDedupe import SHARD_MIN_COUNT, sharded_select
+from spatialIndex import DEFAULT_SEED
+
+# Paramètres appliqués aux catégories absentes de la configuration
+DEFAULT_CONFIG = {
+    'threshold': 0.0,  # Seuil de proximité normalisé (0.0 = aucun filtrage)
+    'scale_factor': 1.0,  # Facteur multiplicateur pour l'échelle (comme clearerRoof)
+    'uniform_scale': None,  # Valeur qui remplace scaleX/Y/Z (comme clearerThinPlane), None = inchangé
+    'rotation_offset': None,  # Rotations à ajouter {'rotationX': ..., 'rotationY': ..., 'rotationZ': ...}
+    'y_offset': 0.0,  # Décalage sur l'axe Y
+    'min_height': None,  # Hauteur minimum en Y (appliquée après le décalage)
+    'tiers': None,  # Niveaux de densité imbriqués, ex: (1.0, 0.5, 0.1) ; None = aucun
+    'budget': None,  # Nombre d'instances visé : le seuil est recherché (threshold sert de plancher)
+    'chunk_budget': None,  # Nombre maximal d'instances par chunk (même recherche du seuil)
+    'duplicate_tolerance': DUPLICATE_TOLERANCE,  # Pas des doublons retirés avant le filtrage (si threshold > 0), None = aucun
+    'selection': 'first',  # 'first' = premier rencontré gagne, 'poisson' = Poisson-disk (ordre tiré avec seed)
+    'seed': DEFAULT_SEED,  # Graine du mode 'poisson' (même sélection d'une exécution à l'autre)
+    'scale_priority': False,  # Mode 'poisson' : les plus grandes instances l'emportent
+}
+
+# Clés qui ne servent qu'au filtrage
+FILTER_KEYS = ('threshold', 'budget', 'chunk_budget', 'duplicate_tolerance') + SELECTION_KEYS
+
+
+def resolve_config(category: str,
+                   category_config: Dict[str, Dict[str, Any]] = None,
+                   default_config: Dict[str, Any] = None) -> Dict[str, Any]:
+    """
+    Fusionne les paramètres par défaut et ceux propres à une catégorie.
+    """
+    config = dict(DEFAULT_CONFIG)
+    config.update(default_config or {})
+    config.update((category_config or {}).get(category, {}))
+    return config
+
+
+def process_category(arrays: PositionArrays,
+                     config: Dict[str, Any],
+                     cache: BuildCache = None,
+                     max_workers: int = 1) -> Tuple[PositionArrays, Dict[str, Any]]:
+    """
+    Filtre puis transforme une catégorie (sans affichage par objet).
+
+    La suppression se base sur les positions ORIGINALES, les modifications sont
+    appliquées APRÈS le filtrage (étapes de clearerPipeline.config_to_spec). Si des niveaux de densité
+    sont demandés, les objets conservés sont réordonnés du niveau le plus
+    clairsemé au plus dense (stats['tiers'] donne la taille de chaque niveau).
+
+    Args:
+        arrays: Colonnes de la catégorie
+        config: Paramètres (voir DEFAULT_CONFIG)
+        cache: Cache des résultats ; seule l'étape dont les paramètres ou l'entrée
+            ont changé est recalculée (stats['cache'] indique ce qui a été réutilisé)
+        max_workers: Processus du filtrage (> 1 : réparti par bandes, voir shardedDedupe.py)
+
+    Returns:
+        (colonnes conservées et modifiées, statistiques)
+    """
+    threshold = config['threshold']
+    duplicate_tolerance = config.get('duplicate_tolerance')
+    selection = {key: config[key] for key in SELECTION_KEYS if key in config}
+    transform_params = {key: value for key, value in config.items() if key not in FILTER_KEYS}
+
+    if cache is not None:
+        filter_key = cache.key('filter', hash_arrays(arrays),
+                               {'threshold': threshold, 'duplicates': duplicate_tolerance, **selection})
+        result_key = cache.key('transform', filter_key, transform_params)
+        cached = cache.get_result(result_key)
+        if cached is not None:
+            kept, stats = cached
+            stats['cache'] = 'complet'
+            return kept, stats
+
+    cached_filter = cache.get_indices(filter_key) if cache is not None else None
+    filter_cached = cached_filter is not None
+
+    duplicates = None
+    if filter_cached:
+        indices, duplicates = cached_filter
+    else:
+        if arrays.count:
+            unique, unique_indices = arrays, None
+            if duplicate_tolerance is not None and threshold > 0:
+                # Doublons retirés en une passe : le filtrage par seuil porte sur moins d'objets
+                # (threshold = 0 conserve tout, doublons compris)
+                with get_profiler().stage('duplicates'):
+                    unique, unique_indices = drop_duplicates(arrays, duplicate_tolerance)
+                duplicates = arrays.count - unique.count
+            with get_profiler().stage('dedupe'):
+                if max_workers > 1:
+                    blocker, _ = sharded_select(unique, threshold, max_workers=max_workers, **selection)
+                else:
+                    blocker, _ = DedupeStage(threshold=threshold, **selection).select(unique)
+            indices = np.flatnonzero(blocker == -1)
+            if unique_indices is not None:
+                indices = unique_indices[indices]
+        else:
+            indices = np.zeros(0, dtype=np.int64)
+
+        if cache is not None:
+            cache.put_indices(filter_key, indices, duplicates or 0)
+
+    # La sélection produit l'unique copie, modifiée en place par les étapes suivantes
+    kept, stats = build_pipeline(config_to_spec(config, include_dedupe=False)).run(arrays.take(indices))
+    stats['original'] = arrays.count
+    stats['removed'] = arrays.count - kept.count
+    if duplicates:
+        stats['duplicates'] = duplicates
+
+    if cache is not None:
+        cache.put_result(result_key, kept, stats)
+        stats['cache'] = 'filtrage' if filter_cached else 'aucun'
+
+    return kept, stats
+
+
+def _process_category_task(task):
+    category, arrays, config, cache_dir, with_histogram, profile_memory, max_workers = task
+    if isinstance(arrays, StoreCategory):
+        # Projection du store rouverte ici : les pages sont partagées au lieu d'être copiées
+        arrays = arrays.open()
+    # Mesures propres à la tâche, renvoyées au parent (profile_memory None = désactivé)
+    with worker_profiling(profile_memory) as profiler:
+        cache = BuildCache(cache_dir) if cache_dir else None
+        kept, stats = process_category(arrays, config, cache, max_workers)
+        histogram = None
+        if with_histogram:
+            # Distances au plus proche voisin sur les positions ORIGINALES (même mesure que le filtrage)
+            with get_profiler().stage('histogram'):
+                dedupe = DedupeStage(threshold=config['threshold'])
+                histogram = distance_histogram(dedupe.nearest(arrays), config['threshold'])
+    profile = profiler.to_dict() if profiler is not None else None
+    return category, kept, stats, histogram, profile
+
+
+def process_forest_file(input_file: str,
+                        output_file: str,
+                        category_config: Dict[str, Dict[str, Any]] = None,
+                        default_config: Dict[str, Any] = None,
+                        max_workers: int = None,
+                        binary_output_file: str = None,
+                        chunk_manifest_file: str = None,
+                        cache_dir: str = None,
+                        report_file: str = None,
+                        quantized_output_file: str = None,
+                        overlap_culling: Dict[str, Any] = None,
+                        instance_budget: int = None,
+                        chunk_files_dir: str = None,
+                        matrix_output_file: str = None,
+                        bounds_output_file: str = None,
+                        store_dir: str = None):
+    """
+    Traite toutes les catégories d'un fichier treePositions.json en une seule passe.
+
+    Les catégories sont indépendantes : elles sont réparties sur un pool de
+    processus pour utiliser tous les cœurs lors d'une reconstruction complète.
+
+    Args:
+        input_file: Fichier JSON d'entrée ({catégorie: [objets, ...], ...}), au schéma plat
+            (treePositions.json) ou imbriqué (templatePositions.json), ou dossier d'un
+            store colonnaire (voir columnStore.py)
+        output_file: Fichier JSON de sortie (même structure et même schéma)
+        category_config: Paramètres par catégorie ({'TreeRoof': {'threshold': 0.02, ...}})
+        default_config: Paramètres pour les catégories non configurées
+        max_workers: Nombre de processus (None = nombre de cœurs, 1 = séquentiel)
+        binary_output_file: Buffer binaire float32 à écrire en plus du JSON (voir instanceBuffer.py)
+        chunk_manifest_file: Manifeste des chunks à écrire ; les instances sont alors
+            réordonnées par chunk dans les sorties (voir chunkManifest.py)
+        cache_dir: Dossier du cache incrémental (None = pas de cache, voir buildCache.py)
+        report_file: Rapport JSON des compteurs et des distances au plus proche voisin
+            par catégorie (None = aucun, voir clearerReport.py)
+        quantized_output_file: Encodage compact quantifié à écrire en plus du JSON
+            (tolérances par défaut, voir quantizedPositions.py)
+        overlap_culling: Paramètres de la suppression des décors masqués par une autre
+            catégorie ({} = valeurs par défaut, None = désactivée, voir overlapCulling.py)
+        instance_budget: Nombre total d'instances visé : un seuil commun est recherché
+            pour les catégories filtrées (None = aucun, voir instanceBudget.py)
+        chunk_files_dir: Dossier où écrire un fichier par cellule de chunks, nommé par le hash de son
+            contenu, et son manifeste (None = aucun, voir chunkFiles.py)
+        matrix_output_file: Buffer binaire des matrices monde 4x4 (layout MAT4 de instanceBuffer.py),
+            directement utilisable comme instanceMatrix côté client
+        bounds_output_file: Buffer binaire des sphères et boîtes englobantes par instance
+            (layout BOUNDS, voir instanceBounds.py) ; le manifeste des chunks reçoit
+            lui aussi 'aabb' et 'spheres' (à plat, dans l'ordre des chunks)
+        store_dir: Store colonnaire du fichier d'entrée : le JSON n'est relu que s'il a
+            changé, les colonnes sont projetées en mémoire (None = lecture du JSON) ; à
+            placer hors de static/, publié tel quel par Vite (publicDir)
+    """
+    profiler = get_profiler()
+    profile_memory = profiler.trace_memory if profiler.enabled else None
+    try:
+        store = input_file if is_store(input_file) else store_dir
+        if store is not None:
+            with profiler.stage('load'):
+                columns = open_store(store) if store == input_file else import_json(input_file, store)
+        else:
+            with profiler.stage('load'):
+                data = load_positions(input_file)
+                profiler.count('bytes_read', os.path.getsize(input_file))
+
+            if not isinstance(data, dict) or not all(isinstance(objects, list) for objects in data.values()):
+                logger.error("Format JSON non reconnu. Attendu: dict {catégorie: liste d'objets}")
+                return
+
+            with profiler.stage('columns'):
+                columns = {category: PositionArrays.from_objects(objects) for category, objects in data.items()}
+
+        configs = {category: resolve_config(category, category_config, default_config) for category in columns}
+
+        with profiler.stage('budget'):
+            budgets = solve_budgets(columns, configs, instance_budget)
+            for category, budget in budgets.items():
+                configs[category]['threshold'] = budget['threshold']
+                if not budget['met']:
+                    logger.warning(f"{category}: budget de {budget['budget'] or budget['chunkBudget']} instances"
+                                   f" impossible à respecter ({budget['kept']} conservées)")
+
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+
+        # Les grandes catégories sont traitées une par une, leur filtrage étant lui-même
+        # réparti sur tous les processus ; les autres sont réparties entre les processus
+        tasks = [(category, StoreCategory(store, category) if store is not None else columns[category],
+                  configs[category], cache_dir, bool(report_file), profile_memory,
+                  max_workers if columns[category].count >= SHARD_MIN_COUNT else 1)
+                 for category in columns]
+        sharded = [task for task in tasks if task[-1] > 1]
+        pooled = [task for task in tasks if task[-1] == 1]
+
+        # Durées des tâches cumulées sur tous les processus (supérieures au temps réel en parallèle)
+        with profiler.stage('categories'):
+            results = [_process_category_task(task) for task in sharded]
+            if max_workers <= 1 or len(pooled) <= 1:
+                results += [_process_category_task(task) for task in pooled]
+            else:
+                with ProcessPoolExecutor(max_workers=min(max_workers, len(pooled))) as executor:
+                    results += list(executor.map(_process_category_task, pooled))
+            order = {category: k for k, category in enumerate(columns)}
+            results.sort(key=lambda result: order[result[0]])
+            for *_, profile in results:
+                if profile is not None:
+                    profiler.merge(profile)
+
+        categories = {category: kept for category, kept, *_ in results}
+        for category, _, stats, *_ in results:
+            if category in budgets:
+                stats['budget'] = budgets[category]
+        if overlap_culling is not None:
+            with profiler.stage('overlap'):
+                keep, overlap = cull_overlaps(categories, **overlap_culling)
+                for category, _, stats, *_ in results:
+                    if category not in keep:
+                        continue
+                    mask = keep[category]
+                    categories[category] = categories[category].take(np.flatnonzero(mask))
+                    # Les niveaux de densité sont des préfixes : leur taille suit les suppressions
+                    if 'tiers' in stats:
+                        stats['tiers'] = [int(mask[:size].sum()) for size in stats['tiers']]
+                    stats['kept'] = categories[category].count
+                    stats['removed'] = stats['original'] - stats['kept']
+                    stats['overlap'] = overlap[category]
+
+        tier_counts = {category: stats['tiers'] for category, _, stats, *_ in results if 'tiers' in stats}
+        if chunk_files_dir:
+            # Avant le réordonnancement par chunk : les niveaux de densité sont encore des préfixes
+            with profiler.stage('chunk_files'):
+                files_manifest = write_chunk_files(chunk_files_dir, categories, tier_counts=tier_counts)
+            profiler.count('bytes_written', files_manifest['bytes'])
+
+        if chunk_manifest_file:
+            with profiler.stage('chunks'):
+                categories, manifest = partition_chunks(categories, tier_counts=tier_counts)
+                add_chunk_bounds(manifest, categories)
+                write_chunk_manifest(chunk_manifest_file, manifest)
+
+        filtered_data = {}
+        report = FilterReport()
+        logger.info(f"\n--- Résumé par catégorie ---")
+        for category, _, stats, histogram, _ in results:
+            report.record(category, stats, histogram)
+            with profiler.stage('objects'):
+                filtered_data[category] = categories[category].to_objects()
+            line = f"{category}: {stats['kept']}/{stats['original']} conservés ({stats['removed']} supprimés)"
+            if stats.get('duplicates'):
+                line += f", dont {stats['duplicates']} doublons"
+            if stats['clamped']:
+                line += f", {stats['clamped']} remontés"
+            if stats.get('overlap', {}).get('culled'):
+                line += (f", dont {stats['overlap']['culled']} masqués"
+                         f" ({stats['overlap']['drawCallsSaved']} appels de dessin économisés)")
+            if 'tiers' in stats:
+                line += f", niveaux {stats['tiers']}"
+            if 'budget' in stats:
+                line += f", seuil {stats['budget']['threshold']:.6g} (budget)"
+            if 'cache' in stats:
+                line += f" [cache: {stats['cache']}]"
+            logger.info(line)
+
+        with profiler.stage('write'):
+            with open(output_file, 'w', encoding='utf-8') as f:
+                json.dump(filtered_data, f, indent=2, ensure_ascii=False)
+            profiler.count('bytes_written', os.path.getsize(output_file))
+
+        if binary_output_file:
+            with profiler.stage('binary'):
+                size = write_instance_buffer(binary_output_file, categories)
+            profiler.count('bytes_written', size)
+            logger.info(f"\nBuffer binaire écrit: {binary_output_file} ({size} octets)")
+
+        if matrix_output_file:
+            with profiler.stage('matrices'):
+                size = write_instance_buffer(matrix_output_file, categories, LAYOUT_MAT4)
+            profiler.count('bytes_written', size)
+            logger.info(f"Matrices écrites: {matrix_output_file} ({size} octets)")
+
+        if bounds_output_file:
+            with profiler.stage('bounds'):
+                size = write_instance_buffer(bounds_output_file, categories, LAYOUT_BOUNDS)
+            profiler.count('bytes_written', size)
+            logger.info(f"Volumes englobants écrits: {bounds_output_file} ({size} octets)")
+
+        if quantized_output_file:
+            with profiler.stage('quantized'):
+                size = write_quantized(quantized_output_file, categories)
+            profiler.count('bytes_written', size)
+            logger.info(f"Encodage quantifié écrit: {quantized_output_file} ({size} octets)")
+
+        if report_file:
+            report.write(report_file)
+
+        totals = report.totals()
+        logger.info(f"\nTraitement terminé:")
+        logger.info(f"Catégories traitées: {len(results)}")
+        logger.info(f"Objets originaux: {totals['original']}")
+        logger.info(f"Objets conservés: {totals['kept']}")
+        logger.info(f"Objets supprimés: {totals['removed']}")
+        if overlap_culling is not None:
+            culled = sum(entry['culled'] for entry in overlap.values())
+            saved = sum(entry['drawCallsSaved'] for entry in overlap.values())
+            logger.info(f"Objets masqués: {culled} ({saved} appels de dessin économisés)")
+        if chunk_manifest_file:
+            logger.info(f"Chunks: {manifest['chunkCount']} (manifeste {chunk_manifest_file})")
+        if chunk_files_dir:
+            logger.info(f"Fichiers par cellule: {len(files_manifest['cells'])} dans {chunk_files_dir}"
+                        f" ({files_manifest['written']} nouveaux)")
+        if report_file:
+            logger.info(f"Rapport écrit: {report_file}")
+
+    except FileNotFoundError:
+        logger.error(f"Fichier {input_file} non trouvé")
+    except json.JSONDecodeError:
+        logger.error(f"Erreur de format JSON dans {input_file}")
+    except Exception as e:
+        logger.error(f"Erreur: {e}")
+
+
+if __name__ == "__main__":
+    # Configuration par catégorie (modifiez ces valeurs selon vos besoins)
+    CATEGORY_CONFIG = {
+        'TreeRoof': {'threshold': 0.02, 'min_height': 5.25},
+        'TrunkThin': {'threshold': 0.001},
+        'BranchTree': {'threshold': 0.001, 'tiers': (1.0, 0.5, 0.1)},
+    }
+    DEFAULT = {'threshold': 0.0}
+    # Nombre total d'instances visé (None = seuils de CATEGORY_CONFIG uniquement) ;
+    # 'budget' / 'chunk_budget' dans CATEGORY_CONFIG fixent un budget par catégorie ;
+    # 'selection': 'poisson' (avec 'seed', 'scale_priority') remplace "premier rencontré gagne"
+    INSTANCE_BUDGET = None
+    # Suppression des décors masqués par les troncs et les feuillages
+    # (None = désactivée, {'min_overlap': 0.9} = valeurs par défaut de overlapCulling.py)
+    OVERLAP_CULLING = None
+    # Store colonnaire du fichier d'entrée, reconstruit quand le JSON change (None = lecture du JSON) ;
+    # hors de static/ (publicDir de Vite) : à côté du cache de construction
+    STORE_DIR = os.path.join(DEFAULT_CACHE_DIR, 'treePositions.store')
+    # Un fichier par cellule de chunks nommé par son hash, pour le cache HTTP (None = désactivé)
+    CHUNK_FILES_DIR = 'output_chunks'
+
+    process_forest_file('treePositions.json',
+                        'output_treePositions.json',
+                        category_config=CATEGORY_CONFIG,
+                        default_config=DEFAULT,
+                        binary_output_file='output_treePositions.bin',
+                        chunk_manifest_file='output_treeChunks.json',
+                        cache_dir=DEFAULT_CACHE_DIR,
+                        report_file='output_treePositions.report.json',
+                        quantized_output_file='output_treePositions.q.json',
+                        overlap_culling=OVERLAP_CULLING,
+                        instance_budget=INSTANCE_BUDGET,
+                        chunk_files_dir=CHUNK_FILES_DIR,
+                        matrix_output_file='output_treeMatrices.bin',
+                        bounds_output_file='output_treeBounds.bin',
+                        store_dir=STORE_DIR)
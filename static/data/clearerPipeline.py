@@ -0,0 +1,581 @@
+"""
+Pipeline déclaratif d'opérations sur les positions.
+
+Un pipeline est une liste d'étapes, par exemple :
+
+    [{'stage': 'dedupe', 'threshold': 0.02},
+     {'stage': 'scale-mul', 'factor': 1.5},
+     {'stage': 'offset', 'y': 3.0},
+     {'stage': 'clamp', 'min_height': 5.25},
+     {'stage': 'chunk', 'size': 5}]
+
+Les étapes élément par élément consécutives (scale-set, scale-mul, rotate, offset,
+clamp) sont fusionnées : elles s'appliquent en place, bloc par bloc, sur l'unique
+copie des données conservées. Ajouter une étape n'ajoute donc pas de copie.
+"""
+import json
+import logging
+import os
+from typing import Dict, Any, List, Tuple, Callable
+
+import numpy as np
+
+from chunkManifest import CHUNK_SIZE, chunk_order
+from clearerProfile import get_profiler
+from clearerReport import FilterReport, distance_histogram, logger
+from duplicateHash import drop_duplicates
+from instanceMatrices import instance_components
+from jsonStream import load_positions
+from positionArrays import PositionArrays, pair_normalized_distances, pair_position_distances, \
+    pair_weighted_distances
+from spatialIndex import MAX_EXPECTED_DISTANCE, DEFAULT_SEED, DEFAULT_TIER_FRACTIONS, SELECTION_MODES, \
+    IncrementalGreedy, ThresholdIndex, density_tiers, greedy_thin, kept_ranks, nearest_distances, priority_order, \
+    search_radius
+
+# Nombre d'éléments traités par bloc par les étapes fusionnées (reste en cache CPU)
+FUSION_BLOCK_SIZE = 1 << 15
+
+# Paramètres de DedupeStage qui choisissent l'ordre de parcours (et non la mesure de distance)
+SELECTION_KEYS = ('selection', 'seed', 'scale_priority')
+
+
+class Stage:
+    """
+    Étape de pipeline. Les étapes de sélection ou de réordonnancement renvoient de
+    nouvelles colonnes ; les étapes élément par élément modifient un bloc en place.
+    """
+    name = ''
+    elementwise = False
+
+    def __init__(self, **params):
+        self.params = params
+
+    def run(self, arrays: PositionArrays, stats: Dict[str, Any]) -> PositionArrays:
+        raise NotImplementedError
+
+    def apply_block(self, block: PositionArrays, stats: Dict[str, Any]):
+        raise NotImplementedError
+
+    def describe(self) -> Dict[str, Any]:
+        return {'stage': self.name, **self.params}
+
+    @property
+    def label(self) -> str:
+        # Nom de l'étape dans le profil (voir clearerProfile)
+        return self.name
+
+
+class DedupeStage(Stage):
+    """
+    Filtrage glouton "premier rencontré gagne" (voir spatialIndex.greedy_thin).
+
+    Paramètres : threshold, use_normalized (True), weighted (False : distance
+    brute incluant rotations et échelles, comme calculate_distance de clearerRoof).
+
+    Ordre de parcours : selection ('first' = ordre du fichier ; 'poisson' = ordre
+    tiré avec seed, d'où un échantillonnage Poisson-disk maximal, sans les amas et
+    les trous qui dépendent de l'ordre d'export) et scale_priority (mode 'poisson' :
+    les plus grandes instances sont examinées d'abord et l'emportent).
+    """
+    name = 'dedupe'
+
+    def _order(self, arrays: PositionArrays):
+        selection = self.params.get('selection', 'first')
+        if selection not in SELECTION_MODES:
+            raise ValueError(f"Mode de sélection inconnu: {selection} (disponibles: {', '.join(SELECTION_MODES)})")
+        if selection == 'first':
+            return None
+        weights = None
+        if self.params.get('scale_priority', False):
+            # Taille d'une instance : sa plus grande échelle (absente = 1, comme Object3D)
+            _, _, scales = instance_components(arrays)
+            weights = np.abs(scales).max(axis=1)
+        return priority_order(arrays.count, self.params.get('seed', DEFAULT_SEED), weights)
+
+    def _pair_distance_func(self, arrays: PositionArrays) -> Callable[[np.ndarray, np.ndarray], np.ndarray]:
+        if self.params.get('use_normalized', True):
+            def pair_distance_func(i, j):
+                return pair_normalized_distances(arrays, i, j, MAX_EXPECTED_DISTANCE)
+        elif self.params.get('weighted', False):
+            def pair_distance_func(i, j):
+                return pair_weighted_distances(arrays, i, j)
+        else:
+            def pair_distance_func(i, j):
+                return pair_position_distances(arrays, i, j)
+
+        profiler = get_profiler()
+        if not profiler.enabled:
+            return pair_distance_func
+
+        def counted_distance_func(i, j):
+            profiler.count('distance_evaluations', len(i))
+            return pair_distance_func(i, j)
+        return counted_distance_func
+
+    def _radius(self) -> float:
+        return search_radius(self.params['threshold'], self.params.get('use_normalized', True))
+
+    def select(self, arrays: PositionArrays) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns:
+            (blocker, blocker_distance), voir spatialIndex.greedy_from_pairs
+        """
+        return greedy_thin(arrays.count, arrays.columns['x'], arrays.columns['z'],
+                           self.params['threshold'], self._pair_distance_func(arrays), self._radius(),
+                           order=self._order(arrays))
+
+    def nearest(self, arrays: PositionArrays) -> np.ndarray:
+        """
+        Distance (même mesure que le filtrage) de chaque objet à son plus proche
+        voisin, inf au-delà du rayon de recherche (voir spatialIndex.nearest_distances).
+        """
+        return nearest_distances(arrays.count, arrays.columns['x'], arrays.columns['z'],
+                                 self._pair_distance_func(arrays), self._radius())
+
+    def index(self, arrays: PositionArrays) -> ThresholdIndex:
+        """
+        Index réutilisable pour essayer tous les seuils jusqu'à threshold
+        (voir spatialIndex.ThresholdIndex et instanceBudget.py).
+        """
+        return ThresholdIndex(arrays.count, arrays.columns['x'], arrays.columns['z'],
+                              self._pair_distance_func(arrays), self.params['threshold'], self._radius(),
+                              order=self._order(arrays))
+
+    def incremental(self, arrays: PositionArrays, active: np.ndarray = None) -> IncrementalGreedy:
+        """
+        Décisions mises à jour objet par objet quand l'export change (voir
+        spatialIndex.IncrementalGreedy et watchMode.py) ; mode 'first' uniquement.
+
+        Args:
+            active: Objets soumis au filtrage (None = tous)
+
+        Raises:
+            ValueError: mode de sélection autre que 'first' (l'ordre tiré dépend du nombre d'objets)
+        """
+        if self._order(arrays) is not None:
+            raise ValueError("Le filtrage incrémental n'existe qu'en mode de sélection 'first'")
+        return IncrementalGreedy(arrays.columns['x'], arrays.columns['z'], self._pair_distance_func(arrays),
+                                 self.params['threshold'], self._radius(), active)
+
+    def update(self,
+               greedy: IncrementalGreedy,
+               arrays: PositionArrays,
+               changed: np.ndarray,
+               active: np.ndarray = None) -> int:
+        """
+        Met à jour greedy (voir incremental) pour les nouvelles colonnes (même nombre d'objets).
+
+        Returns:
+            Nombre d'objets réévalués
+        """
+        return greedy.update(arrays.columns['x'], arrays.columns['z'], self._pair_distance_func(arrays),
+                             changed, active)
+
+    def run(self, arrays: PositionArrays, stats: Dict[str, Any]) -> PositionArrays:
+        if arrays.count == 0:
+            return arrays
+        blocker, _ = self.select(arrays)
+        kept = arrays.take(np.flatnonzero(blocker == -1))
+        stats['removed'] = stats.get('removed', 0) + arrays.count - kept.count
+        return kept
+
+
+class ScaleSetStage(Stage):
+    """
+    Remplace scaleX/Y/Z par une valeur uniforme. Paramètre : value.
+    """
+    name = 'scale-set'
+    elementwise = True
+
+    def apply_block(self, block, stats):
+        block.set_scale(self.params['value'])
+
+
+class ScaleMulStage(Stage):
+    """
+    Multiplie scaleX/Y/Z. Paramètre : factor.
+    """
+    name = 'scale-mul'
+    elementwise = True
+
+    def apply_block(self, block, stats):
+        block.multiply_scale(self.params['factor'])
+
+
+class RotateStage(Stage):
+    """
+    Ajoute des rotations. Paramètres : rotationX, rotationY, rotationZ.
+    """
+    name = 'rotate'
+    elementwise = True
+
+    def apply_block(self, block, stats):
+        block.add_rotation(self.params)
+
+
+class OffsetStage(Stage):
+    """
+    Décale les positions. Paramètres : x, y, z.
+    """
+    name = 'offset'
+    elementwise = True
+
+    def apply_block(self, block, stats):
+        block.offset_position(self.params)
+
+
+class ClampStage(Stage):
+    """
+    Remonte à min_height les objets plus bas. Paramètre : min_height.
+    """
+    name = 'clamp'
+    elementwise = True
+
+    def apply_block(self, block, stats):
+        clamped = block.clamp_min_height(self.params['min_height'])
+        stats['clamped'] = stats.get('clamped', 0) + int(clamped.sum())
+
+
+class ChunkStage(Stage):
+    """
+    Regroupe les instances par chunk (ordre stable, voir chunkManifest.chunk_order).
+    Paramètre : size (LOADING_CONFIG.CHUNK_SIZE par défaut).
+    """
+    name = 'chunk'
+
+    def run(self, arrays: PositionArrays, stats: Dict[str, Any]) -> PositionArrays:
+        if arrays.count == 0:
+            return arrays
+        order, chunk_keys, _ = chunk_order(arrays, self.params.get('size', CHUNK_SIZE))
+        stats['chunks'] = len(chunk_keys)
+        return arrays.take(order)
+
+
+class TiersStage(Stage):
+    """
+    Ordonne les instances par niveaux de densité imbriqués (voir spatialIndex.density_tiers).
+    Paramètre : fractions.
+    """
+    name = 'tiers'
+
+    def run(self, arrays: PositionArrays, stats: Dict[str, Any]) -> PositionArrays:
+        if arrays.count == 0:
+            return arrays
+        order, stats['tiers'] = density_tiers(arrays.columns['x'], arrays.columns['y'], arrays.columns['z'],
+                                              self.params.get('fractions', DEFAULT_TIER_FRACTIONS))
+        return arrays.take(order)
+
+
+STAGES = {stage.name: stage for stage in (DedupeStage, ScaleSetStage, ScaleMulStage, RotateStage,
+                                          OffsetStage, ClampStage, ChunkStage, TiersStage)}
+
+
+class FusedStage(Stage):
+    """
+    Suite d'étapes élément par élément appliquées en une passe, bloc par bloc.
+    """
+    name = 'fused'
+
+    def __init__(self, stages: List[Stage]):
+        super().__init__()
+        self.stages = stages
+
+    def run(self, arrays: PositionArrays, stats: Dict[str, Any]) -> PositionArrays:
+        for start in range(0, arrays.count, FUSION_BLOCK_SIZE):
+            # Vue sur les colonnes : aucune copie, les étapes écrivent en place
+            block = arrays.block(start, start + FUSION_BLOCK_SIZE)
+            for stage in self.stages:
+                stage.apply_block(block, stats)
+        return arrays
+
+    def describe(self) -> Dict[str, Any]:
+        return {'stage': self.name, 'stages': [stage.describe() for stage in self.stages]}
+
+    @property
+    def label(self) -> str:
+        return '+'.join(stage.name for stage in self.stages)
+
+
+class Pipeline:
+    """
+    Pipeline compilé : étapes élément par élément consécutives fusionnées.
+    """
+
+    def __init__(self, stages: List[Stage]):
+        self.stages = []
+        for stage in stages:
+            if stage.elementwise and self.stages and isinstance(self.stages[-1], FusedStage):
+                self.stages[-1].stages.append(stage)
+            elif stage.elementwise:
+                self.stages.append(FusedStage([stage]))
+            else:
+                self.stages.append(stage)
+
+    def run(self, arrays: PositionArrays) -> Tuple[PositionArrays, Dict[str, Any]]:
+        """
+        Exécute le pipeline ; les colonnes d'entrée ne sont jamais modifiées.
+
+        Returns:
+            (colonnes résultantes, statistiques : original, kept, removed, clamped, ...)
+        """
+        stats = {'original': arrays.count, 'removed': 0, 'clamped': 0}
+        owned = False
+        profiler = get_profiler()
+
+        for stage in self.stages:
+            with profiler.stage(stage.label):
+                if isinstance(stage, FusedStage) and not owned:
+                    # Première écriture en place avant toute sélection : une seule copie
+                    arrays = arrays.take(np.arange(arrays.count))
+                arrays = stage.run(arrays, stats)
+            owned = True
+
+        stats['kept'] = arrays.count
+        return arrays, stats
+
+    def describe(self) -> List[Dict[str, Any]]:
+        return [stage.describe() for stage in self.stages]
+
+
+def build_pipeline(spec: List[Dict[str, Any]]) -> Pipeline:
+    """
+    Construit un pipeline depuis sa description déclarative.
+
+    Args:
+        spec: Liste d'étapes {'stage': nom, ...paramètres} (voir STAGES)
+    """
+    stages = []
+    for step in spec:
+        params = dict(step)
+        name = params.pop('stage')
+        if name not in STAGES:
+            raise ValueError(f"Étape inconnue: {name} (disponibles: {', '.join(STAGES)})")
+        stages.append(STAGES[name](**params))
+    return Pipeline(stages)
+
+
+def config_to_spec(config: Dict[str, Any], include_dedupe: bool = True) -> List[Dict[str, Any]]:
+    """
+    Traduit une configuration de catégorie (clearerForest.DEFAULT_CONFIG) en étapes.
+
+    Ordre : dedupe, scale-set, scale-mul, rotate, offset, clamp, tiers.
+    """
+    spec = []
+    if include_dedupe:
+        spec.append({'stage': 'dedupe', 'threshold': config['threshold'],
+                     **{key: config[key] for key in SELECTION_KEYS if key in config}})
+    if config.get('uniform_scale') is not None:
+        spec.append({'stage': 'scale-set', 'value': config['uniform_scale']})
+    if config.get('scale_factor', 1.0) != 1.0:
+        spec.append({'stage': 'scale-mul', 'factor': config['scale_factor']})
+    if config.get('rotation_offset'):
+        spec.append({'stage': 'rotate', **config['rotation_offset']})
+    if config.get('y_offset', 0.0) != 0.0:
+        spec.append({'stage': 'offset', 'y': config['y_offset']})
+    if config.get('min_height') is not None:
+        spec.append({'stage': 'clamp', 'min_height': config['min_height']})
+    if config.get('tiers'):
+        spec.append({'stage': 'tiers', 'fractions': list(config['tiers'])})
+    return spec
+
+
+def describe_modifications(spec: List[Dict[str, Any]]) -> List[str]:
+    """
+    Description lisible des étapes de transformation (journal de filter_objects).
+    """
+    modifications = []
+    for step in spec:
+        if step['stage'] == 'scale-set':
+            modifications.append(f"échelle: ={step['value']}")
+        elif step['stage'] == 'scale-mul':
+            modifications.append(f"échelle: x{step['factor']}")
+        elif step['stage'] == 'rotate':
+            changes = [f"{key}: +{value}" for key, value in step.items() if key != 'stage' and value != 0.0]
+            if changes:
+                modifications.append(f"rotation: {', '.join(changes)}")
+        elif step['stage'] == 'offset':
+            modifications.extend(f"{axis.upper()}: +{step[axis]}" for axis in ('x', 'y', 'z') if axis in step)
+        elif step['stage'] == 'clamp':
+            modifications.append(f"hauteur min: {step['min_height']}")
+    return modifications
+
+
+def filter_objects(objects: List[Dict[str, Any]],
+                   threshold: float,
+                   transform_spec: List[Dict[str, Any]],
+                   use_normalized: bool = True,
+                   weighted: bool = False,
+                   report: FilterReport = None,
+                   budget: int = None,
+                   selection: str = 'first',
+                   seed: int = DEFAULT_SEED,
+                   scale_priority: bool = False,
+                   duplicate_tolerance: float = None) -> List[Dict[str, Any]]:
+    """
+    Filtre une liste d'objets JSON puis transforme les objets conservés.
+    Partagé par clearerRoof et clearerThinPlane (remove_close_objects).
+
+    La suppression se base sur les positions ORIGINALES (DedupeStage), les
+    étapes de transform_spec sont appliquées APRÈS le filtrage, dans leur ordre.
+
+    Args:
+        objects: Liste des objets JSON
+        threshold: Seuil de proximité
+        transform_spec: Étapes appliquées aux objets conservés (voir build_pipeline)
+        use_normalized, weighted: Mesure de distance (voir DedupeStage)
+        report: Rapport complété avec les compteurs et l'histogramme des distances
+            au plus proche voisin (le détail par objet est journalisé au niveau DEBUG)
+        budget: Nombre d'objets visé : le seuil est recherché, threshold servant de
+            plancher (None = threshold seul, voir instanceBudget.py)
+        selection, seed, scale_priority: Ordre de parcours du filtrage (voir DedupeStage)
+        duplicate_tolerance: Pas des doublons retirés en une passe avant le filtrage
+            (si threshold > 0, comme clearerForest.process_category), None = aucun
+
+    Returns:
+        Liste filtrée des objets avec propriétés modifiées
+    """
+    if not objects:
+        return objects
+
+    profiler = get_profiler()
+    selection_params = {'selection': selection, 'seed': seed, 'scale_priority': scale_priority}
+
+    # ÉTAPE 1: Filtrage basé sur les positions ORIGINALES (colonnes NumPy)
+    with profiler.stage('columns'):
+        arrays = PositionArrays.from_objects(objects)
+
+    if budget is not None:
+        # instanceBudget dépend de DedupeStage : import au moment de l'appel
+        from instanceBudget import BudgetSearch, category_threshold
+        with profiler.stage('budget'):
+            search = BudgetSearch(arrays, floor=threshold, use_normalized=use_normalized, weighted=weighted,
+                                  **selection_params)
+            threshold = category_threshold(search, budget)['threshold']
+        logger.info(f"Seuil retenu pour un budget de {budget} objets: {threshold:.6g}")
+
+    unique, unique_indices = arrays, None
+    if duplicate_tolerance is not None and threshold > 0:
+        # Doublons retirés en une passe : le filtrage par seuil porte sur moins d'objets
+        # (threshold = 0 conserve tout, doublons compris)
+        with profiler.stage('duplicates'):
+            unique, unique_indices = drop_duplicates(arrays, duplicate_tolerance)
+    duplicates = arrays.count - unique.count
+
+    # Seules les paires du voisinage (grille spatiale) sont évaluées, par lots
+    dedupe = DedupeStage(threshold=threshold, use_normalized=use_normalized, weighted=weighted, **selection_params)
+    with profiler.stage('dedupe'):
+        blocker, blocker_distance = dedupe.select(unique)
+    verbose = logger.isEnabledFor(logging.DEBUG)
+
+    if verbose:
+        ranks = kept_ranks(blocker)
+        # Position de chaque objet parmi les objets sans doublon (-1 = doublon retiré)
+        unique_position = np.arange(arrays.count)
+        if unique_indices is not None:
+            unique_position = np.full(arrays.count, -1, dtype=np.int64)
+            unique_position[unique_indices] = np.arange(unique.count)
+        blockers, distances = blocker.tolist(), blocker_distance.tolist()
+        for i, position in enumerate(unique_position.tolist()):
+            if position == -1:
+                logger.debug(f"Objet {i} supprimé (doublon d'un objet précédent)")
+            elif blockers[position] == -1:
+                logger.debug(f"Objet {i} conservé (distance OK)")
+            else:
+                # L'objet est trop proche d'un objet déjà accepté
+                logger.debug(
+                    f"Objet {i} supprimé car trop proche de l'objet conservé #{ranks[blockers[position]]} (distance {distances[position]:.6f} < seuil {threshold})")
+
+    with profiler.stage('select'):
+        indices = np.flatnonzero(blocker == -1)
+        if unique_indices is not None:
+            indices = unique_indices[indices]
+        kept = arrays.take(indices)
+
+    # ÉTAPE 2: Appliquer les modifications APRÈS le filtrage (étapes fusionnées, en place)
+    kept, stats = build_pipeline(transform_spec).run(kept)
+
+    if verbose:
+        modifications = describe_modifications(transform_spec)
+        if modifications:
+            for i in range(kept.count):
+                logger.debug(f"Objet conservé #{i} modifié ({', '.join(modifications)})")
+
+    with profiler.stage('objects'):
+        final_objects = kept.to_objects()
+
+    clamps = any(step['stage'] == 'clamp' for step in transform_spec)
+    if report is not None:
+        counts = {'original': len(objects), 'kept': len(final_objects), 'removed': len(objects) - len(final_objects)}
+        if clamps:
+            counts['clamped'] = stats['clamped']
+        if duplicates:
+            counts['duplicates'] = duplicates
+        report.record('objects', counts, distance_histogram(dedupe.nearest(arrays), threshold))
+
+    logger.info(f"\n--- Résumé du filtrage ---")
+    logger.info(f"Objets originaux: {len(objects)}")
+    logger.info(f"Objets après filtrage: {len(final_objects)}")
+    logger.info(f"Objets supprimés: {len(objects) - len(final_objects)}")
+    if duplicates:
+        logger.info(f"Doublons retirés: {duplicates}")
+    if clamps:
+        logger.info(f"Objets remontés: {stats['clamped']}")
+
+    return final_objects
+
+
+def process_json_document(input_file: str,
+                          output_file: str,
+                          process_objects: Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]]) -> Tuple[int, int]:
+    """
+    Lit un fichier JSON (liste d'objets, dict avec clé 'objects' ou tableaux par
+    catégorie), traite ses objets et écrit le résultat. Partagé par clearerRoof et
+    clearerThinPlane. Un export abîmé est récupéré par jsonStream.load_positions.
+
+    Returns:
+        (nombre d'objets originaux, nombre d'objets conservés), ou None en cas d'erreur
+    """
+    profiler = get_profiler()
+    try:
+        with profiler.stage('load'):
+            data = load_positions(input_file)
+            profiler.count('bytes_read', os.path.getsize(input_file))
+
+        with profiler.stage('process'):
+            # Si c'est une liste directe d'objets
+            if isinstance(data, list):
+                objects = data
+                filtered_data = process_objects(data)
+                filtered_objects = filtered_data
+
+            # Si les objets sont dans une clé spécifique
+            elif isinstance(data, dict) and 'objects' in data:
+                objects = data['objects']
+                filtered_data = data.copy()
+                filtered_data['objects'] = filtered_objects = process_objects(data['objects'])
+
+            # Tableaux par catégorie (ex: export récupéré) : chaque liste est traitée séparément
+            elif isinstance(data, dict) and data and all(isinstance(value, list) for value in data.values()):
+                objects = [obj for category_objects in data.values() for obj in category_objects]
+                filtered_data = {category: process_objects(category_objects)
+                                 for category, category_objects in data.items()}
+                filtered_objects = [obj for category_objects in filtered_data.values() for obj in category_objects]
+
+            else:
+                logger.error("Format JSON non reconnu. Attendu: liste d'objets ou dict avec clé 'objects'")
+                return None
+
+        with profiler.stage('write'):
+            with open(output_file, 'w', encoding='utf-8') as f:
+                json.dump(filtered_data, f, indent=2, ensure_ascii=False)
+            profiler.count('bytes_written', os.path.getsize(output_file))
+
+        return len(objects), len(filtered_objects)
+
+    except FileNotFoundError:
+        logger.error(f"Fichier {input_file} non trouvé")
+    except json.JSONDecodeError:
+        logger.error(f"Erreur de format JSON dans {input_file}")
+    except Exception as e:
+        logger.error(f"Erreur: {e}")
+    return None
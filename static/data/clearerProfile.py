@@ -0,0 +1,272 @@
+"""
+Instrumentation des traitements : durée, appels, pic mémoire et compteurs par étape.
+
+Désactivée par défaut : les points d'instrumentation renvoient alors un contexte
+vide. Elle s'active sans modifier les scripts avec la variable d'environnement
+CLEARER_PROFILE (le résumé est journalisé en fin d'exécution) :
+
+    CLEARER_PROFILE=1 python clearerForest.py
+    CLEARER_PROFILE=cprofile,tracemalloc CLEARER_PROFILE_OUTPUT=profile.json python clearerRoof.py
+
+ou depuis du code avec `with profiling(...):`. Les étapes imbriquées sont
+nommées par leur chemin ('process/dedupe'). Compteurs : distance_evaluations,
+bytes_read, bytes_written.
+"""
+import atexit
+import cProfile
+import json
+import multiprocessing
+import os
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Any, List
+
+from clearerReport import logger
+
+PROFILE_VERSION = 1
+
+# Nombre de fonctions les plus coûteuses (temps cumulé) conservées du profil cProfile
+CPROFILE_TOP = 20
+
+
+class Profiler:
+    """
+    Chronométrage des étapes et compteurs d'un traitement.
+
+    Args:
+        cprofile: Profil cProfile complet pendant que le profileur est démarré
+        trace_memory: Pic mémoire de chaque étape (tracemalloc, ralentit le traitement)
+    """
+    enabled = True
+
+    def __init__(self, cprofile: bool = False, trace_memory: bool = False):
+        self.cprofile = cProfile.Profile() if cprofile else None
+        self.trace_memory = trace_memory
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self.counters: Dict[str, int] = {}
+        self._stack: List[Dict[str, Any]] = []
+        self._owns_tracemalloc = False
+
+    def start(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._owns_tracemalloc = True
+        if self.cprofile is not None:
+            self.cprofile.enable()
+
+    def stop(self):
+        if self.cprofile is not None:
+            self.cprofile.disable()
+        if self._owns_tracemalloc:
+            tracemalloc.stop()
+            self._owns_tracemalloc = False
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Chronomètre une étape (cumulé si elle est exécutée plusieurs fois).
+        """
+        path = '/'.join([frame['name'] for frame in self._stack] + [name])
+        # Créée à l'entrée : une étape est listée avant ses sous-étapes
+        entry = self.stages.setdefault(path, {'calls': 0, 'seconds': 0.0})
+        memory = self.trace_memory and tracemalloc.is_tracing()
+        if memory:
+            # reset_peak efface le pic de l'étape englobante : il est reporté sur son cadre
+            base, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                parent = self._stack[-1]
+                parent['peak'] = max(parent['peak'], peak)
+            tracemalloc.reset_peak()
+        frame = {'name': name, 'peak': 0}
+        self._stack.append(frame)
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            seconds = time.perf_counter() - start
+            self._stack.pop()
+            entry['calls'] += 1
+            entry['seconds'] += seconds
+            if memory:
+                peak = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+                entry['peakBytes'] = max(entry.get('peakBytes', 0), peak - base)
+                if self._stack:
+                    self._stack[-1]['peak'] = max(self._stack[-1]['peak'], peak)
+
+    def count(self, name: str, value: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + int(value)
+
+    def merge(self, data: Dict[str, Any], prefix: str = None):
+        """
+        Ajoute les mesures d'un autre profileur (to_dict), par exemple d'un processus
+        du pool ; ses étapes sont placées sous prefix (par défaut l'étape courante).
+        """
+        if prefix is None:
+            prefix = '/'.join(frame['name'] for frame in self._stack)
+        for path, other in data['stages'].items():
+            entry = self.stages.setdefault(f'{prefix}/{path}' if prefix else path, {'calls': 0, 'seconds': 0.0})
+            entry['calls'] += other['calls']
+            entry['seconds'] += other['seconds']
+            if 'peakBytes' in other:
+                entry['peakBytes'] = max(entry.get('peakBytes', 0), other['peakBytes'])
+        for name, value in data['counters'].items():
+            self.count(name, value)
+
+    def cprofile_top(self, limit: int = CPROFILE_TOP) -> List[Dict[str, Any]]:
+        """
+        Fonctions les plus coûteuses en temps cumulé (profil cProfile).
+        """
+        if self.cprofile is None:
+            return []
+        stats = pstats.Stats(self.cprofile)
+        rows = []
+        for (filename, line, function), (_, calls, total, cumulative, _) in stats.stats.items():
+            rows.append({'function': f'{os.path.basename(filename)}:{line}({function})',
+                         'calls': calls, 'totalSeconds': total, 'cumulativeSeconds': cumulative})
+        rows.sort(key=lambda row: row['cumulativeSeconds'], reverse=True)
+        return rows[:limit]
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {'version': PROFILE_VERSION, 'stages': self.stages, 'counters': self.counters}
+        if self.cprofile is not None:
+            data['cprofile'] = self.cprofile_top()
+        return data
+
+    def summary(self) -> str:
+        """
+        Tableau des étapes (durée, appels, pic mémoire), des compteurs et du profil cProfile.
+        """
+        width = max([len(path) for path in self.stages] + [len('étape')])
+        lines = [f"{'étape':<{width}} {'durée':>10} {'appels':>7} {'pic Mo':>8}"]
+        for path, entry in self.stages.items():
+            peak = f"{entry['peakBytes'] / 1e6:8.1f}" if 'peakBytes' in entry else f"{'-':>8}"
+            lines.append(f"{path:<{width}} {entry['seconds']:>9.3f}s {entry['calls']:>7} {peak}")
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"{name}: {value}")
+        if self.cprofile is not None:
+            lines.append(f"\ncProfile (temps cumulé, {CPROFILE_TOP} premières fonctions) :")
+        for row in self.cprofile_top():
+            lines.append(f"{row['cumulativeSeconds']:>9.3f}s {row['calls']:>9} {row['function']}")
+        return '\n'.join(lines)
+
+    def write(self, output_file: str):
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=2, sort_keys=True)
+
+
+class _NullProfiler:
+    """
+    Profileur inactif (par défaut) : aucune mesure, coût négligeable.
+    """
+    enabled = False
+    trace_memory = False
+
+    def stage(self, name: str):
+        return nullcontext(self)
+
+    def count(self, name: str, value: int = 1):
+        pass
+
+    def merge(self, data: Dict[str, Any], prefix: str = None):
+        pass
+
+
+NULL_PROFILER = _NullProfiler()
+
+_active = NULL_PROFILER
+
+
+def get_profiler():
+    """
+    Profileur courant (NULL_PROFILER si l'instrumentation est désactivée).
+    """
+    return _active
+
+
+def set_profiler(profiler):
+    """
+    Remplace le profileur courant et renvoie le précédent.
+    """
+    global _active
+    previous = _active
+    _active = profiler
+    return previous
+
+
+def report_profile(profiler: Profiler, output_file: str = None):
+    logger.info(f"\n--- Profil ---\n{profiler.summary()}")
+    if output_file:
+        profiler.write(output_file)
+        logger.info(f"Profil écrit: {output_file}")
+
+
+@contextmanager
+def profiling(cprofile: bool = False, trace_memory: bool = False, output_file: str = None, report: bool = True):
+    """
+    Active l'instrumentation le temps d'un bloc, puis journalise le résumé.
+
+    Args:
+        cprofile: Ajoute le profil cProfile des fonctions les plus coûteuses
+        trace_memory: Mesure le pic mémoire de chaque étape (tracemalloc)
+        output_file: Fichier JSON du profil (None = aucun)
+        report: Journalise le tableau récapitulatif à la sortie du bloc
+    """
+    profiler = Profiler(cprofile, trace_memory)
+    previous = set_profiler(profiler)
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        set_profiler(previous)
+        if report:
+            report_profile(profiler, output_file)
+
+
+@contextmanager
+def worker_profiling(trace_memory: bool = None):
+    """
+    Profileur local d'une tâche exécutée dans un processus du pool (ou en séquentiel) :
+    ses mesures sont renvoyées avec le résultat puis fusionnées par le parent (merge).
+
+    Args:
+        trace_memory: None si l'instrumentation est désactivée chez le parent
+    """
+    if trace_memory is None:
+        previous = set_profiler(NULL_PROFILER)
+        try:
+            yield None
+        finally:
+            set_profiler(previous)
+        return
+
+    profiler = Profiler(trace_memory=trace_memory)
+    previous = set_profiler(profiler)
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        set_profiler(previous)
+
+
+def _enable_from_environment():
+    options = {option.strip().lower() for option in os.environ.get('CLEARER_PROFILE', '').split(',')} - {'', '0'}
+    # Les processus du pool sont instrumentés par leur parent (worker_profiling)
+    if not options or multiprocessing.parent_process() is not None:
+        return
+
+    profiler = Profiler(cprofile='cprofile' in options, trace_memory='tracemalloc' in options)
+    set_profiler(profiler)
+    profiler.start()
+
+    def finish():
+        profiler.stop()
+        report_profile(profiler, os.environ.get('CLEARER_PROFILE_OUTPUT'))
+
+    atexit.register(finish)
+
+
+_enable_from_environment()
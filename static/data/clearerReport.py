@@ -0,0 +1,114 @@
+"""
+Journalisation et rapport des traitements de positions.
+
+Les scripts écrivent via le logger 'clearer' : le résumé au niveau INFO, le détail
+par objet (conservé, supprimé, remonté, modifié) au niveau DEBUG, qui n'est même
+pas formaté quand il est désactivé. Le niveau se règle avec configure_logging ou
+la variable d'environnement CLEARER_LOG_LEVEL (DEBUG retrouve l'ancien affichage
+complet, WARNING rend les traitements silencieux).
+
+FilterReport agrège les compteurs (original, kept, removed, clamped) et
+l'histogramme des distances au plus proche voisin par catégorie, et s'écrit en
+JSON trié pour pouvoir être comparé d'une exécution à l'autre.
+"""
+import json
+import logging
+import os
+import sys
+from typing import Dict, Any
+
+import numpy as np
+
+LOGGER_NAME = 'clearer'
+
+# Niveau utilisé si configure_logging n'est pas appelé explicitement
+DEFAULT_LOG_LEVEL = os.environ.get('CLEARER_LOG_LEVEL', 'INFO')
+
+REPORT_VERSION = 1
+
+# Nombre de classes de l'histogramme des distances entre 0 et le seuil
+HISTOGRAM_BINS = 10
+
+COUNTERS = ('original', 'kept', 'removed', 'clamped')
+
+logger = logging.getLogger(LOGGER_NAME)
+
+
+class _StdoutHandler(logging.StreamHandler):
+    # sys.stdout est relu à chaque message (compatible avec contextlib.redirect_stdout)
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+def configure_logging(level=DEFAULT_LOG_LEVEL):
+    """
+    Affiche les messages du logger 'clearer' sur la sortie standard, sans préfixe.
+
+    Args:
+        level: Niveau ('DEBUG', 'INFO', 'WARNING', ...) ou constante logging
+    """
+    if not logger.handlers:
+        handler = _StdoutHandler()
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.propagate = False
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+
+
+configure_logging()
+
+
+def distance_histogram(distances: np.ndarray, threshold: float, bins: int = HISTOGRAM_BINS) -> Dict[str, Any]:
+    """
+    Histogramme des distances au plus proche voisin, en classes régulières sur [0, seuil[.
+
+    Returns:
+        {'edges': bornes des classes, 'counts': effectifs, 'beyond': nombre d'objets
+        dont le plus proche voisin est au-delà du seuil (ou inexistant)}
+    """
+    distances = np.asarray(distances, dtype=np.float64)
+    if threshold <= 0:
+        return {'edges': [], 'counts': [], 'beyond': int(len(distances))}
+
+    edges = np.linspace(0.0, threshold, bins + 1)
+    below = distances < threshold
+    counts, _ = np.histogram(distances[below], bins=edges)
+    return {'edges': edges.tolist(), 'counts': counts.tolist(), 'beyond': int((~below).sum())}
+
+
+class FilterReport:
+    """
+    Compteurs agrégés par catégorie, exportables en JSON.
+    """
+
+    def __init__(self):
+        self.categories: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, category: str, stats: Dict[str, Any], histogram: Dict[str, Any] = None):
+        """
+        Ajoute les compteurs d'une catégorie (les valeurs s'additionnent si elle est
+        enregistrée plusieurs fois).
+        """
+        entry = self.categories.setdefault(category, {counter: 0 for counter in COUNTERS})
+        for counter in COUNTERS:
+            entry[counter] += int(stats.get(counter, 0))
+        for key in ('tiers', 'chunks', 'cache', 'overlap', 'budget', 'duplicates'):
+            if key in stats:
+                entry[key] = stats[key]
+        if histogram is not None:
+            entry['nearestNeighbour'] = histogram
+
+    def totals(self) -> Dict[str, int]:
+        return {counter: sum(entry[counter] for entry in self.categories.values()) for counter in COUNTERS}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'version': REPORT_VERSION, 'totals': self.totals(), 'categories': self.categories}
+
+    def write(self, output_file: str):
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=2, sort_keys=True, ensure_ascii=False)
@@ -1,7 +1,13 @@
-import json
 import math
 from typing import List, Dict, Any
 
+from clearerPipeline import config_to_spec, filter_objects, process_json_document
+from clearerReport import FilterReport, configure_logging, logger
+from spatialIndex import DEFAULT_SEED, MAX_EXPECTED_DISTANCE
+
+# Distance brute de remove_close_objects quand use_normalized est False : calculate_distance (rotations et échelles)
+WEIGHTED_DISTANCE = True
+
 
 def calculate_distance(obj1: Dict[str, float], obj2: Dict[str, float]) -> float:
     """
@@ -53,52 +59,20 @@ def calculate_normalized_distance(obj1: Dict[str, float], obj2: Dict[str, float]
 
     # Normalisation approximative (ajustez selon vos données)
     # Ici on assume que la distance max attendue est ~200 unités
-    max_expected_distance = 200.0
+    max_expected_distance = MAX_EXPECTED_DISTANCE
     normalized_distance = min(pos_distance / max_expected_distance, 1.0)
 
     return normalized_distance
 
 
-def modify_object_properties(obj: Dict[str, Any],
-                             scale_factor: float = 1.0,
-                             y_offset: float = 0.0,
-                             min_height: float = None) -> Dict[str, Any]:
+def transform_spec(scale_factor: float = 1.0,
+                   y_offset: float = 0.0,
+                   min_height: float = None) -> List[Dict[str, Any]]:
     """
-    Modifie les propriétés d'un objet (échelle, position Y et hauteur minimum).
-
-    Args:
-        obj: L'objet à modifier
-        scale_factor: Facteur multiplicateur pour l'échelle (ex: 2.0 = double la taille)
-        y_offset: Décalage à appliquer sur la position Y (peut être positif ou négatif)
-        min_height: Hauteur minimum en Y. Si l'objet (APRÈS décalage) est plus bas, il sera remonté à cette hauteur
-
-    Returns:
-        L'objet modifié (copie)
+    Étapes appliquées aux objets conservés par remove_close_objects (voir clearerPipeline.build_pipeline).
     """
-    modified_obj = obj.copy()
-
-    # Modification de l'échelle
-    if 'scaleX' in modified_obj:
-        modified_obj['scaleX'] *= scale_factor
-    if 'scaleY' in modified_obj:
-        modified_obj['scaleY'] *= scale_factor
-    if 'scaleZ' in modified_obj:
-        modified_obj['scaleZ'] *= scale_factor
-
-    # Modification de la position Y (ÉTAPE 1: appliquer le décalage)
-    if 'y' in modified_obj:
-        original_y = modified_obj['y']
-        modified_obj['y'] += y_offset
-        y_after_offset = modified_obj['y']
-
-        # Application de la hauteur minimum (ÉTAPE 2: vérifier après décalage)
-        if min_height is not None:
-            if modified_obj['y'] < min_height:
-                print(
-                    f"Objet remonté: Y original={original_y:.3f} → Y après décalage={y_after_offset:.3f} → Y final={min_height:.3f} (hauteur minimum)")
-                modified_obj['y'] = min_height
-
-    return modified_obj
+    return config_to_spec({'scale_factor': scale_factor, 'y_offset': y_offset, 'min_height': min_height},
+                          include_dedupe=False)
 
 
 def remove_close_objects(objects: List[Dict[str, Any]],
@@ -106,10 +80,16 @@ def remove_close_objects(objects: List[Dict[str, Any]],
                          use_normalized: bool = True,
                          scale_factor: float = 1.0,
                          y_offset: float = 0.0,
-                         min_height: float = None) -> List[Dict[str, Any]]:
+                         min_height: float = None,
+                         report: FilterReport = None,
+                         budget: int = None,
+                         selection: str = 'first',
+                         seed: int = DEFAULT_SEED,
+                         scale_priority: bool = False,
+                         duplicate_tolerance: float = None) -> List[Dict[str, Any]]:
     """
     Supprime les objets trop proches selon le seuil donné et modifie leurs propriétés.
-    GARDE TOUJOURS UN DES DEUX OBJETS (le premier rencontré).
+    GARDE TOUJOURS UN DES DEUX OBJETS (le premier rencontré, ou le premier tiré en mode 'poisson').
 
     IMPORTANT: La suppression se base sur les positions ORIGINALES,
     les modifications sont appliquées APRÈS le filtrage dans cet ordre :
@@ -124,68 +104,26 @@ def remove_close_objects(objects: List[Dict[str, Any]],
         scale_factor: Facteur multiplicateur pour l'échelle (ex: 1.5 = +50% de taille)
         y_offset: Décalage sur l'axe Y (ex: 2.0 = monte de 2 unités)
         min_height: Hauteur minimum en Y (ex: 1.0 = tous les objets seront au minimum à Y=1.0)
+        report: Rapport complété avec les compteurs et l'histogramme des distances
+            au plus proche voisin (le détail par objet est journalisé au niveau DEBUG)
+        budget: Nombre d'objets visé : le seuil est recherché, threshold servant de
+            plancher (None = threshold seul, voir instanceBudget.py)
+        selection: 'first' (ordre du fichier) ou 'poisson' (échantillonnage Poisson-disk :
+            ordre tiré avec seed, sans amas ni trous dus à l'ordre d'export)
+        seed: Graine du mode 'poisson' (même sélection d'une exécution à l'autre)
+        scale_priority: Mode 'poisson' : les plus grandes instances l'emportent
+        duplicate_tolerance: Pas des doublons (quasi identiques) retirés en une passe avant
+            le filtrage si threshold > 0 (None = aucun, voir duplicateHash.py)
 
     Returns:
         Liste filtrée des objets avec propriétés modifiées
     """
-    if not objects:
-        return objects
-
-    # ÉTAPE 1: Filtrage basé sur les positions ORIGINALES
-    filtered_objects_original = []
-    distance_func = calculate_normalized_distance if use_normalized else calculate_distance
-
-    for i, current_obj in enumerate(objects):
-        is_too_close = False
-        closest_distance = float('inf')
-        closest_index = -1
-
-        # Vérifier la distance avec tous les objets déjà acceptés (POSITIONS ORIGINALES)
-        for j, accepted_obj in enumerate(filtered_objects_original):
-            distance = distance_func(current_obj, accepted_obj)
-
-            if distance < closest_distance:
-                closest_distance = distance
-                closest_index = j
-
-            if distance < threshold:
-                is_too_close = True
-                break
-
-        if not is_too_close:
-            # Garder l'objet ORIGINAL pour le moment (sans modifications)
-            filtered_objects_original.append(current_obj)
-            print(f"Objet {i} conservé (distance OK)")
-        else:
-            # L'objet est trop proche d'un objet déjà accepté
-            print(
-                f"Objet {i} supprimé car trop proche de l'objet conservé #{closest_index} (distance {closest_distance:.6f} < seuil {threshold})")
-
-    # ÉTAPE 2: Appliquer les modifications (échelle, Y, hauteur min) APRÈS le filtrage
-    final_objects = []
-    for i, obj in enumerate(filtered_objects_original):
-        modified_obj = modify_object_properties(obj, scale_factor, y_offset, min_height)
-        final_objects.append(modified_obj)
-
-        # Affichage des modifications appliquées
-        modifications = []
-        if scale_factor != 1.0:
-            modifications.append(f"échelle: x{scale_factor}")
-        if y_offset != 0.0:
-            modifications.append(f"Y: +{y_offset}")
-        if min_height is not None:
-            modifications.append(f"hauteur min: {min_height}")
-
-        if modifications:
-            print(f"Objet conservé #{i} modifié ({', '.join(modifications)})")
-
-    print(f"\n--- Résumé du filtrage ---")
-    print(f"Objets originaux: {len(objects)}")
-    print(f"Objets après filtrage: {len(filtered_objects_original)}")
-    print(f"Objets supprimés: {len(objects) - len(filtered_objects_original)}")
-    if min_height is not None:
-        print(f"Hauteur minimum appliquée: {min_height}")
-
+    final_objects = filter_objects(objects, threshold, transform_spec(scale_factor, y_offset, min_height),
+                                   use_normalized=use_normalized, weighted=WEIGHTED_DISTANCE,
+                                   report=report, budget=budget, selection=selection, seed=seed,
+                                   scale_priority=scale_priority, duplicate_tolerance=duplicate_tolerance)
+    if objects and min_height is not None:
+        logger.info(f"Hauteur minimum appliquée: {min_height}")
     return final_objects
 
 
@@ -194,7 +132,13 @@ def process_json_file(input_file: str,
                       threshold: float = 0.1,
                       scale_factor: float = 1.0,
                       y_offset: float = 0.0,
-                      min_height: float = None):
+                      min_height: float = None,
+                      report_file: str = None,
+                      budget: int = None,
+                      selection: str = 'first',
+                      seed: int = DEFAULT_SEED,
+                      scale_priority: bool = False,
+                      duplicate_tolerance: float = None):
     """
     Traite un fichier JSON complet avec modification des propriétés.
 
@@ -205,46 +149,33 @@ def process_json_file(input_file: str,
         scale_factor: Facteur d'échelle (1.0 = pas de changement)
         y_offset: Décalage position Y (0.0 = pas de changement)
         min_height: Hauteur minimum en Y (None = pas de hauteur minimum)
+        report_file: Rapport JSON des compteurs à écrire (None = aucun, voir clearerReport.py)
+        budget: Nombre d'objets visé par liste (None = threshold seul, voir instanceBudget.py)
+        selection, seed, scale_priority: Ordre de parcours du filtrage (voir remove_close_objects)
+        duplicate_tolerance: Pas des doublons retirés avant le filtrage (None = aucun)
     """
-    try:
-        with open(input_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-
-        # Si c'est une liste directe d'objets
-        if isinstance(data, list):
-            filtered_data = remove_close_objects(data, threshold, True, scale_factor, y_offset, min_height)
-
-        # Si les objets sont dans une clé spécifique
-        elif isinstance(data, dict) and 'objects' in data:
-            filtered_data = data.copy()
-            filtered_data['objects'] = remove_close_objects(
-                data['objects'], threshold, True, scale_factor, y_offset, min_height
-            )
-
-        else:
-            print("Format JSON non reconnu. Attendu: liste d'objets ou dict avec clé 'objects'")
-            return
-
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(filtered_data, f, indent=2, ensure_ascii=False)
-
-        print(f"\nTraitement terminé:")
-        original_count = len(data) if isinstance(data, list) else len(data.get('objects', []))
-        final_count = len(filtered_data) if isinstance(filtered_data, list) else len(filtered_data.get('objects', []))
-        print(f"Objects originaux: {original_count}")
-        print(f"Objects conservés: {final_count}")
-        print(f"Objects supprimés: {original_count - final_count}")
-        print(f"Facteur d'échelle appliqué: {scale_factor}")
-        print(f"Décalage Y appliqué: {y_offset}")
-        if min_height is not None:
-            print(f"Hauteur minimum appliquée: {min_height}")
-
-    except FileNotFoundError:
-        print(f"Fichier {input_file} non trouvé")
-    except json.JSONDecodeError:
-        print(f"Erreur de format JSON dans {input_file}")
-    except Exception as e:
-        print(f"Erreur: {e}")
+    report = FilterReport() if report_file else None
+    counts = process_json_document(
+        input_file, output_file,
+        lambda objects: remove_close_objects(objects, threshold, True, scale_factor, y_offset, min_height, report, budget,
+                                             selection, seed, scale_priority, duplicate_tolerance)
+    )
+    if counts is None:
+        return
+
+    original_count, final_count = counts
+    logger.info(f"\nTraitement terminé:")
+    logger.info(f"Objects originaux: {original_count}")
+    logger.info(f"Objects conservés: {final_count}")
+    logger.info(f"Objects supprimés: {original_count - final_count}")
+    logger.info(f"Facteur d'échelle appliqué: {scale_factor}")
+    logger.info(f"Décalage Y appliqué: {y_offset}")
+    if min_height is not None:
+        logger.info(f"Hauteur minimum appliquée: {min_height}")
+
+    if report is not None:
+        report.write(report_file)
+        logger.info(f"Rapport écrit: {report_file}")
 
 
 # Exemple d'utilisation avec vos données
@@ -333,6 +264,13 @@ if __name__ == "__main__":
     SCALE_FACTOR = 1.0  # Facteur d'échelle (1.2 = +20% de taille)
     Y_OFFSET = 0.0  # Décalage en Y (2.0 = monte de 2 unités)
     MIN_HEIGHT = 5.25  # Hauteur minimum (tous les objets seront au minimum à Y=1.0)
+    LOG_LEVEL = 'INFO'  # 'DEBUG' affiche le détail par objet, 'WARNING' rend le traitement silencieux
+    REPORT_FILE = None  # Rapport JSON des compteurs (ex: 'report.json')
+    BUDGET = None  # Nombre d'objets visé : remplace l'ajustement manuel de THRESHOLD (plancher)
+    SELECTION = 'first'  # 'poisson' : sous-ensemble régulier, indépendant de l'ordre d'export
+    DUPLICATE_TOLERANCE = 1e-5  # Pas des doublons (exports répétés) retirés avant le filtrage, None = aucun
+
+    configure_logging(LOG_LEVEL)
 
     # Exemple d'utilisation
     example_usage()
@@ -343,4 +281,8 @@ if __name__ == "__main__":
                       threshold=THRESHOLD,
                       scale_factor=SCALE_FACTOR,
                       y_offset=Y_OFFSET,
-                      min_height=MIN_HEIGHT)
\ No newline at end of file
+                      min_height=MIN_HEIGHT,
+                      report_file=REPORT_FILE,
+                      budget=BUDGET,
+                      selection=SELECTION,
+                      duplicate_tolerance=DUPLICATE_TOLERANCE)
\ No newline at end of file
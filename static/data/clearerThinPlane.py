@@ -1,7 +1,13 @@
-import json
 import math
 from typing import List, Dict, Any
 
+from clearerPipeline import config_to_spec, filter_objects, process_json_document
+from clearerReport import FilterReport, configure_logging, logger
+from spatialIndex import DEFAULT_SEED, MAX_EXPECTED_DISTANCE
+
+# Distance brute de remove_close_objects quand use_normalized est False : positions seules (calculate_distance)
+WEIGHTED_DISTANCE = False
+
 
 def calculate_distance(obj1: Dict[str, float], obj2: Dict[str, float]) -> float:
     """
@@ -19,60 +25,33 @@ def calculate_normalized_distance(obj1: Dict[str, float], obj2: Dict[str, float]
     Calcule une distance normalisée entre 0 et 1 pour deux objets.
     """
     pos_distance = calculate_distance(obj1, obj2)
-    # Normalisation (ajustez max_expected_distance selon vos données)
-    max_expected_distance = 200.0
+    # Normalisation (ajustez MAX_EXPECTED_DISTANCE dans spatialIndex.py selon vos données)
+    max_expected_distance = MAX_EXPECTED_DISTANCE
     return min(pos_distance / max_expected_distance, 1.0)
 
 
-def modify_object_properties(obj: Dict[str, Any],
-                             scale_factor: float = 1.0,
-                             rotation_offset: Dict[str, float] = None) -> Dict[str, Any]:
+def transform_spec(scale_factor: float = 1.0,
+                   rotation_offset: Dict[str, float] = None) -> List[Dict[str, Any]]:
     """
-    Modifie les propriétés d'un objet (échelle uniforme et ajout de rotation).
-
-    Args:
-        obj: L'objet à modifier
-        scale_factor: Valeur qui remplace toutes les échelles (ex: 2.0 = set scaleX/Y/Z à 2.0)
-        rotation_offset: Dictionnaire avec les rotations à ajouter {'rotationX': 0.5, 'rotationY': 0.0, 'rotationZ': 0.2}
-
-    Returns:
-        L'objet modifié (copie)
+    Étapes appliquées aux objets conservés par remove_close_objects (voir clearerPipeline.build_pipeline).
     """
-    modified_obj = obj.copy()
-
-    if rotation_offset is None:
-        rotation_offset = {'rotationX': 0.0, 'rotationY': 0.0, 'rotationZ': 0.0}
-
-    # Remplacement de l'échelle (uniforme pour X, Y, Z)
-    if 'scaleX' in modified_obj:
-        modified_obj['scaleX'] = scale_factor
-    if 'scaleY' in modified_obj:
-        modified_obj['scaleY'] = scale_factor
-    if 'scaleZ' in modified_obj:
-        modified_obj['scaleZ'] = scale_factor
-
-    # Ajout des rotations
-    for rotation_key in ['rotationX', 'rotationY', 'rotationZ']:
-        if rotation_key in modified_obj and rotation_key in rotation_offset:
-            original_rotation = modified_obj[rotation_key]
-            modified_obj[rotation_key] += rotation_offset[rotation_key]
-
-            # Affichage des modifications de rotation (optionnel)
-            if rotation_offset[rotation_key] != 0.0:
-                print(
-                    f"  {rotation_key}: {original_rotation:.3f} → {modified_obj[rotation_key]:.3f} (+{rotation_offset[rotation_key]:.3f})")
-
-    return modified_obj
+    return config_to_spec({'uniform_scale': scale_factor, 'rotation_offset': rotation_offset}, include_dedupe=False)
 
 
 def remove_close_objects(objects: List[Dict[str, Any]],
                          threshold: float = 0.1,
                          use_normalized: bool = True,
                          scale_factor: float = 1.0,
-                         rotation_offset: Dict[str, float] = None) -> List[Dict[str, Any]]:
+                         rotation_offset: Dict[str, float] = None,
+                         report: FilterReport = None,
+                         budget: int = None,
+                         selection: str = 'first',
+                         seed: int = DEFAULT_SEED,
+                         scale_priority: bool = False,
+                         duplicate_tolerance: float = None) -> List[Dict[str, Any]]:
     """
     Supprime les objets trop proches selon le seuil donné et modifie leurs propriétés.
-    GARDE TOUJOURS UN DES DEUX OBJETS (le premier rencontré).
+    GARDE TOUJOURS UN DES DEUX OBJETS (le premier rencontré, ou le premier tiré en mode 'poisson').
 
     La suppression se base sur les positions ORIGINALES,
     les modifications sont appliquées APRÈS le filtrage.
@@ -83,76 +62,37 @@ def remove_close_objects(objects: List[Dict[str, Any]],
         use_normalized: Utilise la distance normalisée ou la distance brute
         scale_factor: Valeur qui remplace l'échelle de tous les objets (ex: 1.5 = set scaleX/Y/Z à 1.5)
         rotation_offset: Dictionnaire des rotations à ajouter (ex: {'rotationX': 0.5, 'rotationY': 0.0, 'rotationZ': 0.2})
+        report: Rapport complété avec les compteurs et l'histogramme des distances
+            au plus proche voisin (le détail par objet est journalisé au niveau DEBUG)
+        budget: Nombre d'objets visé : le seuil est recherché, threshold servant de
+            plancher (None = threshold seul, voir instanceBudget.py)
+        selection: 'first' (ordre du fichier) ou 'poisson' (échantillonnage Poisson-disk :
+            ordre tiré avec seed, sans amas ni trous dus à l'ordre d'export)
+        seed: Graine du mode 'poisson' (même sélection d'une exécution à l'autre)
+        scale_priority: Mode 'poisson' : les plus grandes instances l'emportent
+        duplicate_tolerance: Pas des doublons (quasi identiques) retirés en une passe avant
+            le filtrage si threshold > 0 (None = aucun, voir duplicateHash.py)
 
     Returns:
         Liste filtrée des objets avec propriétés modifiées
     """
-    if not objects:
-        return objects
-
-    if rotation_offset is None:
-        rotation_offset = {'rotationX': 0.0, 'rotationY': 0.0, 'rotationZ': 0.0}
-
-    # ÉTAPE 1: Filtrage basé sur les positions ORIGINALES
-    filtered_objects_original = []
-    distance_func = calculate_normalized_distance if use_normalized else calculate_distance
-
-    for i, current_obj in enumerate(objects):
-        is_too_close = False
-        closest_distance = float('inf')
-        closest_index = -1
-
-        # Vérifier la distance avec tous les objets déjà acceptés (POSITIONS ORIGINALES)
-        for j, accepted_obj in enumerate(filtered_objects_original):
-            distance = distance_func(current_obj, accepted_obj)
-
-            if distance < closest_distance:
-                closest_distance = distance
-                closest_index = j
-
-            if distance < threshold:
-                is_too_close = True
-                break
-
-        if not is_too_close:
-            filtered_objects_original.append(current_obj)
-            print(f"Objet {i} conservé (distance OK)")
-        else:
-            print(
-                f"Objet {i} supprimé car trop proche de l'objet conservé #{closest_index} (distance {closest_distance:.6f} < seuil {threshold})")
-
-    # ÉTAPE 2: Appliquer les modifications (échelle et rotation) APRÈS le filtrage
-    final_objects = []
-    for i, obj in enumerate(filtered_objects_original):
-        print(f"\nModification de l'objet conservé #{i}:")
-        modified_obj = modify_object_properties(obj, scale_factor, rotation_offset)
-        final_objects.append(modified_obj)
-
-        # Affichage des modifications appliquées
-        modifications = []
-        if scale_factor != 1.0:
-            modifications.append(f"échelle: ={scale_factor}")
-
-        rotation_changes = [f"{k}: +{v}" for k, v in rotation_offset.items() if v != 0.0]
-        if rotation_changes:
-            modifications.append(f"rotation: {', '.join(rotation_changes)}")
-
-        if modifications:
-            print(f"  Modifications: {', '.join(modifications)}")
-
-    print(f"\n--- Résumé du filtrage ---")
-    print(f"Objets originaux: {len(objects)}")
-    print(f"Objets après filtrage: {len(filtered_objects_original)}")
-    print(f"Objets supprimés: {len(objects) - len(filtered_objects_original)}")
-
-    return final_objects
+    return filter_objects(objects, threshold, transform_spec(scale_factor, rotation_offset),
+                          use_normalized=use_normalized, weighted=WEIGHTED_DISTANCE,
+                          report=report, budget=budget, selection=selection, seed=seed,
+                          scale_priority=scale_priority, duplicate_tolerance=duplicate_tolerance)
 
 
 def process_json_file(input_file: str,
                       output_file: str,
                       threshold: float = 0.1,
                       scale_factor: float = 1.0,
-                      rotation_offset: Dict[str, float] = None):
+                      rotation_offset: Dict[str, float] = None,
+                      report_file: str = None,
+                      budget: int = None,
+                      selection: str = 'first',
+                      seed: int = DEFAULT_SEED,
+                      scale_priority: bool = False,
+                      duplicate_tolerance: float = None):
     """
     Traite un fichier JSON complet avec les nouvelles modifications simplifiées.
 
@@ -162,47 +102,34 @@ def process_json_file(input_file: str,
         threshold: Seuil de proximité pour filtrage
         scale_factor: Valeur d'échelle uniforme qui remplace les scales existants (1.0 = pas de changement)
         rotation_offset: Dictionnaire des rotations à ajouter
+        report_file: Rapport JSON des compteurs à écrire (None = aucun, voir clearerReport.py)
+        budget: Nombre d'objets visé par liste (None = threshold seul, voir instanceBudget.py)
+        selection, seed, scale_priority: Ordre de parcours du filtrage (voir remove_close_objects)
+        duplicate_tolerance: Pas des doublons retirés avant le filtrage (None = aucun)
     """
     if rotation_offset is None:
         rotation_offset = {'rotationX': 0.0, 'rotationY': 0.0, 'rotationZ': 0.0}
 
-    try:
-        with open(input_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-
-        # Si c'est une liste directe d'objets
-        if isinstance(data, list):
-            filtered_data = remove_close_objects(data, threshold, True, scale_factor, rotation_offset)
-
-        # Si les objets sont dans une clé spécifique
-        elif isinstance(data, dict) and 'objects' in data:
-            filtered_data = data.copy()
-            filtered_data['objects'] = remove_close_objects(
-                data['objects'], threshold, True, scale_factor, rotation_offset
-            )
-
-        else:
-            print("Format JSON non reconnu. Attendu: liste d'objets ou dict avec clé 'objects'")
-            return
-
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(filtered_data, f, indent=2, ensure_ascii=False)
+    report = FilterReport() if report_file else None
+    counts = process_json_document(
+        input_file, output_file,
+        lambda objects: remove_close_objects(objects, threshold, True, scale_factor, rotation_offset, report, budget,
+                                             selection, seed, scale_priority, duplicate_tolerance)
+    )
+    if counts is None:
+        return
 
-        print(f"\nTraitement terminé:")
-        original_count = len(data) if isinstance(data, list) else len(data.get('objects', []))
-        final_count = len(filtered_data) if isinstance(filtered_data, list) else len(filtered_data.get('objects', []))
-        print(f"Objets originaux: {original_count}")
-        print(f"Objets conservés: {final_count}")
-        print(f"Objets supprimés: {original_count - final_count}")
-        print(f"Valeur d'échelle appliquée: {scale_factor}")
-        print(f"Rotations ajoutées: {rotation_offset}")
+    original_count, final_count = counts
+    logger.info(f"\nTraitement terminé:")
+    logger.info(f"Objets originaux: {original_count}")
+    logger.info(f"Objets conservés: {final_count}")
+    logger.info(f"Objets supprimés: {original_count - final_count}")
+    logger.info(f"Valeur d'échelle appliquée: {scale_factor}")
+    logger.info(f"Rotations ajoutées: {rotation_offset}")
 
-    except FileNotFoundError:
-        print(f"Fichier {input_file} non trouvé")
-    except json.JSONDecodeError:
-        print(f"Erreur de format JSON dans {input_file}")
-    except Exception as e:
-        print(f"Erreur: {e}")
+    if report is not None:
+        report.write(report_file)
+        logger.info(f"Rapport écrit: {report_file}")
 
 
 # Exemple d'utilisation
@@ -281,6 +208,13 @@ if __name__ == "__main__":
         'rotationY': 0.0,
         'rotationZ': 0.0
     }
+    LOG_LEVEL = 'INFO'  # 'DEBUG' affiche le détail par objet, 'WARNING' rend le traitement silencieux
+    REPORT_FILE = None  # Rapport JSON des compteurs (ex: 'report.json')
+    BUDGET = None  # Nombre d'objets visé : remplace l'ajustement manuel de THRESHOLD (plancher)
+    SELECTION = 'first'  # 'poisson' : sous-ensemble régulier, indépendant de l'ordre d'export
+    DUPLICATE_TOLERANCE = 1e-5  # Pas des doublons (exports répétés) retirés avant le filtrage, None = aucun
+
+    configure_logging(LOG_LEVEL)
 
     # Exemple d'utilisation
     # example_usage()
@@ -290,4 +224,8 @@ if __name__ == "__main__":
                       'output_ThinTrunkPlane.json',
                       threshold=THRESHOLD,
                       scale_factor=SCALE_FACTOR,
-                      rotation_offset=ROTATION_OFFSET)
\ No newline at end of file
+                      rotation_offset=ROTATION_OFFSET,
+                      report_file=REPORT_FILE,
+                      budget=BUDGET,
+                      selection=SELECTION,
+                      duplicate_tolerance=DUPLICATE_TOLERANCE)
\ No newline at end of file
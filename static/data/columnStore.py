@@ -0,0 +1,222 @@
+"""
+Stockage colonnaire sur disque des positions, ouvert par projection mémoire.
+
+Chaque exécution relisait tout le JSON (plusieurs Mo de texte). Le store garde
+une fois pour toutes les colonnes de chaque catégorie dans des fichiers .npy :
+
+    <store>/index.json                         catégories, effectifs, schéma, champs, source
+    <store>/v<n>/<catégorie>/<champ>.npy         une colonne (x, y, ..., scaleZ)
+    <store>/v<n>/<catégorie>/<champ>.present.npy masque de présence (champ absent de certains objets)
+    <store>/v<n>/<catégorie>/<champ>.filled.npy  axes de rotation complétés (schéma imbriqué)
+    <store>/v<n>/<catégorie>/ids.npy             identifiants (schéma imbriqué)
+    <store>/v<n>/<catégorie>/extras.json         clés non numériques, le cas échéant
+
+Chaque écriture produit une nouvelle génération v<n> ; l'index, remplacé en
+dernier, désigne toujours des colonnes complètes et cohérentes entre elles. Les
+générations précédentes (et les catégories disparues) sont ensuite supprimées.
+
+open_store projette les .npy en lecture seule (np.load(mmap_mode='r')) :
+l'ouverture est immédiate, les pages sont lues à la demande et partagées entre
+processus (le pool de clearerForest rouvre le store au lieu de recevoir une copie
+des colonnes). Les étapes qui modifient les valeurs travaillent sur la copie
+produite par PositionArrays.take ; les projections ne sont jamais modifiées.
+Le JSON reste le format d'import (import_json) et d'export.
+"""
+import json
+import os
+import re
+import shutil
+import tempfile
+from typing import Dict, Any, List, NamedTuple
+
+import numpy as np
+
+from jsonStream import load_positions
+from positionArrays import PositionArrays
+
+STORE_VERSION = 1
+INDEX_NAME = 'index.json'
+
+_UNSAFE_CHARACTERS = re.compile(r'[^A-Za-z0-9_.-]')
+
+_GENERATION = re.compile(r'v[0-9]+')
+
+
+class StoreCategory(NamedTuple):
+    """
+    Référence picklable vers une catégorie d'un store (rouverte dans le processus qui l'utilise).
+    """
+    store_dir: str
+    category: str
+
+    def open(self) -> PositionArrays:
+        return open_store(self.store_dir, [self.category])[self.category]
+
+
+def is_store(path: str) -> bool:
+    return os.path.isdir(path) and os.path.isfile(os.path.join(path, INDEX_NAME))
+
+
+def source_signature(input_file: str) -> Dict[str, Any]:
+    """
+    Signature du fichier importé (chemin, taille, date de modification) pour détecter un changement.
+    """
+    stat = os.stat(input_file)
+    return {'path': os.path.abspath(input_file), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _save(path: str, array: np.ndarray):
+    np.save(path, np.ascontiguousarray(array), allow_pickle=False)
+
+
+def _write_json_atomic(path: str, data: Any):
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+
+def write_store(store_dir: str,
+                categories: Dict[str, PositionArrays],
+                source: Dict[str, Any] = None) -> Dict[str, Any]:
+    """
+    Écrit les colonnes de chaque catégorie dans une nouvelle génération, puis l'index.
+
+    Une interruption avant le remplacement de l'index laisse le store précédent
+    intact ; les générations précédentes sont supprimées après ce remplacement (un
+    processus qui projette leurs fichiers les garde lisibles jusqu'à leur fermeture).
+
+    Args:
+        store_dir: Dossier du store (créé si besoin)
+        categories: Colonnes par catégorie
+        source: Signature du fichier importé (source_signature), enregistrée dans l'index
+
+    Returns:
+        Index écrit
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    previous = None
+    if is_store(store_dir):
+        try:
+            previous = read_index(store_dir)
+        except (ValueError, json.JSONDecodeError):
+            previous = None
+
+    generation = (previous or {}).get('generation', 0) + 1
+    generation_dir = os.path.join(store_dir, f'v{generation}')
+    # Reste d'une écriture interrompue : jamais référencé par l'index
+    shutil.rmtree(generation_dir, ignore_errors=True)
+    os.makedirs(generation_dir)
+
+    index = {'version': STORE_VERSION, 'source': source, 'generation': generation, 'categories': {}}
+    directories = set()
+
+    for category, arrays in categories.items():
+        directory = _UNSAFE_CHARACTERS.sub('_', category) or '_'
+        while directory in directories:
+            directory += '_'
+        directories.add(directory)
+        category_dir = os.path.join(generation_dir, directory)
+        os.makedirs(category_dir)
+
+        for field, column in arrays.columns.items():
+            _save(os.path.join(category_dir, f'{field}.npy'), column)
+        for field, mask in arrays.present.items():
+            _save(os.path.join(category_dir, f'{field}.present.npy'), mask)
+        for field, mask in arrays.filled.items():
+            _save(os.path.join(category_dir, f'{field}.filled.npy'), mask)
+        if arrays.ids is not None:
+            _save(os.path.join(category_dir, 'ids.npy'), arrays.ids)
+        if arrays.extras is not None:
+            with open(os.path.join(category_dir, 'extras.json'), 'w', encoding='utf-8') as f:
+                json.dump(arrays.extras, f, ensure_ascii=False)
+
+        index['categories'][category] = {
+            'directory': f'v{generation}/{directory}',
+            'count': int(arrays.count),
+            'schema': arrays.schema,
+            'columns': {field: column.dtype.str for field, column in arrays.columns.items()},
+            'present': list(arrays.present),
+            'filled': list(arrays.filled),
+            'ids': arrays.ids is not None,
+            'extras': arrays.extras is not None,
+        }
+
+    _write_json_atomic(os.path.join(store_dir, INDEX_NAME), index)
+
+    # Générations précédentes, écritures interrompues et dossiers de l'ancienne disposition
+    stale = {name for name in os.listdir(store_dir) if _GENERATION.fullmatch(name)}
+    for entry in (previous or {}).get('categories', {}).values():
+        stale.add(entry['directory'].split('/')[0])
+    stale.discard(f'v{generation}')
+    for name in stale:
+        shutil.rmtree(os.path.join(store_dir, name), ignore_errors=True)
+    return index
+
+
+def read_index(store_dir: str) -> Dict[str, Any]:
+    with open(os.path.join(store_dir, INDEX_NAME), 'r', encoding='utf-8') as f:
+        index = json.load(f)
+    if index.get('version') != STORE_VERSION:
+        raise ValueError(f"Store {store_dir}: version {index.get('version')} non prise en charge")
+    return index
+
+
+def open_store(store_dir: str, categories: List[str] = None, mmap: bool = True) -> Dict[str, PositionArrays]:
+    """
+    Ouvre les catégories d'un store (toutes par défaut, dans l'ordre de l'index).
+
+    Args:
+        store_dir: Dossier du store
+        categories: Catégories à ouvrir (None = toutes)
+        mmap: Projection en lecture seule (False = chargement en mémoire, modifiable)
+    """
+    index = read_index(store_dir)
+    mmap_mode = 'r' if mmap else None
+    opened = {}
+    for category, entry in index['categories'].items():
+        if categories is not None and category not in categories:
+            continue
+        category_dir = os.path.join(store_dir, entry['directory'])
+
+        def load(name):
+            return np.load(os.path.join(category_dir, name), mmap_mode=mmap_mode, allow_pickle=False)
+
+        columns = {field: load(f'{field}.npy') for field in entry['columns']}
+        present = {field: load(f'{field}.present.npy') for field in entry['present']}
+        filled = {field: load(f'{field}.filled.npy') for field in entry['filled']}
+        ids = load('ids.npy') if entry['ids'] else None
+        extras = None
+        if entry['extras']:
+            with open(os.path.join(category_dir, 'extras.json'), 'r', encoding='utf-8') as f:
+                extras = json.load(f)
+        opened[category] = PositionArrays(columns, entry['count'], present, extras, ids, entry['schema'], filled)
+    return opened
+
+
+def import_json(input_file: str, store_dir: str, force: bool = False) -> Dict[str, PositionArrays]:
+    """
+    Ouvre le store de input_file, en le (re)construisant si le fichier a changé.
+
+    Args:
+        input_file: Export JSON {catégorie: [objets, ...]} (abîmé : récupéré par load_positions)
+        store_dir: Dossier du store
+        force: Reconstruit le store même si la signature du fichier n'a pas changé
+
+    Returns:
+        Colonnes projetées par catégorie
+    """
+    signature = source_signature(input_file)
+    if not force and is_store(store_dir):
+        try:
+            if read_index(store_dir).get('source') == signature:
+                return open_store(store_dir)
+        except (ValueError, json.JSONDecodeError):
+            pass
+
+    data = load_positions(input_file)
+    if not isinstance(data, dict) or not all(isinstance(objects, list) for objects in data.values()):
+        raise ValueError(f"{input_file}: format non reconnu. Attendu: dict {{catégorie: liste d'objets}}")
+    write_store(store_dir, {category: PositionArrays.from_objects(objects) for category, objects in data.items()},
+                signature)
+    return open_store(store_dir)
@@ -0,0 +1,108 @@
+"""
+Suppression des doublons exacts ou quasi exacts par hachage, avant le filtrage.
+
+Les réexports Blender contiennent des instances identiques au bit près
+(ex: 26 dans BranchTree, 5 dans TrunkThin). Chaque champ de transformation est
+quantifié au pas `tolerance` (même pas pour positions, rotations et échelles),
+les valeurs quantifiées d'une instance sont combinées en une clé 64 bits, et
+les instances de même clé sont regroupées en une passe : la première rencontrée
+est conservée, comme dans le filtrage par seuil.
+
+Deux valeurs de part et d'autre d'une frontière de quantification ne sont pas
+regroupées : ce pré-filtrage ne retire que des doublons certains, le filtrage
+par seuil reste chargé des objets simplement proches.
+"""
+from typing import Dict, Any, Tuple
+
+import numpy as np
+
+from positionArrays import FIELDS, NESTED_FIELDS, PositionArrays
+
+# Pas de quantification par défaut (unités de scène, radians, facteur d'échelle)
+DUPLICATE_TOLERANCE = 1e-5
+
+# Valeur quantifiée d'un champ absent (distincte de toute valeur présente)
+_ABSENT = np.iinfo(np.int64).min
+
+# Constantes de mélange FNV-1a 64 bits
+_FNV_OFFSET = np.uint64(0xcbf29ce484222325)
+_FNV_PRIME = np.uint64(0x100000001b3)
+
+
+def quantized_fields(arrays: PositionArrays, tolerance: float = DUPLICATE_TOLERANCE) -> np.ndarray:
+    """
+    Champs de transformation quantifiés, (count, nombre de champs) en int64.
+    """
+    fields = sorted(arrays.columns)
+    quantized = np.empty((arrays.count, len(fields)), dtype=np.int64)
+    for k, field in enumerate(fields):
+        quantized[:, k] = np.round(arrays.columns[field].astype(np.float64) / tolerance)
+        present = arrays.present.get(field)
+        if present is not None:
+            quantized[~present, k] = _ABSENT
+    return quantized
+
+
+def hash_rows(quantized: np.ndarray) -> np.ndarray:
+    """
+    Clé 64 bits de chaque ligne (FNV-1a sur les champs quantifiés).
+    """
+    keys = np.full(len(quantized), _FNV_OFFSET, dtype=np.uint64)
+    for column in quantized.T:
+        keys ^= column.view(np.uint64)
+        keys *= _FNV_PRIME
+    return keys
+
+
+def find_duplicates(arrays: PositionArrays, tolerance: float = DUPLICATE_TOLERANCE) -> np.ndarray:
+    """
+    Indice de la première instance identique (après quantification) à chacune.
+
+    Une collision de clé entre deux instances différentes est détectée en
+    comparant les champs quantifiés : l'instance est alors conservée.
+
+    Returns:
+        duplicate_of : -1 pour les instances conservées, sinon l'indice de la
+        première instance identique (toujours inférieur)
+    """
+    if arrays.count == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    quantized = quantized_fields(arrays, tolerance)
+    keys = hash_rows(quantized)
+    # return_index renvoie la première occurrence de chaque clé
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    candidate = first[inverse.reshape(-1)]
+
+    duplicate_of = np.full(arrays.count, -1, dtype=np.int64)
+    later = np.flatnonzero(candidate != np.arange(arrays.count))
+    same = (quantized[later] == quantized[candidate[later]]).all(axis=1)
+    duplicate_of[later[same]] = candidate[later[same]]
+    return duplicate_of
+
+
+def drop_duplicates(arrays: PositionArrays, tolerance: float = DUPLICATE_TOLERANCE) -> Tuple[PositionArrays, np.ndarray]:
+    """
+    Colonnes sans doublons et indices (croissants) des instances conservées.
+    """
+    indices = np.flatnonzero(find_duplicates(arrays, tolerance) == -1)
+    if len(indices) == arrays.count:
+        return arrays, indices
+    return arrays.take(indices), indices
+
+
+def object_key(obj: Dict[str, Any], tolerance: float = DUPLICATE_TOLERANCE) -> Tuple:
+    """
+    Champs quantifiés d'un objet JSON (None pour un champ absent), pour le filtrage
+    en flux : deux objets ont la même clé exactement quand find_duplicates les
+    regroupe (axes de rotation absents du schéma imbriqué comptés à 0, comme
+    PositionArrays.from_objects).
+    """
+    if isinstance(obj.get('position'), dict):
+        values = []
+        for field, (group, axis) in NESTED_FIELDS.items():
+            value = (obj.get(group) or {}).get(axis)
+            values.append(0.0 if value is None and group == 'rotation' else value)
+    else:
+        values = [obj.get(field) for field in FIELDS]
+    return tuple(None if value is None else round(value / tolerance) for value in values)
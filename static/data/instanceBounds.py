@@ -0,0 +1,101 @@
+"""
+Volumes englobants précalculés des instances et des chunks.
+
+Chaque modèle est approché par une sphère centrée sur son pivot, de rayon
+BOUNDING_RADII (échelle 1). Pour une instance de matrice M = R x S :
+- sphère : centre = position, rayon = rayon x max(|scaleX|, |scaleY|, |scaleZ|) ;
+- boîte alignée (AABB) : boîte exacte de l'ellipsoïde image de la sphère,
+  demi-côté sur l'axe i = rayon x norme de la ligne i de R x S.
+
+Les volumes d'un chunk (`${groupe}_${cx}_${cz}` de Forest.jsx) englobent ceux de
+ses instances : le client peut les affecter à geometry.boundingSphere /
+boundingBox des InstancedMesh au lieu de les recalculer au chargement.
+"""
+from typing import Dict, Any, Tuple
+
+import numpy as np
+
+from chunkManifest import BOUNDS_DECIMALS, category_ranges, round_outward
+from instanceMatrices import instance_components, quaternions_to_rotation_matrices
+from overlapCulling import PROP_RADII
+from positionArrays import PositionArrays
+
+# Rayon englobant à l'échelle 1 depuis le pivot, mesuré sur les modèles glTF
+BOUNDING_RADII = dict(PROP_RADII,
+                      TrunkLarge=52.12,
+                      TrunkThin=29.37,
+                      TreeNaked=21.61,
+                      TreeRoof=2.21,
+                      TreeStump=4.24,
+                      BranchTree=6.17,
+                      BranchFig=2.47,
+                      BranchEucalyptus=2.47)
+
+# Catégories sans modèle mesuré (écrans, serveurs, rochers)
+DEFAULT_BOUNDING_RADIUS = 2.5
+
+# Sphère (centre x/y/z, rayon) puis AABB (min x/y/z, max x/y/z)
+FLOATS_PER_BOUNDS = 10
+
+
+def instance_bounds(arrays: PositionArrays, base_radius: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Sphères et boîtes englobantes de toutes les instances d'une catégorie.
+
+    Returns:
+        (centres (n, 3), rayons (n,), minimums (n, 3), maximums (n, 3))
+    """
+    positions, quaternions, scales = instance_components(arrays)
+    radii = base_radius * np.abs(scales).max(axis=1, initial=0.0)
+    linear = quaternions_to_rotation_matrices(quaternions) * scales[:, None, :]
+    half = base_radius * np.sqrt((linear ** 2).sum(axis=2))
+    return positions, radii, positions - half, positions + half
+
+
+def pack_bounds(arrays: PositionArrays, base_radius: float) -> np.ndarray:
+    """
+    Empaquette les volumes d'une catégorie en (n, FLOATS_PER_BOUNDS).
+    """
+    centers, radii, lows, highs = instance_bounds(arrays, base_radius)
+    return np.concatenate([centers, radii[:, None], lows, highs], axis=1)
+
+
+def add_chunk_bounds(manifest: Dict[str, Any],
+                     categories: Dict[str, PositionArrays],
+                     bounding_radii: Dict[str, float] = None) -> Dict[str, Any]:
+    """
+    Ajoute au manifeste (chunkManifest.partition_chunks) les volumes englobant ceux
+    des instances de chaque chunk, à plat dans l'ordre des chunks : 'aabb' (min
+    x/y/z, max x/y/z) et 'spheres' (centre x/y/z, rayon). La sphère est centrée sur
+    la boîte ; les valeurs sont arrondies vers l'extérieur à BOUNDS_DECIMALS décimales.
+
+    Args:
+        manifest: Manifeste des chunks, modifié en place
+        categories: Colonnes réordonnées par chunk (renvoyées par partition_chunks)
+        bounding_radii: Rayons à l'échelle 1 par catégorie (BOUNDING_RADII)
+    """
+    bounding_radii = BOUNDING_RADII if bounding_radii is None else bounding_radii
+    chunk_count = manifest['chunkCount']
+    low = np.full((chunk_count, 3), np.inf)
+    high = np.full((chunk_count, 3), -np.inf)
+    bounds = {}
+    # Les plages d'une catégorie se suivent et la couvrent entièrement : reduceat par plage
+    for category in manifest['ranges']:
+        chunks, starts, _ = category_ranges(manifest, category)
+        centers, radii, lows, highs = bounds[category] = instance_bounds(
+            categories[category], bounding_radii.get(category, DEFAULT_BOUNDING_RADIUS))
+        np.minimum.at(low, chunks, np.minimum.reduceat(lows, starts, axis=0))
+        np.maximum.at(high, chunks, np.maximum.reduceat(highs, starts, axis=0))
+
+    low, high = round_outward(low, high)
+    center = np.round((low + high) / 2.0, BOUNDS_DECIMALS)
+    radius = np.zeros(chunk_count)
+    for category, (centers, radii, _, _) in bounds.items():
+        chunks, starts, counts = category_ranges(manifest, category)
+        reach = np.sqrt(((centers - np.repeat(center[chunks], counts, axis=0)) ** 2).sum(axis=1)) + radii
+        np.maximum.at(radius, chunks, np.maximum.reduceat(reach, starts))
+
+    _, radius = round_outward(radius, radius)
+    manifest['aabb'] = np.concatenate([low, high], axis=1).reshape(-1).tolist()
+    manifest['spheres'] = np.concatenate([center, radius[:, None]], axis=1).reshape(-1).tolist()
+    return manifest
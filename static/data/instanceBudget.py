@@ -0,0 +1,243 @@
+"""
+Recherche automatique du seuil de filtrage à partir d'un budget d'instances.
+
+Au lieu d'ajuster THRESHOLD à la main, on fixe le nombre d'instances voulu :
+- par catégorie ('budget') : au plus N instances conservées ;
+- par chunk ('chunk_budget') : au plus N instances dans chaque chunk de la
+  catégorie (taille d'une InstancedMesh de Forest.jsx) ;
+- global (instance_budget) : au plus N instances au total, avec un seuil
+  commun à toutes les catégories filtrées.
+
+Le seuil retenu est le plus petit qui respecte le budget (dichotomie). Un seuil
+unique par catégorie garde une couverture homogène : la densité baisse partout
+de la même façon au lieu de vider certaines zones. La grille de cellules est
+calculée une fois pour un seuil maximal (DedupeStage.index) et réutilisée par
+chaque essai, qui ne compare chaque lot qu'aux instances déjà conservées ;
+l'index n'est reconstruit que pour élargir l'encadrement.
+
+Le seuil configuré sert de plancher : le budget ne peut que filtrer davantage.
+"""
+import math
+from typing import Callable, Dict, Any, Tuple
+
+import numpy as np
+
+from chunkManifest import CHUNK_SIZE, chunk_coordinates
+from clearerPipeline import SELECTION_KEYS, DedupeStage
+from positionArrays import PositionArrays
+from spatialIndex import DEFAULT_SEED, MAX_EXPECTED_DISTANCE
+
+# Nombre maximal d'essais de la dichotomie
+THRESHOLD_SEARCH_ITERATIONS = 32
+
+# Précision relative du seuil retenu (arrêt de la dichotomie)
+THRESHOLD_TOLERANCE = 1e-3
+
+# La distance normalisée plafonne à 1.0 : aucun seuil supérieur n'est utile
+MAX_NORMALIZED_THRESHOLD = 1.0
+
+
+class BudgetSearch:
+    """
+    Essais de seuils de filtrage sur une catégorie, avec une grille de cellules réutilisée.
+
+    Args:
+        arrays: Colonnes de la catégorie (positions ORIGINALES)
+        floor: Seuil minimal (seuil configuré)
+        use_normalized, weighted: Mesure de distance (voir DedupeStage)
+        chunk_size: Taille des chunks pour chunk_budget
+        selection, seed, scale_priority: Ordre de parcours de chaque essai (voir DedupeStage)
+    """
+
+    def __init__(self,
+                 arrays: PositionArrays,
+                 floor: float = 0.0,
+                 use_normalized: bool = True,
+                 weighted: bool = False,
+                 chunk_size: float = CHUNK_SIZE,
+                 selection: str = 'first',
+                 seed: int = DEFAULT_SEED,
+                 scale_priority: bool = False):
+        self.arrays = arrays
+        self.floor = floor
+        self.params = {'use_normalized': use_normalized, 'weighted': weighted,
+                       'selection': selection, 'seed': seed, 'scale_priority': scale_priority}
+        self.index = None
+        self.index_builds = 0
+
+        chunk_x, chunk_z = chunk_coordinates(arrays, chunk_size)
+        _, chunk = np.unique(np.stack([chunk_x, chunk_z], axis=1), axis=0, return_inverse=True)
+        self.chunk = chunk.reshape(-1)
+
+        if use_normalized:
+            self.limit = MAX_NORMALIZED_THRESHOLD
+        else:
+            # Au-delà de la diagonale (plus la part des rotations et échelles) tout est proche
+            extent = [float(np.ptp(arrays.columns[field])) if arrays.count else 0.0 for field in ('x', 'y', 'z')]
+            self.limit = 2.0 * (math.sqrt(sum(value * value for value in extent)) + 1.0)
+
+    def kept(self, threshold: float) -> np.ndarray:
+        """
+        Masque des instances conservées avec ce seuil (au moins le plancher).
+        """
+        threshold = min(max(threshold, self.floor), self.limit)
+        if threshold <= 0 or self.arrays.count == 0:
+            return np.ones(self.arrays.count, dtype=bool)
+        if self.index is None or threshold > self.index.max_threshold:
+            # Marge d'un doublement : l'encadrement suivant réutilise encore l'index
+            max_threshold = min(self.limit, 2.0 * threshold)
+            self.index = DedupeStage(threshold=max_threshold, **self.params).index(self.arrays)
+            self.index_builds += 1
+        return self.index.kept(threshold)
+
+    def chunk_max(self, kept: np.ndarray) -> int:
+        """
+        Nombre d'instances du chunk le plus peuplé.
+        """
+        return int(np.bincount(self.chunk[kept]).max(initial=0))
+
+    def initial_threshold(self, target: float) -> float:
+        """
+        Seuil de départ de l'encadrement : espacement moyen de target objets sur l'emprise.
+        """
+        x, z = self.arrays.columns['x'], self.arrays.columns['z']
+        area = max(float(np.ptp(x)) * float(np.ptp(z)), 1e-12)
+        spacing = math.sqrt(area / max(target, 1.0))
+        threshold = spacing / MAX_EXPECTED_DISTANCE if self.params['use_normalized'] else spacing
+        return min(max(threshold, self.floor), self.limit)
+
+
+def bisect_threshold(satisfied: Callable[[float], bool],
+                     initial: float,
+                     limit: float,
+                     low: float = 0.0,
+                     iterations: int = THRESHOLD_SEARCH_ITERATIONS) -> Tuple[float, bool]:
+    """
+    Plus petit seuil dans [low, limit] pour lequel satisfied(seuil) est vrai.
+
+    L'encadrement part de initial et double jusqu'à limit, puis la dichotomie
+    s'arrête à THRESHOLD_TOLERANCE près. Le seuil renvoyé a toujours été essayé.
+
+    Returns:
+        (seuil, budget respecté) ; si même limit ne suffit pas, (limit, False)
+    """
+    if satisfied(low):
+        return low, True
+
+    high = min(max(initial, low * 2.0, 1e-12), limit)
+    while not satisfied(high):
+        if high >= limit:
+            return limit, False
+        low, high = high, min(high * 2.0, limit)
+
+    for _ in range(iterations):
+        if high - low <= THRESHOLD_TOLERANCE * high:
+            break
+        middle = (low + high) / 2.0
+        if satisfied(middle):
+            high = middle
+        else:
+            low = middle
+    return high, True
+
+
+def category_threshold(search: BudgetSearch,
+                       budget: int = None,
+                       chunk_budget: int = None) -> Dict[str, Any]:
+    """
+    Plus petit seuil d'une catégorie respectant son budget et son budget par chunk.
+
+    Returns:
+        {'threshold', 'kept', 'chunkMax', 'met', 'budget', 'chunkBudget', 'indexBuilds'}
+    """
+    def satisfied(threshold):
+        kept = search.kept(threshold)
+        return ((budget is None or int(kept.sum()) <= budget) and
+                (chunk_budget is None or search.chunk_max(kept) <= chunk_budget))
+
+    # Nombre d'instances visé, pour l'encadrement initial
+    chunks = int(search.chunk.max(initial=-1)) + 1
+    target = min(value for value in (budget, None if chunk_budget is None else chunk_budget * chunks)
+                 if value is not None)
+
+    threshold, met = bisect_threshold(satisfied, search.initial_threshold(target), search.limit, search.floor)
+    kept = search.kept(threshold)
+    return {
+        'threshold': threshold,
+        'kept': int(kept.sum()),
+        'chunkMax': search.chunk_max(kept),
+        'met': met,
+        'budget': budget,
+        'chunkBudget': chunk_budget,
+        'indexBuilds': search.index_builds,
+    }
+
+
+def shared_threshold(searches: Dict[str, BudgetSearch],
+                     budget: int,
+                     fixed: int = 0) -> Tuple[float, bool]:
+    """
+    Plus petit seuil commun tel que le total des catégories (chacune avec
+    max(seuil, son plancher)) plus fixed instances tienne dans budget.
+    """
+    def satisfied(threshold):
+        return fixed + sum(int(search.kept(threshold).sum()) for search in searches.values()) <= budget
+
+    total = sum(search.arrays.count for search in searches.values())
+    initial = min(search.initial_threshold(search.arrays.count * max(budget - fixed, 1) / max(total, 1))
+                  for search in searches.values())
+    limit = max(search.limit for search in searches.values())
+    return bisect_threshold(satisfied, initial, limit)
+
+
+def solve_budgets(categories: Dict[str, PositionArrays],
+                  configs: Dict[str, Dict[str, Any]],
+                  instance_budget: int = None,
+                  chunk_size: float = CHUNK_SIZE) -> Dict[str, Dict[str, Any]]:
+    """
+    Calcule les seuils des catégories soumises à un budget.
+
+    Les catégories avec 'budget' ou 'chunk_budget' sont résolues d'abord. Le
+    budget global couvre ensuite toutes les catégories : celles dont le seuil
+    configuré est nul (ex: écrans) comptent pour leur effectif complet, les
+    autres partagent un seuil commun (leur seuil configuré restant un plancher).
+
+    Args:
+        categories: Colonnes par catégorie (positions ORIGINALES)
+        configs: Paramètres résolus par catégorie (clearerForest.resolve_config)
+        instance_budget: Nombre total d'instances (None = pas de budget global)
+        chunk_size: Taille des chunks pour chunk_budget
+
+    Returns:
+        {catégorie: résultat de category_threshold (ou du budget global)} pour les
+        catégories dont le seuil est calculé
+    """
+    results = {}
+    fixed = 0
+    shared = {}
+    for category, arrays in categories.items():
+        config = configs[category]
+        selection = {key: config[key] for key in SELECTION_KEYS if key in config}
+        if config.get('budget') is not None or config.get('chunk_budget') is not None:
+            search = BudgetSearch(arrays, floor=config['threshold'], chunk_size=chunk_size, **selection)
+            results[category] = category_threshold(search, config.get('budget'), config.get('chunk_budget'))
+            fixed += results[category]['kept']
+        elif instance_budget is not None and config['threshold'] > 0:
+            shared[category] = BudgetSearch(arrays, floor=config['threshold'], chunk_size=chunk_size, **selection)
+        else:
+            fixed += arrays.count
+
+    if instance_budget is not None and shared:
+        threshold, met = shared_threshold(shared, instance_budget, fixed)
+        for category, search in shared.items():
+            kept = search.kept(threshold)
+            results[category] = {
+                'threshold': max(threshold, search.floor),
+                'kept': int(kept.sum()),
+                'chunkMax': search.chunk_max(kept),
+                'met': met,
+                'budget': instance_budget,
+                'shared': True,
+                'indexBuilds': search.index_builds,
+            }
+    return results
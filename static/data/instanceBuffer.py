@@ -0,0 +1,138 @@
+"""
+Export binaire compact des instances (alternative au JSON indenté).
+
+Format (little-endian) :
+
+    en-tête   : magic b'GBIB', version u16, layout u16, nombre de catégories u32,
+                début des données u32
+    table     : pour chaque catégorie, longueur du nom u16, nom UTF-8,
+                nombre d'instances u32, offset des données u32 (depuis le début du fichier)
+    données   : float32 entrelacés par instance, chaque bloc aligné sur 16 octets
+
+Layout LAYOUT_PQS : position (3), quaternion x/y/z/w (4), échelle (3) = 10 floats.
+Layout LAYOUT_MAT4 : matrice monde (16, ordre de THREE.Matrix4.elements).
+Layout LAYOUT_BOUNDS : sphère centre/rayon (4), AABB min (3), max (3) = 10 floats
+(voir instanceBounds.py).
+
+Côté navigateur, chaque bloc se lit sans copie avec
+new Float32Array(buffer, offset, count * floatsPerInstance) ; un bloc LAYOUT_MAT4
+s'utilise directement comme InstancedBufferAttribute(array, 16) d'une InstancedMesh.
+"""
+import struct
+from typing import Dict, Tuple
+
+import numpy as np
+
+from instanceBounds import BOUNDING_RADII, DEFAULT_BOUNDING_RADIUS, FLOATS_PER_BOUNDS, pack_bounds
+from instanceMatrices import instance_components, instance_matrices
+from positionArrays import PositionArrays
+
+MAGIC = b'GBIB'
+VERSION = 1
+DATA_ALIGNMENT = 16
+
+LAYOUT_PQS = 0
+LAYOUT_MAT4 = 1
+LAYOUT_BOUNDS = 2
+FLOATS_PER_INSTANCE = {
+    LAYOUT_PQS: 10,
+    LAYOUT_MAT4: 16,
+    LAYOUT_BOUNDS: FLOATS_PER_BOUNDS,
+}
+
+
+def _align(offset: int) -> int:
+    return (offset + DATA_ALIGNMENT - 1) // DATA_ALIGNMENT * DATA_ALIGNMENT
+
+
+def pack_pqs(arrays: PositionArrays) -> np.ndarray:
+    """
+    Empaquette une catégorie en float32 (n, 10) : position, quaternion, échelle.
+    """
+    positions, quaternions, scales = instance_components(arrays)
+    return np.concatenate([positions, quaternions, scales], axis=1).astype('<f4')
+
+
+def pack_layout(category: str, arrays: PositionArrays, layout: int) -> np.ndarray:
+    """
+    Empaquette une catégorie en float32 selon le layout demandé.
+    """
+    if layout == LAYOUT_MAT4:
+        return instance_matrices(arrays).astype('<f4')
+    if layout == LAYOUT_BOUNDS:
+        return pack_bounds(arrays, BOUNDING_RADII.get(category, DEFAULT_BOUNDING_RADIUS)).astype('<f4')
+    return pack_pqs(arrays)
+
+
+def encode_instance_buffer(categories: Dict[str, np.ndarray], layout: int = LAYOUT_PQS) -> bytes:
+    """
+    Sérialise des blocs (n, floats_per_instance) par catégorie en un seul buffer.
+    """
+    stride = FLOATS_PER_INSTANCE[layout]
+    names = [name.encode('utf-8') for name in categories]
+
+    table_size = sum(2 + len(name) + 8 for name in names)
+    data_start = _align(16 + table_size)
+
+    table = bytearray()
+    blocks = []
+    offset = data_start
+    for name, block in zip(names, categories.values()):
+        block = np.ascontiguousarray(block, dtype='<f4').reshape(-1, stride)
+        table += struct.pack('<H', len(name)) + name + struct.pack('<II', len(block), offset)
+        blocks.append((offset, block.tobytes()))
+        offset = _align(offset + len(blocks[-1][1]))
+
+    buffer = bytearray(offset)
+    buffer[0:16] = struct.pack('<4sHHII', MAGIC, VERSION, layout, len(names), data_start)
+    buffer[16:16 + len(table)] = table
+    for block_offset, data in blocks:
+        buffer[block_offset:block_offset + len(data)] = data
+
+    return bytes(buffer)
+
+
+def decode_instance_buffer(buffer: bytes) -> Tuple[int, Dict[str, np.ndarray]]:
+    """
+    Relit un buffer produit par encode_instance_buffer.
+
+    Returns:
+        (layout, {catégorie: tableau float32 (n, floats_per_instance)})
+    """
+    magic, version, layout, count, data_start = struct.unpack_from('<4sHHII', buffer, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"Buffer d'instances invalide (magic={magic!r}, version={version})")
+
+    stride = FLOATS_PER_INSTANCE[layout]
+    categories = {}
+    cursor = 16
+    for _ in range(count):
+        (name_length,) = struct.unpack_from('<H', buffer, cursor)
+        cursor += 2
+        name = bytes(buffer[cursor:cursor + name_length]).decode('utf-8')
+        cursor += name_length
+        instances, offset = struct.unpack_from('<II', buffer, cursor)
+        cursor += 8
+        categories[name] = np.frombuffer(buffer, dtype='<f4', count=instances * stride,
+                                         offset=offset).reshape(instances, stride)
+
+    return layout, categories
+
+
+def write_instance_buffer(output_file: str, categories: Dict[str, PositionArrays], layout: int = LAYOUT_PQS) -> int:
+    """
+    Écrit le buffer binaire de toutes les catégories.
+
+    Args:
+        output_file: Fichier de sortie (ex: treePositions.bin)
+        categories: Colonnes par catégorie (après filtrage et modifications)
+        layout: LAYOUT_PQS, LAYOUT_MAT4 ou LAYOUT_BOUNDS
+
+    Returns:
+        Taille du fichier écrit en octets
+    """
+    buffer = encode_instance_buffer({name: pack_layout(name, arrays, layout) for name, arrays in categories.items()},
+                                    layout)
+    with open(output_file, 'wb') as f:
+        f.write(buffer)
+    return len(buffer)
@@ -0,0 +1,104 @@
+"""
+Conversions vectorisées des transformations d'instances (conventions Three.js).
+
+Les rotations exportées sont des angles d'Euler appliqués dans l'ordre 'XYZ',
+l'ordre par défaut de THREE.Euler utilisé par Forest.jsx.
+"""
+import numpy as np
+
+from positionArrays import PositionArrays
+
+
+def euler_xyz_to_quaternions(rx: np.ndarray, ry: np.ndarray, rz: np.ndarray) -> np.ndarray:
+    """
+    Équivalent vectorisé de THREE.Quaternion.setFromEuler (ordre 'XYZ').
+
+    Returns:
+        Tableau (n, 4) de quaternions (x, y, z, w)
+    """
+    c1, c2, c3 = np.cos(rx / 2), np.cos(ry / 2), np.cos(rz / 2)
+    s1, s2, s3 = np.sin(rx / 2), np.sin(ry / 2), np.sin(rz / 2)
+
+    quaternions = np.empty((len(rx), 4), dtype=np.float64)
+    quaternions[:, 0] = s1 * c2 * c3 + c1 * s2 * s3
+    quaternions[:, 1] = c1 * s2 * c3 - s1 * c2 * s3
+    quaternions[:, 2] = c1 * c2 * s3 + s1 * s2 * c3
+    quaternions[:, 3] = c1 * c2 * c3 - s1 * s2 * s3
+    return quaternions
+
+
+def instance_components(arrays: PositionArrays):
+    """
+    Extrait positions, quaternions et échelles d'une catégorie.
+
+    Les champs absents valent 0 (position, rotation) ou 1 (échelle), comme les
+    valeurs par défaut d'un THREE.Object3D.
+
+    Returns:
+        (positions (n, 3), quaternions (n, 4), scales (n, 3))
+    """
+    def column(field, default):
+        values = arrays.columns.get(field)
+        if values is None:
+            return np.full(arrays.count, default, dtype=np.float64)
+        values = values.astype(np.float64)
+        if field in arrays.present:
+            values[~arrays.present[field]] = default
+        return values
+
+    positions = np.stack([column('x', 0.0), column('y', 0.0), column('z', 0.0)], axis=1)
+    quaternions = euler_xyz_to_quaternions(column('rotationX', 0.0),
+                                           column('rotationY', 0.0),
+                                           column('rotationZ', 0.0))
+    scales = np.stack([column('scaleX', 1.0), column('scaleY', 1.0), column('scaleZ', 1.0)], axis=1)
+    return positions, quaternions, scales
+
+
+def quaternions_to_rotation_matrices(quaternions: np.ndarray) -> np.ndarray:
+    """
+    Équivalent vectorisé de THREE.Matrix4.makeRotationFromQuaternion (partie 3x3).
+
+    Returns:
+        Tableau (n, 3, 3) ; les colonnes sont les axes locaux X, Y, Z exprimés dans le monde
+    """
+    x, y, z, w = (quaternions[:, k] for k in range(4))
+    x2, y2, z2 = x + x, y + y, z + z
+    xx, xy, xz = x * x2, x * y2, x * z2
+    yy, yz, zz = y * y2, y * z2, z * z2
+    wx, wy, wz = w * x2, w * y2, w * z2
+
+    matrices = np.empty((len(quaternions), 3, 3), dtype=np.float64)
+    matrices[:, 0, 0] = 1 - (yy + zz)
+    matrices[:, 0, 1] = xy - wz
+    matrices[:, 0, 2] = xz + wy
+    matrices[:, 1, 0] = xy + wz
+    matrices[:, 1, 1] = 1 - (xx + zz)
+    matrices[:, 1, 2] = yz - wx
+    matrices[:, 2, 0] = xz - wy
+    matrices[:, 2, 1] = yz + wx
+    matrices[:, 2, 2] = 1 - (xx + yy)
+    return matrices
+
+
+def compose_matrices(positions: np.ndarray, quaternions: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    """
+    Équivalent vectorisé de THREE.Matrix4.compose.
+
+    Returns:
+        Tableau (n, 16) dans l'ordre de Matrix4.elements (colonnes successives),
+        copiable tel quel dans InstancedMesh.instanceMatrix.array
+    """
+    linear = quaternions_to_rotation_matrices(quaternions) * scales[:, None, :]
+    matrices = np.zeros((len(positions), 4, 4), dtype=np.float64)
+    # matrices[k, colonne, ligne] : l'aplatissement donne l'ordre par colonnes
+    matrices[:, :3, :3] = linear.transpose(0, 2, 1)
+    matrices[:, 3, :3] = positions
+    matrices[:, 3, 3] = 1.0
+    return matrices.reshape(-1, 16)
+
+
+def instance_matrices(arrays: PositionArrays) -> np.ndarray:
+    """
+    Matrices monde (n, 16) de toutes les instances d'une catégorie (voir compose_matrices).
+    """
+    return compose_matrices(*instance_components(arrays))
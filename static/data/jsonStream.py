@@ -0,0 +1,305 @@
+"""
+Lecture et écriture incrémentales des documents JSON de positions.
+
+JsonStreamReader décode les tableaux de chaque catégorie objet par objet ; en
+mode tolérant, il lit aussi les exports abîmés : documents concaténés
+(`{...}{...}`, `[...][...]`), membres `"Catégorie": [...]` sans accolades,
+tableaux collés dans un tableau sans être fermés (treePositions_.json) et
+virgules manquantes ou finales. load_positions s'en sert pour récupérer un
+fichier que json.load refuse, en fusionnant les documents par catégorie.
+"""
+import json
+from typing import Dict, Any, Iterator, List, Tuple
+
+from clearerReport import logger
+
+READ_CHUNK_SIZE = 1 << 16
+
+# Taille maximale d'une valeur décodée d'un bloc (objet, clé, valeur hors tableau) :
+# au-delà, le document est considéré tronqué ou invalide plutôt que lu jusqu'au bout
+MAX_VALUE_SIZE = 1 << 26
+
+_WHITESPACE = ' \t\n\r'
+
+
+class JsonStreamReader:
+    """
+    Analyseur JSON incrémental pour les fichiers de positions.
+
+    Comprend les trois formes acceptées par les scripts : {catégorie: [objets]},
+    liste directe d'objets et {'objects': [objets]}. Les éléments des tableaux sont
+    décodés un par un avec json.JSONDecoder.raw_decode.
+
+    Args:
+        f: Fichier texte ouvert
+        chunk_size: Taille des lectures
+        tolerant: Accepte les documents concaténés, les membres sans accolades,
+            les tableaux imbriqués ou non fermés et les virgules manquantes ou finales
+    """
+
+    def __init__(self, f, chunk_size: int = READ_CHUNK_SIZE, tolerant: bool = False):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.tolerant = tolerant
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+        self.documents = 0
+
+    def _fill(self, size: int = 0) -> bool:
+        # Lit au moins size caractères (chunk_size au minimum) en une fois
+        if self.eof:
+            return False
+        data = self.f.read(max(self.chunk_size, size))
+        if not data:
+            self.eof = True
+            return False
+        # Compactage : la partie déjà analysée n'est plus nécessaire
+        self.buffer = self.buffer[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise json.JSONDecodeError(f"'{char}' attendu", self.buffer, self.pos)
+        self.pos += 1
+
+    def _grow(self) -> bool:
+        # Valeur incomplète : la partie non analysée du tampon est au moins doublée avant de
+        # recommencer, chaque caractère n'est donc décodé qu'un nombre borné de fois
+        pending = len(self.buffer) - self.pos
+        if pending >= MAX_VALUE_SIZE and not self.eof:
+            raise json.JSONDecodeError(f"Valeur invalide ou de plus de {MAX_VALUE_SIZE} caractères", self.buffer, self.pos)
+        return self._fill(pending)
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self._grow():
+                    continue
+                raise
+            # Un nombre en fin de tampon peut être tronqué : relire avec plus de données
+            if end == len(self.buffer) and self._grow():
+                continue
+            self.pos = end
+            return value
+
+    def _separator(self, closing: str) -> bool:
+        # Après un élément : True si le conteneur se ferme
+        separator = self.peek()
+        if separator == closing:
+            self.pos += 1
+            return True
+        if self.tolerant:
+            # Fin de fichier : ferme tout ; clé suivante : virgule manquante ; virgule finale
+            if separator == '':
+                return True
+            if separator == '"':
+                return False
+            if separator == ',':
+                self.pos += 1
+                if self.peek() == closing:
+                    self.pos += 1
+                    return True
+                return self.peek() == ''
+        self.pos += 1
+        if separator != ',':
+            raise json.JSONDecodeError(f"',' ou '{closing}' attendu", self.buffer, self.pos - 1)
+        return False
+
+    def array_items(self) -> Iterator[Any]:
+        if self.tolerant:
+            yield from self._tolerant_items()
+            return
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self._separator(']'):
+                return
+
+    def _tolerant_items(self) -> Iterator[Any]:
+        # Tableaux imbriqués (exports collés les uns dans les autres) aplatis, virgules
+        # superflues ignorées ; la fin du fichier, une accolade ou une clé ferme le tableau
+        self.expect('[')
+        depth = 1
+        while True:
+            char = self.peek()
+            if char == ']':
+                self.pos += 1
+                depth -= 1
+                if depth == 0:
+                    return
+            elif char == '[':
+                self.pos += 1
+                depth += 1
+            elif char == ',':
+                self.pos += 1
+            elif char in ('', '}', '"'):
+                return
+            else:
+                yield self.value()
+
+    def _member(self) -> Tuple[str, Any]:
+        key = self.value()
+        self.expect(':')
+        if self.peek() == '[':
+            return key, self.array_items()
+        return key, self.value()
+
+    def _document(self) -> Iterator[Tuple[str, Any]]:
+        first = self.peek()
+        if first == '[':
+            yield None, self.array_items()
+            return
+        if self.tolerant and first == '"':
+            # Membre isolé : "Catégorie": [...] (accolades perdues à l'export)
+            yield self._member()
+            return
+
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            yield self._member()
+            if self._separator('}'):
+                return
+
+    def categories(self) -> Iterator[Tuple[str, Any]]:
+        """
+        Parcourt le document : (catégorie, itérateur d'objets) pour chaque tableau,
+        (clé, valeur) pour les autres valeurs. Une liste directe est renvoyée sous
+        la clé None. Chaque itérateur doit être consommé avant de passer au suivant.
+
+        En mode tolérant, les documents suivants (séparés ou non par des virgules)
+        sont parcourus à la suite ; une même catégorie peut donc revenir plusieurs fois.
+        """
+        while True:
+            yield from self._document()
+            self.documents += 1
+            if not self.tolerant:
+                return
+            # Séparateurs et fermetures orphelines entre deux documents
+            while self.peek() in (',', ']', '}'):
+                self.pos += 1
+            if self.peek() == '':
+                return
+
+
+class CompactJsonWriter:
+    """
+    Écriture incrémentale d'un document {catégorie: [objets]} en JSON compact.
+    """
+
+    def __init__(self, f, top_level_list: bool = False):
+        self.f = f
+        self.top_level_list = top_level_list
+        self.first_key = True
+        self.first_item = True
+
+    def _write(self, text: str):
+        self.f.write(text)
+
+    def begin(self):
+        self._write('[' if self.top_level_list else '{')
+
+    def key(self, key: str):
+        self._write(('' if self.first_key else ',') + json.dumps(key, ensure_ascii=False) + ':')
+        self.first_key = False
+
+    def value(self, key: str, value: Any):
+        self.key(key)
+        self._write(json.dumps(value, separators=(',', ':'), ensure_ascii=False))
+
+    def begin_array(self, key: str = None):
+        if key is not None:
+            self.key(key)
+            self._write('[')
+        self.first_item = True
+
+    def items(self, objects: List[Dict[str, Any]]):
+        for obj in objects:
+            self._write(('' if self.first_item else ',') + json.dumps(obj, separators=(',', ':'), ensure_ascii=False))
+            self.first_item = False
+
+    def end_array(self):
+        if not self.top_level_list:
+            self._write(']')
+
+    def end(self):
+        self._write(']' if self.top_level_list else '}')
+
+
+def recover_documents(input_file: str, chunk_size: int = READ_CHUNK_SIZE) -> Tuple[Any, Dict[str, Any]]:
+    """
+    Relit en flux un fichier abîmé et fusionne ses documents par catégorie.
+
+    Les tableaux d'une même catégorie sont mis bout à bout dans l'ordre du
+    fichier ; les listes directes sont regroupées sous 'objects' (ou renvoyées
+    telles quelles si le fichier ne contient que des listes). Pour les autres
+    valeurs, la dernière rencontrée est conservée.
+
+    Returns:
+        (données, {'documents', 'categories' {catégorie: nombre de tableaux fusionnés}})
+    """
+    entries: List[Tuple[Any, Any, bool]] = []
+    with open(input_file, 'r', encoding='utf-8') as f:
+        reader = JsonStreamReader(f, chunk_size, tolerant=True)
+        for key, content in reader.categories():
+            is_array = isinstance(content, Iterator)
+            entries.append((key, list(content) if is_array else content, is_array))
+
+    parts: Dict[Any, int] = {}
+    if entries and all(key is None for key, _, _ in entries):
+        data = [obj for _, objects, _ in entries for obj in objects]
+        parts[None] = len(entries)
+    else:
+        data = {}
+        for key, content, is_array in entries:
+            if not is_array:
+                data[key] = content
+                continue
+            key = 'objects' if key is None else key
+            data.setdefault(key, []).extend(content)
+            parts[key] = parts.get(key, 0) + 1
+    return data, {'documents': reader.documents, 'categories': parts}
+
+
+def load_positions(input_file: str, tolerant: bool = True) -> Any:
+    """
+    json.load d'un fichier de positions, avec récupération des exports abîmés.
+
+    Le fichier est d'abord lu normalement ; en cas d'erreur de format et si
+    tolerant est vrai, il est relu en flux par recover_documents.
+
+    Raises:
+        json.JSONDecodeError: Fichier illisible même en mode tolérant
+    """
+    try:
+        with open(input_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except json.JSONDecodeError as error:
+        if not tolerant:
+            raise
+        logger.warning(f"{input_file}: {error} ; lecture tolérante")
+
+    data, recovery = recover_documents(input_file)
+    merged = ', '.join(f"{category or 'liste'} x{count}" for category, count in recovery['categories'].items())
+    logger.warning(f"{input_file} récupéré: {recovery['documents']} document(s) fusionné(s) ({merged})")
+    return data
@@ -0,0 +1,202 @@
+"""
+Suppression des petits objets cachés dans un objet plus grand d'une autre catégorie.
+
+Buissons, champignons et fleurs sont souvent placés dans l'emprise d'un
+TrunkLarge ou d'un TreeRoof : invisibles, ils restent pourtant dessinés. Seuls
+les occultants sont indexés sur une grille, que chaque décor interroge
+(spatialIndex.cross_candidate_pairs), et chaque instance est approchée par une sphère de rayon rayon de référence x
+max(scaleX, scaleY, scaleZ). La sphère d'un décor est centrée sur sa position ;
+celle d'un occultant sur le centre de son maillage (OCCLUDER_CENTERS, transformé
+par l'échelle et la rotation de l'instance) : le feuillage d'un TreeRoof est
+décalé de +1.05 x scaleY au-dessus du pivot. Un objet "décor" est supprimé
+lorsque sa sphère est contenue dans celle d'un occultant au moins aussi grand,
+ou la recouvre à plus de min_overlap.
+
+Les rayons de référence (échelle 1) sont mesurés sur les modèles glTF
+(bornes min/max de l'attribut POSITION, transformation du nœud comprise) :
+rayon englobant depuis le pivot pour les décors, demi-largeur horizontale du
+tronc ou du feuillage pour les occultants (sphère inscrite, prudente), autour
+de la translation du nœud du maillage.
+
+Forest.jsx crée une InstancedMesh par catégorie et par chunk (et par niveau de
+LOD) : un chunk dont une catégorie est entièrement supprimée économise un appel
+de dessin, compté dans 'drawCallsSaved'.
+"""
+import math
+from typing import Dict, Any, Tuple
+
+import numpy as np
+
+from chunkManifest import CHUNK_SIZE, chunk_coordinates
+from instanceMatrices import instance_components, quaternions_to_rotation_matrices
+from positionArrays import PositionArrays, SCALE_FIELDS
+from spatialIndex import PAIR_BATCH_SIZE, RADIUS_EPSILON, cross_candidate_pairs
+
+# Rayon englobant à l'échelle 1 des objets pouvant être supprimés
+PROP_RADII = {
+    'Bush': 3.42,
+    'BushBlueberry': 2.6,
+    'BushRaspberry': 2.45,
+    'BushTrunk': 3.5,
+    'BushStrawberry': 2.45,
+    'FlowerBell': 2.46,
+    'FlowerChicory': 2.36,
+    'FlowerClover': 2.44,
+    'MushroomDuo': 2.46,
+    'MushroomSolo': 2.47,
+    'PlantClematis': 2.45,
+    'PineCone': 2.45,
+    'PlantMiscanthus': 2.45,
+    'PlantPuccinellia': 2.45,
+    'PlantReed': 2.45,
+}
+
+# Rayon d'emprise à l'échelle 1 des objets qui masquent les décors
+OCCLUDER_RADII = {
+    'TrunkLarge': 3.07,
+    'TrunkThin': 0.68,
+    'TreeRoof': 1.2,
+}
+
+# Centre de la sphère d'un occultant à l'échelle 1, dans le repère du modèle
+# (translation du nœud du maillage) ; absent = pivot (base des troncs)
+OCCLUDER_CENTERS = {
+    'TreeRoof': (0.0035, 1.0478, -0.0124),
+}
+
+# Part minimale du diamètre d'un décor recouverte par l'occultant (1.0 = contenu)
+MIN_OVERLAP = 0.9
+
+NO_OCCLUDER = np.iinfo(np.int64).max
+
+
+def instance_radii(arrays: PositionArrays, base_radius: float) -> np.ndarray:
+    """
+    Rayon de la sphère de chaque instance : base_radius x la plus grande échelle
+    (échelle 1 pour les axes absents).
+    """
+    scale = np.zeros(arrays.count, dtype=np.float64)
+    seen = np.zeros(arrays.count, dtype=bool)
+    for field in SCALE_FIELDS:
+        if field not in arrays.columns:
+            continue
+        present = arrays.present.get(field)
+        values = np.abs(arrays.columns[field])
+        if present is not None:
+            values = np.where(present, values, 0.0)
+        scale = np.maximum(scale, values)
+        seen |= True if present is None else present
+    return base_radius * np.where(seen, scale, 1.0)
+
+
+def instance_centers(arrays: PositionArrays, local_center: Tuple[float, float, float] = None) -> np.ndarray:
+    """
+    Centre de la sphère de chaque instance : local_center (repère du modèle, échelle 1)
+    transformé par l'échelle, la rotation et la position de l'instance ; None = position.
+    """
+    if local_center is None:
+        return np.stack([arrays.columns[field] for field in ('x', 'y', 'z')], axis=1)
+    positions, quaternions, scales = instance_components(arrays)
+    offsets = scales * np.asarray(local_center, dtype=np.float64)
+    rotations = quaternions_to_rotation_matrices(quaternions)
+    return positions + np.einsum('nij,nj->ni', rotations, offsets)
+
+
+def _stack_spheres(categories: Dict[str, PositionArrays],
+                   radii: Dict[str, float],
+                   local_centers: Dict[str, Tuple[float, float, float]] = None):
+    local_centers = local_centers or {}
+    names, centers, sphere_radii, category_index, local_index = [], [], [], [], []
+    for category, base_radius in radii.items():
+        arrays = categories.get(category)
+        if arrays is None or arrays.count == 0:
+            continue
+        centers.append(instance_centers(arrays, local_centers.get(category)))
+        sphere_radii.append(instance_radii(arrays, base_radius))
+        category_index.append(np.full(arrays.count, len(names), dtype=np.int64))
+        local_index.append(np.arange(arrays.count, dtype=np.int64))
+        names.append(category)
+
+    if not names:
+        return names, np.zeros((0, 3)), np.zeros(0), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return (names, np.concatenate(centers), np.concatenate(sphere_radii),
+            np.concatenate(category_index), np.concatenate(local_index))
+
+
+def cull_overlaps(categories: Dict[str, PositionArrays],
+                  prop_radii: Dict[str, float] = None,
+                  occluder_radii: Dict[str, float] = None,
+                  occluder_centers: Dict[str, Tuple[float, float, float]] = None,
+                  min_overlap: float = MIN_OVERLAP,
+                  chunk_size: float = CHUNK_SIZE,
+                  batch_size: int = PAIR_BATCH_SIZE) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+    """
+    Détermine les décors masqués par un occultant d'une autre catégorie.
+
+    Args:
+        categories: Colonnes par catégorie (positions et échelles finales)
+        prop_radii: Rayons de référence des catégories pouvant être supprimées (PROP_RADII)
+        occluder_radii: Rayons de référence des catégories occultantes (OCCLUDER_RADII)
+        occluder_centers: Centres des sphères des occultants à l'échelle 1 (OCCLUDER_CENTERS)
+        min_overlap: Recouvrement minimal (r_décor + r_occultant - d) / (2 x r_décor)
+        chunk_size: Taille des chunks de Forest.jsx (pour compter les appels de dessin)
+        batch_size: Nombre d'objets requêtés par lot
+
+    Returns:
+        (keep, report) : masque des instances conservées par catégorie de décor
+        présente, et par catégorie {'instances', 'culled', 'occluders' (suppressions
+        par catégorie occultante), 'chunks', 'drawCallsSaved'}
+    """
+    prop_radii = PROP_RADII if prop_radii is None else prop_radii
+    occluder_radii = OCCLUDER_RADII if occluder_radii is None else occluder_radii
+    occluder_centers = OCCLUDER_CENTERS if occluder_centers is None else occluder_centers
+    # Une catégorie ne se masque pas elle-même (déjà dédoublonnée par remove_close_objects)
+    prop_radii = {category: radius for category, radius in prop_radii.items() if category not in occluder_radii}
+
+    occluder_names, occluder_points, occluder_sphere, occluder_category, _ = _stack_spheres(categories, occluder_radii,
+                                                                                               occluder_centers)
+    prop_names, prop_points, prop_sphere, prop_category, prop_local = _stack_spheres(categories, prop_radii)
+
+    # Plus petit indice d'occultant masquant chaque décor (NO_OCCLUDER = visible)
+    culled_by = np.full(len(prop_sphere), NO_OCCLUDER, dtype=np.int64)
+
+    radius = (float(prop_sphere.max(initial=0.0)) + float(occluder_sphere.max(initial=0.0))) * (1.0 + RADIUS_EPSILON)
+
+    if len(occluder_sphere) and len(prop_sphere) and radius > 0 and math.isfinite(radius):
+        # Décors requêtés contre la grille des seuls occultants : ni paire décor-décor, ni occultant-occultant
+        for prop, occluder in cross_candidate_pairs(occluder_points[:, 0], occluder_points[:, 2],
+                                                    prop_points[:, 0], prop_points[:, 2], radius, batch_size):
+            r_prop, r_occluder = prop_sphere[prop], occluder_sphere[occluder]
+            distance = np.sqrt(((prop_points[prop] - occluder_points[occluder]) ** 2).sum(axis=1))
+            overlap = (r_prop + r_occluder - distance) / (2.0 * r_prop)
+            hidden = (r_occluder >= r_prop) & (overlap >= min_overlap)
+
+            # Indépendant de l'ordre des lots : l'occultant d'indice minimal est retenu
+            np.minimum.at(culled_by, prop[hidden], occluder[hidden])
+
+    culled = culled_by != NO_OCCLUDER
+    keep = {}
+    report = {}
+    for k, category in enumerate(prop_names):
+        members = prop_category == k
+        category_keep = np.ones(categories[category].count, dtype=bool)
+        category_keep[prop_local[members & culled]] = False
+        keep[category] = category_keep
+
+        arrays = categories[category]
+        chunk_x, chunk_z = chunk_coordinates(arrays, chunk_size)
+        chunk_keys = np.stack([chunk_x, chunk_z], axis=1)
+        chunks_before = len(np.unique(chunk_keys, axis=0))
+        chunks_after = len(np.unique(chunk_keys[category_keep], axis=0))
+
+        by = occluder_category[culled_by[members & culled]]
+        occluders = {occluder_names[o]: int(n) for o, n in enumerate(np.bincount(by, minlength=len(occluder_names))) if n}
+        report[category] = {
+            'instances': int(arrays.count),
+            'culled': int((~category_keep).sum()),
+            'occluders': occluders,
+            'chunks': chunks_before,
+            'drawCallsSaved': chunks_before - chunks_after,
+        }
+
+    return keep, report
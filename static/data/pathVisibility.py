@@ -0,0 +1,341 @@
+"""
+Ensembles potentiellement visibles (PVS) précalculés le long du trajet de la caméra.
+
+La caméra suit une animation fixe pilotée par le scroll (CameraAnimatorGLB.js) :
+au lieu de tester le frustum de chaque chunk à chaque image (updateLODs dans
+Forest.jsx), le client peut charger pour chaque segment du trajet la liste des
+chunks et des instances visibles, et l'échanger selon la position du scroll.
+
+Trajet échantillonné (JSON : liste d'échantillons ou {'samples': [...], 'fov': ...}
+avec les valeurs communes au niveau du document ; CSV : une ligne par échantillon) :
+
+    t           position de scroll (facultatif, sinon répartie sur [0, 1])
+    x, y, z     position de la caméra
+    qx, qy, qz, qw  ou  rotationX, rotationY, rotationZ (Euler 'XYZ')
+    fov, aspect, near, far  (facultatifs, FOV vertical en degrés)
+
+Chaque segment regroupe samples_per_segment intervalles consécutifs ; un chunk ou
+une instance y est visible si sa sphère englobante coupe le frustum d'au moins
+un échantillon (tests vectorisés échantillons x sphères). Le frustum est élargi
+de l'amplitude du regard à la souris (mouseLook de CameraAnimatorGLB) : la
+table est donc prudente tant que le trajet est échantillonné finement.
+
+Sortie compacte : la table des identifiants de chunks (`${groupe}_${cx}_${cz}`,
+sphère de Forest.jsx : centre du chunk au sol, rayon CHUNK_SIZE x √2) puis, par
+segment, des plages [début, nombre] d'indices de chunks et, par catégorie,
+d'indices d'instances dans le fichier de positions fourni.
+"""
+import csv
+import json
+import math
+import os
+from typing import Dict, Any, List, Tuple
+
+import numpy as np
+
+from chunkManifest import CHUNK_SIZE, UNDEFINED_CATEGORY, chunk_coordinates, object_type_group
+from clearerProfile import get_profiler
+from clearerReport import logger
+from instanceBounds import BOUNDING_RADII, DEFAULT_BOUNDING_RADIUS
+from instanceMatrices import euler_xyz_to_quaternions, quaternions_to_rotation_matrices
+from overlapCulling import instance_radii
+from positionArrays import PositionArrays
+
+VISIBILITY_VERSION = 1
+
+# Réglages de la caméra (guiConfig.camera.settings et Camera.jsx)
+DEFAULT_FOV = 30.0
+DEFAULT_ASPECT = 16 / 9
+DEFAULT_NEAR = 0.1
+DEFAULT_FAR = 55.0
+
+# Amplitude du regard à la souris (CameraAnimatorGLB.mouseLook : maxRotationX, maxRotationY)
+MOUSE_LOOK_PITCH = math.pi / 16
+MOUSE_LOOK_YAW = math.pi / 9
+
+SAMPLES_PER_SEGMENT = 8
+
+# Nombre maximal de tests échantillon x sphère évalués à la fois (borne la mémoire)
+MAX_MASK_ELEMENTS = 1 << 22
+
+# Garde l'angle d'ouverture élargi sous 90° (tangente finie)
+MAX_HALF_ANGLE = math.pi / 2 - 1e-6
+
+PATH_FIELDS = ('fov', 'aspect', 'near', 'far')
+
+
+def _read_samples(input_file: str) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    if os.path.splitext(input_file)[1].lower() == '.csv':
+        with open(input_file, 'r', encoding='utf-8', newline='') as f:
+            rows = list(csv.DictReader(f))
+        samples = [{key: float(value) for key, value in row.items() if value not in (None, '')} for row in rows]
+        return samples, {}
+
+    with open(input_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        return data.get('samples', []), {key: data[key] for key in PATH_FIELDS if key in data}
+    return data, {}
+
+
+def load_camera_path(input_file: str, **defaults) -> Dict[str, np.ndarray]:
+    """
+    Lit un trajet de caméra échantillonné (JSON ou CSV, voir l'en-tête du module).
+
+    Args:
+        input_file: Fichier du trajet
+        defaults: Valeurs de fov, aspect, near, far pour les échantillons qui ne
+            les précisent pas (après celles du document JSON)
+
+    Returns:
+        Colonnes 't' (n,), 'position' (n, 3), 'rotation' (n, 3, 3) et une colonne
+        par champ de PATH_FIELDS
+    """
+    samples, document_defaults = _read_samples(input_file)
+    if not samples:
+        raise ValueError(f"Aucun échantillon de caméra dans {input_file}")
+
+    fallback = {'fov': DEFAULT_FOV, 'aspect': DEFAULT_ASPECT, 'near': DEFAULT_NEAR, 'far': DEFAULT_FAR}
+    fallback.update({key: value for key, value in defaults.items() if value is not None})
+    fallback.update(document_defaults)
+
+    def column(key, default=None):
+        values = [sample.get(key, default) for sample in samples]
+        if any(value is None for value in values):
+            raise ValueError(f"Champ '{key}' manquant dans un échantillon de {input_file}")
+        return np.array(values, dtype=np.float64)
+
+    if all('qw' in sample for sample in samples):
+        quaternions = np.stack([column(key) for key in ('qx', 'qy', 'qz', 'qw')], axis=1)
+        quaternions /= np.linalg.norm(quaternions, axis=1, keepdims=True)
+    else:
+        quaternions = euler_xyz_to_quaternions(*(column(key, 0.0) for key in ('rotationX', 'rotationY', 'rotationZ')))
+
+    path = {
+        't': column('t') if all('t' in sample for sample in samples) else np.linspace(0.0, 1.0, len(samples)),
+        'position': np.stack([column(key) for key in ('x', 'y', 'z')], axis=1),
+        'rotation': quaternions_to_rotation_matrices(quaternions),
+    }
+    for key in PATH_FIELDS:
+        path[key] = column(key, fallback[key])
+    return path
+
+
+def frustum_mask(path: Dict[str, np.ndarray],
+                 rows: np.ndarray,
+                 centers: np.ndarray,
+                 radii: np.ndarray,
+                 look_margin: Tuple[float, float] = (MOUSE_LOOK_PITCH, MOUSE_LOOK_YAW),
+                 max_distance: float = None) -> np.ndarray:
+    """
+    Teste des sphères contre le frustum de plusieurs échantillons du trajet.
+
+    Même critère que THREE.Frustum.intersectsSphere : la sphère est visible si
+    sa distance signée à chacun des six plans est supérieure à -rayon.
+
+    Args:
+        path: Trajet (load_camera_path)
+        rows: Indices des échantillons testés
+        centers: Centres des sphères (n, 3)
+        radii: Rayons des sphères (n,)
+        look_margin: Élargissement (vertical, horizontal) des demi-angles d'ouverture en radians
+        max_distance: Distance maximale entre la caméra et la sphère (None = plan far seul)
+
+    Returns:
+        Masque (len(rows), n)
+    """
+    position = path['position'][rows]
+    rotation = path['rotation'][rows]
+    # Repère caméra de Three.js : X à droite, Y en haut, regard vers -Z
+    right, up, forward = rotation[:, :, 0], rotation[:, :, 1], -rotation[:, :, 2]
+
+    x = right @ centers.T - (right * position).sum(axis=1)[:, None]
+    y = up @ centers.T - (up * position).sum(axis=1)[:, None]
+    depth = forward @ centers.T - (forward * position).sum(axis=1)[:, None]
+    r = radii[None, :]
+
+    half_vertical = np.radians(path['fov'][rows]) / 2
+    half_horizontal = np.arctan(np.tan(half_vertical) * path['aspect'][rows])
+    half_vertical = np.minimum(half_vertical + look_margin[0], MAX_HALF_ANGLE)[:, None]
+    half_horizontal = np.minimum(half_horizontal + look_margin[1], MAX_HALF_ANGLE)[:, None]
+
+    visible = (depth - path['near'][rows][:, None] >= -r) & (path['far'][rows][:, None] - depth >= -r)
+    # Plans latéraux symétriques : gauche et droite (resp. haut et bas) en un seul test sur |x|
+    visible &= np.sin(half_horizontal) * depth - np.cos(half_horizontal) * np.abs(x) >= -r
+    visible &= np.sin(half_vertical) * depth - np.cos(half_vertical) * np.abs(y) >= -r
+    if max_distance is not None:
+        visible &= np.sqrt(x * x + y * y + depth * depth) - r < max_distance
+    return visible
+
+
+def segment_rows(sample_count: int, samples_per_segment: int = SAMPLES_PER_SEGMENT) -> List[np.ndarray]:
+    """
+    Échantillons de chaque segment ; deux segments consécutifs partagent leur échantillon de bord.
+    """
+    if sample_count == 1:
+        return [np.zeros(1, dtype=np.int64)]
+    starts = range(0, sample_count - 1, samples_per_segment)
+    return [np.arange(start, min(start + samples_per_segment, sample_count - 1) + 1) for start in starts]
+
+
+def index_runs(mask: np.ndarray) -> List[List[int]]:
+    """
+    Plages [début, nombre] des indices à True d'un masque.
+    """
+    edges = np.diff(np.concatenate([[0], mask.astype(np.int8), [0]]))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    return [[int(start), int(end - start)] for start, end in zip(starts, ends)]
+
+
+def _any_visible(path, rows, centers, radii, look_margin, max_distance) -> np.ndarray:
+    visible = np.zeros(len(centers), dtype=bool)
+    batch = max(1, MAX_MASK_ELEMENTS // len(rows))
+    for start in range(0, len(centers), batch):
+        end = start + batch
+        mask = frustum_mask(path, rows, centers[start:end], radii[start:end], look_margin, max_distance)
+        visible[start:end] = mask.any(axis=0)
+    return visible
+
+
+def chunk_spheres(categories: Dict[str, PositionArrays],
+                  chunk_size: float = CHUNK_SIZE) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """
+    Identifiants des chunks de Forest.jsx et leur sphère englobante (userData.boundingSphere).
+
+    Returns:
+        (identifiants dans l'ordre de première apparition, centres (n, 3), rayons (n,))
+    """
+    ids = {}
+    for category, arrays in categories.items():
+        if category == UNDEFINED_CATEGORY or arrays.count == 0:
+            continue
+        group = object_type_group(category)
+        chunk_x, chunk_z = chunk_coordinates(arrays, chunk_size)
+        for cx, cz in zip(chunk_x.tolist(), chunk_z.tolist()):
+            ids.setdefault(f"{group}_{cx}_{cz}", (cx, cz))
+
+    cells = np.array(list(ids.values()), dtype=np.float64).reshape(-1, 2)
+    centers = np.stack([(cells[:, 0] + 0.5) * chunk_size, np.zeros(len(cells)), (cells[:, 1] + 0.5) * chunk_size], axis=1)
+    return list(ids), centers, np.full(len(cells), chunk_size * math.sqrt(2))
+
+
+def compute_visibility(categories: Dict[str, PositionArrays],
+                       path: Dict[str, np.ndarray],
+                       samples_per_segment: int = SAMPLES_PER_SEGMENT,
+                       look_margin: Tuple[float, float] = (MOUSE_LOOK_PITCH, MOUSE_LOOK_YAW),
+                       max_distance: float = None,
+                       bounding_radii: Dict[str, float] = None,
+                       chunk_size: float = CHUNK_SIZE) -> Dict[str, Any]:
+    """
+    Construit la table de visibilité par segment du trajet.
+
+    Args:
+        categories: Colonnes par catégorie (indices d'instances relatifs à ces colonnes)
+        path: Trajet de la caméra (load_camera_path)
+        samples_per_segment: Nombre d'intervalles d'échantillons par segment
+        look_margin: Élargissement (vertical, horizontal) du frustum en radians
+        max_distance: Distance de visibilité maximale (None = plan far des échantillons)
+        bounding_radii: Rayons englobants à l'échelle 1 par catégorie (BOUNDING_RADII)
+        chunk_size: Taille des chunks de Forest.jsx
+
+    Returns:
+        {'version', 'chunkSize', 'samplesPerSegment', 'chunks': [identifiants],
+         'segments': [{'start', 'end', 'chunks': plages, 'instances': {catégorie: plages},
+         'visible': nombre d'instances visibles}]}
+    """
+    bounding_radii = BOUNDING_RADII if bounding_radii is None else bounding_radii
+    chunk_ids, chunk_centers, chunk_radii = chunk_spheres(categories, chunk_size)
+
+    spheres = {}
+    for category, arrays in categories.items():
+        if category == UNDEFINED_CATEGORY or arrays.count == 0:
+            continue
+        centers = np.stack([arrays.columns[field] for field in ('x', 'y', 'z')], axis=1).astype(np.float64)
+        radii = instance_radii(arrays, bounding_radii.get(category, DEFAULT_BOUNDING_RADIUS))
+        spheres[category] = (centers, radii)
+
+    segments = []
+    for rows in segment_rows(len(path['t']), samples_per_segment):
+        visible_chunks = _any_visible(path, rows, chunk_centers, chunk_radii, look_margin, max_distance)
+        instances = {}
+        visible = 0
+        for category, (centers, radii) in spheres.items():
+            mask = _any_visible(path, rows, centers, radii, look_margin, max_distance)
+            if mask.any():
+                instances[category] = index_runs(mask)
+                visible += int(mask.sum())
+        segments.append({
+            'start': float(path['t'][rows[0]]),
+            'end': float(path['t'][rows[-1]]),
+            'chunks': index_runs(visible_chunks),
+            'instances': instances,
+            'visible': visible,
+        })
+
+    return {
+        'version': VISIBILITY_VERSION,
+        'chunkSize': chunk_size,
+        'samplesPerSegment': samples_per_segment,
+        'chunks': chunk_ids,
+        'segments': segments,
+    }
+
+
+def process_visibility_file(positions_file: str,
+                            camera_path_file: str,
+                            output_file: str,
+                            **options):
+    """
+    Calcule la table de visibilité d'un fichier de positions le long d'un trajet de caméra.
+
+    Args:
+        positions_file: Positions telles que chargées par Forest.jsx (sortie de
+            clearerForest, indices d'instances relatifs à ce fichier)
+        camera_path_file: Trajet échantillonné (JSON ou CSV)
+        output_file: Table de visibilité (JSON compact)
+        options: Paramètres de compute_visibility
+    """
+    profiler = get_profiler()
+    try:
+        with profiler.stage('load'):
+            with open(positions_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            profiler.count('bytes_read', os.path.getsize(positions_file))
+            path = load_camera_path(camera_path_file)
+
+        if not isinstance(data, dict) or not all(isinstance(objects, list) for objects in data.values()):
+            logger.error("Format JSON non reconnu. Attendu: dict {catégorie: liste d'objets}")
+            return
+
+        categories = {category: PositionArrays.from_objects(objects) for category, objects in data.items()}
+        with profiler.stage('visibility'):
+            document = compute_visibility(categories, path, **options)
+
+        with profiler.stage('write'):
+            with open(output_file, 'w', encoding='utf-8') as f:
+                json.dump(document, f, separators=(',', ':'), ensure_ascii=False)
+            profiler.count('bytes_written', os.path.getsize(output_file))
+
+        total = sum(arrays.count for category, arrays in categories.items() if category != UNDEFINED_CATEGORY)
+        visible = [segment['visible'] for segment in document['segments']]
+        logger.info(f"Échantillons de caméra: {len(path['t'])}")
+        logger.info(f"Segments: {len(visible)}")
+        logger.info(f"Instances visibles par segment: {min(visible)} à {max(visible)}"
+                    f" (moyenne {sum(visible) / len(visible):.0f} sur {total})")
+        logger.info(f"Table de visibilité écrite: {output_file} ({os.path.getsize(output_file)} octets)")
+
+    except FileNotFoundError as e:
+        logger.error(f"Fichier {e.filename} non trouvé")
+    except json.JSONDecodeError:
+        logger.error(f"Erreur de format JSON dans {positions_file} ou {camera_path_file}")
+    except Exception as e:
+        logger.error(f"Erreur: {e}")
+
+
+if __name__ == "__main__":
+    # Trajet exporté depuis l'animation de la caméra (position, quaternion, fov par échantillon)
+    process_visibility_file('output_treePositions.json',
+                            'cameraPath.json',
+                            'output_treeVisibility.json',
+                            samples_per_segment=SAMPLES_PER_SEGMENT)
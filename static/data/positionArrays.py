@@ -0,0 +1,334 @@
+"""
+Représentation colonnaire (NumPy) des positions exportées depuis Blender.
+
+Chaque catégorie est convertie en tableaux contigus (x, y, z, rotation*, scale*)
+pour que les distances et les transformations s'appliquent sur tout le tableau
+d'un coup au lieu d'objet par objet. Nécessite numpy.
+
+Deux schémas d'export sont reconnus et restitués à l'identique :
+- plat (treePositions.json) : {'x', 'y', 'z', 'rotationX', ..., 'scaleZ'}
+- imbriqué (templatePositions.json) : {'id', 'name', 'template', 'position': {x, y, z},
+  'rotation': {y}, 'scale': {x, y, z}}
+"""
+from typing import List, Dict, Any, Tuple
+
+import numpy as np
+
+POSITION_FIELDS = ('x', 'y', 'z')
+ROTATION_FIELDS = ('rotationX', 'rotationY', 'rotationZ')
+SCALE_FIELDS = ('scaleX', 'scaleY', 'scaleZ')
+FIELDS = POSITION_FIELDS + ROTATION_FIELDS + SCALE_FIELDS
+
+SCHEMA_FLAT = 'flat'
+SCHEMA_NESTED = 'nested'
+
+# Schéma imbriqué : colonne -> (groupe, axe)
+NESTED_FIELDS = {
+    'x': ('position', 'x'), 'y': ('position', 'y'), 'z': ('position', 'z'),
+    'rotationX': ('rotation', 'x'), 'rotationY': ('rotation', 'y'), 'rotationZ': ('rotation', 'z'),
+    'scaleX': ('scale', 'x'), 'scaleY': ('scale', 'y'), 'scaleZ': ('scale', 'z'),
+}
+NESTED_GROUPS = ('position', 'rotation', 'scale')
+
+
+def detect_schema(objects: List[Dict[str, Any]]) -> str:
+    """
+    Schéma d'une liste d'objets position (d'après le premier objet).
+    """
+    for obj in objects:
+        return SCHEMA_NESTED if isinstance(obj.get('position'), dict) else SCHEMA_FLAT
+    return SCHEMA_FLAT
+
+
+def object_position(obj: Dict[str, Any]) -> Tuple[float, float, float]:
+    """
+    Position (x, y, z) d'un objet, quel que soit son schéma.
+    """
+    position = obj.get('position')
+    if isinstance(position, dict):
+        return position['x'], position['y'], position['z']
+    return obj['x'], obj['y'], obj['z']
+
+
+class PositionArrays:
+    """
+    Colonnes numériques d'une liste d'objets position.
+
+    columns: un tableau par champ présent dans au moins un objet
+    present: masque booléen par champ (None si le champ est présent partout)
+    extras: clés non numériques à reporter telles quelles (None si aucune)
+    ids: identifiants entiers des instances (schéma imbriqué), None si absents
+    schema: SCHEMA_FLAT ou SCHEMA_NESTED, schéma restitué par to_objects
+    filled: masque par axe de rotation complété par 0 (absent de l'export imbriqué,
+        omis à nouveau en sortie s'il vaut toujours 0)
+    """
+
+    def __init__(self,
+                 columns: Dict[str, np.ndarray],
+                 count: int,
+                 present: Dict[str, np.ndarray] = None,
+                 extras: List[Dict[str, Any]] = None,
+                 ids: np.ndarray = None,
+                 schema: str = SCHEMA_FLAT,
+                 filled: Dict[str, np.ndarray] = None):
+        self.columns = columns
+        self.count = count
+        self.present = present or {}
+        self.extras = extras
+        self.ids = ids
+        self.schema = schema
+        self.filled = filled or {}
+
+    @classmethod
+    def from_objects(cls, objects: List[Dict[str, Any]], dtype=np.float64) -> 'PositionArrays':
+        """
+        Convertit une liste d'objets JSON en colonnes (schéma détecté automatiquement).
+
+        Args:
+            objects: Liste des objets ({'x', 'y', 'z', 'rotationX', ..., 'scaleZ'} ou
+                {'id', 'position': {...}, 'rotation': {...}, 'scale': {...}})
+            dtype: np.float64 (valeurs identiques au JSON) ou np.float32 (plus compact)
+        """
+        if detect_schema(objects) == SCHEMA_NESTED:
+            return cls._from_nested(objects, dtype)
+
+        count = len(objects)
+        columns = {}
+        present = {}
+
+        for field in FIELDS:
+            values = [obj.get(field) for obj in objects]
+            missing = [value is None for value in values]
+            if all(missing):
+                continue
+            if any(missing):
+                present[field] = ~np.array(missing, dtype=bool)
+                values = [np.nan if value is None else value for value in values]
+            columns[field] = np.array(values, dtype=dtype)
+
+        extras = None
+        if any(len(obj) > sum(field in obj for field in FIELDS) for obj in objects):
+            extras = [{key: value for key, value in obj.items() if key not in FIELDS} for obj in objects]
+
+        return cls(columns, count, present, extras)
+
+    @classmethod
+    def _from_nested(cls, objects: List[Dict[str, Any]], dtype) -> 'PositionArrays':
+        count = len(objects)
+        columns = {}
+        present = {}
+        filled = {}
+        empty = {}
+
+        for field, (group, axis) in NESTED_FIELDS.items():
+            values = [(obj.get(group) or empty).get(axis) for obj in objects]
+            missing = [value is None for value in values]
+            if group == 'rotation':
+                # Axes de rotation absents (rotation: {y}) : 0, comme dans Three.js
+                if any(missing):
+                    filled[field] = np.array(missing, dtype=bool)
+                    values = [0.0 if value is None else value for value in values]
+            elif all(missing):
+                continue
+            elif any(missing):
+                present[field] = ~np.array(missing, dtype=bool)
+                values = [np.nan if value is None else value for value in values]
+            columns[field] = np.array(values, dtype=dtype)
+
+        ids = None
+        if all(type(obj.get('id')) is int for obj in objects):
+            ids = np.array([obj['id'] for obj in objects], dtype=np.int64)
+
+        skipped = set(NESTED_GROUPS) | ({'id'} if ids is not None else set())
+        extras = None
+        if any(len(obj) > sum(key in obj for key in skipped) for obj in objects):
+            extras = [{key: value for key, value in obj.items() if key not in skipped} for obj in objects]
+
+        return cls(columns, count, present, extras, ids, SCHEMA_NESTED, filled)
+
+    def to_objects(self) -> List[Dict[str, Any]]:
+        """
+        Reconstruit la liste d'objets JSON dans le schéma d'origine (champs dans
+        l'ordre de l'export Blender).
+        """
+        if self.schema == SCHEMA_NESTED:
+            return self._to_nested()
+
+        fields = [field for field in FIELDS if field in self.columns]
+        values = [self.columns[field].tolist() for field in fields]
+        masks = [self.present[field].tolist() if field in self.present else None for field in fields]
+
+        objects = []
+        for i in range(self.count):
+            obj = {}
+            for field, column, mask in zip(fields, values, masks):
+                if mask is None or mask[i]:
+                    obj[field] = column[i]
+            if self.extras is not None:
+                obj.update(self.extras[i])
+            objects.append(obj)
+
+        return objects
+
+    def _to_nested(self) -> List[Dict[str, Any]]:
+        groups = {}
+        for field, (group, axis) in NESTED_FIELDS.items():
+            if field in self.columns:
+                mask = self.present.get(field)
+                filled = self.filled.get(field)
+                groups.setdefault(group, []).append((axis, self.columns[field].tolist(),
+                                                     mask.tolist() if mask is not None else None,
+                                                     filled.tolist() if filled is not None else None))
+        ids = self.ids.tolist() if self.ids is not None else None
+
+        objects = []
+        for i in range(self.count):
+            obj = {'id': ids[i]} if ids is not None else {}
+            if self.extras is not None:
+                obj.update(self.extras[i])
+            for group, axes in groups.items():
+                values = {}
+                for axis, column, mask, filled in axes:
+                    if mask is not None and not mask[i]:
+                        continue
+                    if filled is not None and filled[i] and column[i] == 0.0:
+                        continue
+                    values[axis] = column[i]
+                if values:
+                    obj[group] = values
+            objects.append(obj)
+
+        return objects
+
+    def _derive(self, columns, count, present, extras, ids, filled) -> 'PositionArrays':
+        return PositionArrays(columns, count, present, extras, ids, self.schema, filled)
+
+    def take(self, indices: np.ndarray) -> 'PositionArrays':
+        """
+        Renvoie une copie restreinte aux indices donnés (dans cet ordre).
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        columns = {field: column[indices] for field, column in self.columns.items()}
+        present = {field: mask[indices] for field, mask in self.present.items()}
+        filled = {field: mask[indices] for field, mask in self.filled.items()}
+        extras = [self.extras[i] for i in indices.tolist()] if self.extras is not None else None
+        ids = self.ids[indices] if self.ids is not None else None
+        return self._derive(columns, len(indices), present, extras, ids, filled)
+
+    def block(self, start: int, stop: int) -> 'PositionArrays':
+        """
+        Renvoie une vue (sans copie) sur les objets start..stop : les modifications
+        en place sur la vue s'appliquent aux colonnes d'origine.
+        """
+        columns = {field: column[start:stop] for field, column in self.columns.items()}
+        present = {field: mask[start:stop] for field, mask in self.present.items()}
+        filled = {field: mask[start:stop] for field, mask in self.filled.items()}
+        extras = self.extras[start:stop] if self.extras is not None else None
+        ids = self.ids[start:stop] if self.ids is not None else None
+        return self._derive(columns, len(range(start, min(stop, self.count))), present, extras, ids, filled)
+
+    def has_all(self, fields) -> np.ndarray:
+        """
+        Masque des objets qui possèdent tous les champs donnés.
+        """
+        mask = np.ones(self.count, dtype=bool)
+        for field in fields:
+            if field not in self.columns:
+                return np.zeros(self.count, dtype=bool)
+            if field in self.present:
+                mask &= self.present[field]
+        return mask
+
+    # ------------------------------------------------------------------
+    # Transformations vectorisées (en place, uniquement sur les champs présents)
+    # ------------------------------------------------------------------
+
+    def set_scale(self, value: float):
+        for field in SCALE_FIELDS:
+            if field in self.columns:
+                self.columns[field][self._mask(field)] = value
+
+    def multiply_scale(self, factor: float):
+        for field in SCALE_FIELDS:
+            if field in self.columns:
+                self.columns[field][self._mask(field)] *= factor
+
+    def offset_y(self, offset: float):
+        self.offset_position({'y': offset})
+
+    def offset_position(self, offset: Dict[str, float]):
+        for field in POSITION_FIELDS:
+            if field in self.columns and field in offset:
+                self.columns[field][self._mask(field)] += offset[field]
+
+    def clamp_min_height(self, min_height: float) -> np.ndarray:
+        """
+        Remonte à min_height les objets plus bas.
+
+        Returns:
+            Masque des objets remontés
+        """
+        if 'y' not in self.columns:
+            return np.zeros(self.count, dtype=bool)
+        y = self.columns['y']
+        clamped = y < min_height
+        if 'y' in self.present:
+            clamped &= self.present['y']
+        y[clamped] = min_height
+        return clamped
+
+    def add_rotation(self, rotation_offset: Dict[str, float]):
+        for field in ROTATION_FIELDS:
+            if field in self.columns and field in rotation_offset:
+                self.columns[field][self._mask(field)] += rotation_offset[field]
+
+    def _mask(self, field: str):
+        mask = self.present.get(field)
+        return slice(None) if mask is None else mask
+
+
+# ----------------------------------------------------------------------
+# Distances par lots de paires (i, j)
+# ----------------------------------------------------------------------
+
+def _triplet_distances(arrays: PositionArrays, fields, i: np.ndarray, j: np.ndarray) -> np.ndarray:
+    # Même ordre d'opérations que math.sqrt(dx ** 2 + dy ** 2 + dz ** 2)
+    total = None
+    for field in fields:
+        column = arrays.columns[field]
+        delta = column[i] - column[j]
+        total = delta * delta if total is None else total + delta * delta
+    return np.sqrt(total)
+
+
+def pair_position_distances(arrays: PositionArrays, i: np.ndarray, j: np.ndarray) -> np.ndarray:
+    """
+    Distance euclidienne entre positions pour chaque paire (i[k], j[k]).
+    """
+    return _triplet_distances(arrays, POSITION_FIELDS, i, j)
+
+
+def pair_normalized_distances(arrays: PositionArrays, i: np.ndarray, j: np.ndarray,
+                              max_expected_distance: float) -> np.ndarray:
+    """
+    Équivalent vectorisé de calculate_normalized_distance.
+    """
+    return np.minimum(pair_position_distances(arrays, i, j) / max_expected_distance, 1.0)
+
+
+def pair_weighted_distances(arrays: PositionArrays, i: np.ndarray, j: np.ndarray) -> np.ndarray:
+    """
+    Équivalent vectorisé de calculate_distance (clearerRoof) : position,
+    plus 0.1 x rotation et 0.01 x échelle lorsque les deux objets les possèdent.
+    """
+    total = pair_position_distances(arrays, i, j)
+
+    for fields, weight in ((ROTATION_FIELDS, 0.1), (SCALE_FIELDS, 0.01)):
+        both = arrays.has_all(fields)
+        both = both[i] & both[j]
+        term = np.zeros(len(i), dtype=total.dtype)
+        if both.any():
+            term[both] = _triplet_distances(arrays, fields, i[both], j[both])
+        total = total + (term * weight)
+
+    return total
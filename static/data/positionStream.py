@@ -0,0 +1,200 @@
+"""
+Lecture et écriture en flux des exports de positions volumineux.
+
+Au lieu de json.load sur tout le fichier, les tableaux de chaque catégorie sont
+lus objet par objet, filtrés et transformés par lots, puis écrits en JSON compact
+au fur et à mesure. Seules les positions (x, y, z) des objets conservés restent en
+mémoire pour le filtrage, ainsi que la clé quantifiée de chaque objet lu lorsque
+les doublons sont retirés (duplicate_tolerance, voir duplicateHash.py).
+"""
+import math
+import os
+from typing import Dict, Any, Iterator, List, Tuple
+
+from clearerForest import resolve_config
+from clearerPipeline import Pipeline, build_pipeline, config_to_spec
+from clearerProfile import get_profiler
+from clearerReport import logger
+from duplicateHash import object_key
+from jsonStream import CompactJsonWriter, JsonStreamReader
+from positionArrays import PositionArrays, object_position
+from spatialIndex import MAX_EXPECTED_DISTANCE, GreedyThinner, search_radius
+
+# Nombre d'objets conservés transformés (NumPy) puis écrits ensemble
+STREAM_BATCH_SIZE = 4096
+
+# Paramètres qui demandent toute la catégorie avant de décider (recherche du seuil) :
+# refusés en flux plutôt qu'ignorés
+STREAM_UNSUPPORTED_KEYS = ('budget', 'chunk_budget')
+
+
+def _normalized_tuple_distance(p1: Tuple[float, float, float], p2: Tuple[float, float, float]) -> float:
+    # Même calcul que calculate_normalized_distance, sur des tuples (x, y, z)
+    pos_distance = math.sqrt(
+        (p1[0] - p2[0]) ** 2 +
+        (p1[1] - p2[1]) ** 2 +
+        (p1[2] - p2[2]) ** 2
+    )
+    return min(pos_distance / MAX_EXPECTED_DISTANCE, 1.0)
+
+
+def check_stream_config(config: Dict[str, Any]):
+    """
+    Vérifie qu'une configuration peut être appliquée en flux : seul le mode de
+    sélection 'first' décide objet par objet ('poisson' tire un ordre sur toute la
+    catégorie ; seed et scale_priority n'ont d'effet qu'avec lui).
+
+    Raises:
+        ValueError: budget ou chunk_budget demandé, ou selection différent de 'first'
+    """
+    for key in STREAM_UNSUPPORTED_KEYS:
+        if config.get(key) is not None:
+            raise ValueError(f"'{key}' n'est pas disponible en flux (utilisez clearerForest.process_forest_file)")
+    selection = config.get('selection', 'first')
+    if selection != 'first':
+        raise ValueError(f"Mode de sélection '{selection}' indisponible en flux (seul 'first' l'est, "
+                         f"utilisez clearerForest.process_forest_file)")
+
+
+def iter_kept_batches(objects: Iterator[Dict[str, Any]],
+                      config: Dict[str, Any],
+                      stats: Dict[str, int],
+                      batch_size: int = STREAM_BATCH_SIZE) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Filtre un flux d'objets puis transforme les objets conservés par lots.
+
+    Args:
+        objects: Flux d'objets d'une catégorie (positions ORIGINALES)
+        config: Paramètres (voir clearerForest.DEFAULT_CONFIG)
+        stats: Compteurs mis à jour ('original', 'kept', 'removed', 'duplicates', 'clamped')
+        batch_size: Nombre d'objets conservés par lot
+
+    Returns:
+        Générateur de lots d'objets conservés et modifiés
+
+    Raises:
+        ValueError: paramètre indisponible en flux (voir check_stream_config)
+    """
+    check_stream_config(config)
+    threshold = config['threshold']
+    # Seules les positions (x, y, z) des objets acceptés sont gardées par le filtre
+    thinner = GreedyThinner(threshold, _normalized_tuple_distance, search_radius(threshold))
+    # Doublons retirés avant le filtrage, comme clearerForest.process_category
+    duplicate_tolerance = config.get('duplicate_tolerance') if threshold > 0 else None
+    seen = set()
+
+    transforms = build_pipeline(config_to_spec(config, include_dedupe=False))
+
+    batch = []
+    for obj in objects:
+        stats['original'] += 1
+        if duplicate_tolerance is not None:
+            key = object_key(obj, duplicate_tolerance)
+            if key in seen:
+                stats['removed'] += 1
+                stats['duplicates'] += 1
+                continue
+            seen.add(key)
+
+        position = object_position(obj)
+        closest_index, _ = thinner.offer(position, position[0], position[2])
+        if closest_index != -1:
+            stats['removed'] += 1
+            continue
+
+        stats['kept'] += 1
+        batch.append(obj)
+        if len(batch) >= batch_size:
+            yield _transform_batch(batch, transforms, stats)
+            batch = []
+
+    if batch:
+        yield _transform_batch(batch, transforms, stats)
+
+
+def _transform_batch(batch: List[Dict[str, Any]], transforms: Pipeline, stats: Dict[str, int]):
+    arrays, batch_stats = transforms.run(PositionArrays.from_objects(batch))
+    stats['clamped'] += batch_stats['clamped']
+    return arrays.to_objects()
+
+
+def stream_process_file(input_file: str,
+                        output_file: str,
+                        category_config: Dict[str, Dict[str, Any]] = None,
+                        default_config: Dict[str, Any] = None,
+                        batch_size: int = STREAM_BATCH_SIZE) -> Dict[str, Dict[str, int]]:
+    """
+    Traite un export de positions en flux (lecture, filtrage, modifications, écriture).
+
+    Même résultat que process_forest_file (sans niveaux de densité ni sorties
+    annexes), mais la sortie est du JSON compact et le document n'est jamais
+    chargé entièrement en mémoire. Les budgets et le mode 'poisson' ne sont pas
+    disponibles (voir check_stream_config).
+
+    Args:
+        input_file: Fichier JSON d'entrée (dict de catégories, liste ou {'objects': [...]})
+        output_file: Fichier JSON compact de sortie
+        category_config: Paramètres par catégorie
+        default_config: Paramètres pour les catégories non configurées
+        batch_size: Nombre d'objets conservés transformés ensemble
+
+    Returns:
+        Statistiques par catégorie
+
+    Raises:
+        ValueError: paramètre indisponible en flux (voir check_stream_config)
+    """
+    # Vérifié avant d'ouvrir la sortie : pas de fichier tronqué par un paramètre refusé
+    for name in [None, *(category_config or {})]:
+        check_stream_config(resolve_config(name, category_config, default_config))
+
+    all_stats = {}
+    profiler = get_profiler()
+
+    # Lecture, filtrage et écriture sont entrelacées : une seule étape 'stream'
+    # (les transformations par lot y apparaissent comme sous-étapes)
+    with profiler.stage('stream'), open(input_file, 'r', encoding='utf-8') as source:
+        reader = JsonStreamReader(source)
+        top_level_list = reader.peek() == '['
+
+        with open(output_file, 'w', encoding='utf-8') as target:
+            writer = CompactJsonWriter(target, top_level_list)
+            writer.begin()
+
+            for category, content in reader.categories():
+                if not isinstance(content, Iterator):
+                    writer.value(category, content)
+                    continue
+
+                name = 'objects' if category is None else category
+                config = resolve_config(name, category_config, default_config)
+                stats = all_stats[name] = {'original': 0, 'kept': 0, 'removed': 0, 'duplicates': 0, 'clamped': 0}
+
+                writer.begin_array(category)
+                for batch in iter_kept_batches(content, config, stats, batch_size):
+                    writer.items(batch)
+                writer.end_array()
+
+            writer.end()
+
+    profiler.count('bytes_read', os.path.getsize(input_file))
+    profiler.count('bytes_written', os.path.getsize(output_file))
+    return all_stats
+
+
+if __name__ == "__main__":
+    # Configuration par catégorie (modifiez ces valeurs selon vos besoins)
+    CATEGORY_CONFIG = {
+        'TreeRoof': {'threshold': 0.02, 'min_height': 5.25},
+        'TrunkThin': {'threshold': 0.001},
+        'BranchTree': {'threshold': 0.001},
+    }
+
+    stats = stream_process_file('treePositions.json',
+                                'output_treePositions.min.json',
+                                category_config=CATEGORY_CONFIG)
+
+    logger.info(f"\n--- Résumé par catégorie ---")
+    for category, category_stats in stats.items():
+        logger.info(f"{category}: {category_stats['kept']}/{category_stats['original']} conservés "
+                    f"({category_stats['removed']} supprimés)")
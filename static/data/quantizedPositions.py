@@ -0,0 +1,274 @@
+"""
+Encodage compact et quantifié des instances pour le chargement dans Forest.jsx.
+
+Au lieu de doubles à 17 chiffres, chaque catégorie est écrite en entiers :
+- positions : décalages en virgule fixe par rapport à l'origine de leur chunk
+  (x = chunkX * chunkSize + qx * positionStep, y = qy * positionStep, z idem),
+  les instances étant regroupées par chunk (même ordre que chunkManifest) ;
+- rotations : quaternion normalisé (Euler 'XYZ') encodé "smallest three" dans un
+  entier : index de la plus grande composante sur 2 bits puis les trois autres
+  sur quaternionBits bits chacune, dans [-1/√2, 1/√2] ;
+- échelles : un scalaire pour toute la catégorie ('scale') si les instances sont
+  quasi uniformes, sinon un entier par instance ('scales') ou par axe ('scales3').
+
+Les tolérances (unités de scène, radians, unités d'échelle) fixent les pas de
+quantification ; le document décodé est vérifié contre les valeurs d'origine et
+les erreurs maximales obtenues sont écrites dans le document ('errors').
+"""
+import json
+import math
+from typing import Dict, Any, Tuple
+
+import numpy as np
+
+from chunkManifest import CHUNK_SIZE, chunk_order
+from instanceMatrices import instance_components
+from positionArrays import PositionArrays
+
+QUANTIZED_VERSION = 1
+
+DEFAULT_POSITION_TOLERANCE = 1e-3
+DEFAULT_ROTATION_TOLERANCE = 2e-3
+DEFAULT_SCALE_TOLERANCE = 1e-3
+
+# Bornes du nombre de bits par composante (2 + 3 x 16 = 50 bits : entier exact en JS)
+MIN_QUATERNION_BITS = 6
+MAX_QUATERNION_BITS = 16
+
+# Marge relative des vérifications (arrondis flottants du décodage)
+VALIDATION_SLACK = 1e-9
+
+_SQRT1_2 = math.sqrt(0.5)
+
+
+def encode_quaternions(quaternions: np.ndarray, bits: int) -> np.ndarray:
+    """
+    Encode des quaternions (n, 4) en entiers "smallest three".
+    """
+    q = quaternions / np.linalg.norm(quaternions, axis=1, keepdims=True)
+    rows = np.arange(len(q))
+    largest = np.argmax(np.abs(q), axis=1)
+    # q et -q représentent la même rotation : la plus grande composante est rendue positive
+    q = q * np.where(q[rows, largest] < 0, -1.0, 1.0)[:, None]
+
+    others = q[np.arange(4)[None, :] != largest[:, None]].reshape(-1, 3)
+    levels = (1 << bits) - 1
+    components = np.rint((np.clip(others, -_SQRT1_2, _SQRT1_2) + _SQRT1_2) / (2 * _SQRT1_2) * levels)
+    components = components.astype(np.int64)
+
+    packed = largest.astype(np.int64)
+    for k in range(3):
+        packed = (packed << bits) | components[:, k]
+    return packed
+
+
+def decode_quaternions(packed: np.ndarray, bits: int) -> np.ndarray:
+    """
+    Décode des entiers "smallest three" en quaternions (n, 4) normalisés.
+    """
+    packed = np.asarray(packed, dtype=np.int64)
+    levels = (1 << bits) - 1
+    others = np.empty((len(packed), 3), dtype=np.float64)
+    for k in range(3):
+        shift = bits * (2 - k)
+        others[:, k] = ((packed >> shift) & levels) / levels * (2 * _SQRT1_2) - _SQRT1_2
+    largest = packed >> (3 * bits)
+
+    q = np.empty((len(packed), 4), dtype=np.float64)
+    mask = np.arange(4)[None, :] != largest[:, None]
+    q[mask] = others.reshape(-1)
+    q[np.arange(len(q)), largest] = np.sqrt(np.maximum(0.0, 1.0 - (others * others).sum(axis=1)))
+    return q
+
+
+def quaternion_angles(q1: np.ndarray, q2: np.ndarray) -> np.ndarray:
+    """
+    Angle (radians) de la rotation qui sépare chaque paire de quaternions unitaires.
+    """
+    dots = np.abs((q1 * q2).sum(axis=1))
+    return 2.0 * np.arccos(np.minimum(dots, 1.0))
+
+
+def _within(error: float, tolerance: float) -> bool:
+    return error <= tolerance * (1.0 + VALIDATION_SLACK)
+
+
+def _encode_rotations(quaternions: np.ndarray, tolerance: float) -> Tuple[int, np.ndarray, float]:
+    # Plus petit nombre de bits respectant la tolérance sur les données réelles
+    unit = quaternions / np.linalg.norm(quaternions, axis=1, keepdims=True)
+    for bits in range(MIN_QUATERNION_BITS, MAX_QUATERNION_BITS + 1):
+        packed = encode_quaternions(unit, bits)
+        error = float(quaternion_angles(unit, decode_quaternions(packed, bits)).max(initial=0.0))
+        if _within(error, tolerance):
+            return bits, packed, error
+    raise ValueError(f"Tolérance de rotation {tolerance} inatteignable avec {MAX_QUATERNION_BITS} bits")
+
+
+def _encode_scales(scales: np.ndarray, tolerance: float) -> Dict[str, Any]:
+    if not len(scales):
+        return {'scale': 1.0}
+
+    # Un scalaire pour toute la catégorie
+    low, high = float(scales.min()), float(scales.max())
+    if _within((high - low) / 2, tolerance):
+        return {'scale': (low + high) / 2}
+
+    # Un entier par instance (milieu de ses trois axes), pas = tolérance
+    middle = (scales.min(axis=1) + scales.max(axis=1)) / 2
+    quantized = np.rint(middle / tolerance).astype(np.int64)
+    if _within(float(np.abs(scales - (quantized * tolerance)[:, None]).max()), tolerance):
+        return {'scales': quantized.tolist()}
+
+    # Un entier par axe, pas = 2 x tolérance
+    return {'scales3': np.rint(scales / (2 * tolerance)).astype(np.int64).reshape(-1).tolist()}
+
+
+def _decode_scales(entry: Dict[str, Any], count: int, scale_step: float) -> np.ndarray:
+    if 'scale' in entry:
+        return np.full((count, 3), entry['scale'], dtype=np.float64)
+    if 'scales' in entry:
+        return np.repeat((np.array(entry['scales'], dtype=np.float64) * scale_step)[:, None], 3, axis=1)
+    return np.array(entry['scales3'], dtype=np.float64).reshape(-1, 3) * (2 * scale_step)
+
+
+def encode_category(arrays: PositionArrays,
+                    chunk_size: float = CHUNK_SIZE,
+                    position_tolerance: float = DEFAULT_POSITION_TOLERANCE,
+                    rotation_tolerance: float = DEFAULT_ROTATION_TOLERANCE,
+                    scale_tolerance: float = DEFAULT_SCALE_TOLERANCE) -> Dict[str, Any]:
+    """
+    Encode une catégorie (instances regroupées par chunk, voir chunkManifest.chunk_order).
+    """
+    if arrays.count == 0:
+        return {'count': 0, 'chunks': [], 'positions': [], 'quaternionBits': MIN_QUATERNION_BITS,
+                'rotations': [], 'scale': 1.0}
+
+    order, chunk_keys, counts = chunk_order(arrays, chunk_size)
+    arrays = arrays.take(order)
+    positions, quaternions, scales = instance_components(arrays)
+
+    step = 2 * position_tolerance
+    origins = np.zeros_like(positions)
+    origins[:, [0, 2]] = np.repeat(chunk_keys, counts, axis=0) * chunk_size
+    quantized = np.rint((positions - origins) / step).astype(np.int64)
+
+    bits, packed, _ = _encode_rotations(quaternions, rotation_tolerance)
+
+    entry = {
+        'count': arrays.count,
+        'chunks': [[cx, cz, count] for (cx, cz), count in zip(chunk_keys.tolist(), counts.tolist())],
+        'positions': quantized.reshape(-1).tolist(),
+        'quaternionBits': bits,
+        'rotations': packed.tolist(),
+    }
+    entry.update(_encode_scales(scales, scale_tolerance))
+    if arrays.ids is not None:
+        entry['ids'] = arrays.ids.tolist()
+    return entry
+
+
+def decode_category(entry: Dict[str, Any], document: Dict[str, Any]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Décode une catégorie (même calcul que le chargeur côté Three.js).
+
+    Returns:
+        (positions (n, 3), quaternions (n, 4), scales (n, 3))
+    """
+    count = entry['count']
+    chunk_size = document['chunkSize']
+    chunks = np.array(entry['chunks'], dtype=np.int64).reshape(-1, 3)
+
+    origins = np.zeros((count, 3), dtype=np.float64)
+    origins[:, [0, 2]] = np.repeat(chunks[:, :2], chunks[:, 2], axis=0) * chunk_size
+    positions = origins + np.array(entry['positions'], dtype=np.float64).reshape(-1, 3) * document['positionStep']
+
+    quaternions = decode_quaternions(np.array(entry['rotations'], dtype=np.int64), entry['quaternionBits'])
+    scales = _decode_scales(entry, count, document['scaleStep'])
+    return positions, quaternions, scales
+
+
+def encode_quantized(categories: Dict[str, PositionArrays],
+                     chunk_size: float = CHUNK_SIZE,
+                     position_tolerance: float = DEFAULT_POSITION_TOLERANCE,
+                     rotation_tolerance: float = DEFAULT_ROTATION_TOLERANCE,
+                     scale_tolerance: float = DEFAULT_SCALE_TOLERANCE) -> Dict[str, Any]:
+    """
+    Encode toutes les catégories puis vérifie le résultat décodé.
+
+    Args:
+        categories: Colonnes par catégorie
+        chunk_size: Taille des chunks servant d'origine aux positions
+        position_tolerance: Erreur maximale sur chaque coordonnée (unités de scène)
+        rotation_tolerance: Erreur angulaire maximale (radians)
+        scale_tolerance: Erreur maximale sur chaque axe d'échelle
+
+    Returns:
+        Document JSON (voir l'en-tête du module)
+
+    Raises:
+        ValueError: si une tolérance est dépassée après décodage
+    """
+    document = {
+        'version': QUANTIZED_VERSION,
+        'chunkSize': chunk_size,
+        'positionStep': 2 * position_tolerance,
+        'scaleStep': scale_tolerance,
+        'categories': {},
+    }
+    for category, arrays in categories.items():
+        document['categories'][category] = encode_category(arrays, chunk_size, position_tolerance,
+                                                           rotation_tolerance, scale_tolerance)
+
+    document['errors'] = validate_quantized(document, categories, chunk_size, position_tolerance,
+                                            rotation_tolerance, scale_tolerance)
+    return document
+
+
+def validate_quantized(document: Dict[str, Any],
+                       categories: Dict[str, PositionArrays],
+                       chunk_size: float = CHUNK_SIZE,
+                       position_tolerance: float = DEFAULT_POSITION_TOLERANCE,
+                       rotation_tolerance: float = DEFAULT_ROTATION_TOLERANCE,
+                       scale_tolerance: float = DEFAULT_SCALE_TOLERANCE) -> Dict[str, float]:
+    """
+    Décode le document et compare chaque instance à sa valeur d'origine.
+
+    Returns:
+        Erreurs maximales {'position', 'rotation', 'scale'}
+
+    Raises:
+        ValueError: si une tolérance est dépassée
+    """
+    errors = {'position': 0.0, 'rotation': 0.0, 'scale': 0.0}
+    for category, arrays in categories.items():
+        if arrays.count == 0:
+            continue
+        order, _, _ = chunk_order(arrays, chunk_size)
+        positions, quaternions, scales = instance_components(arrays.take(order))
+        quaternions = quaternions / np.linalg.norm(quaternions, axis=1, keepdims=True)
+        decoded = decode_category(document['categories'][category], document)
+
+        errors['position'] = max(errors['position'], float(np.abs(decoded[0] - positions).max()))
+        errors['rotation'] = max(errors['rotation'], float(quaternion_angles(decoded[1], quaternions).max()))
+        errors['scale'] = max(errors['scale'], float(np.abs(decoded[2] - scales).max()))
+
+    tolerances = {'position': position_tolerance, 'rotation': rotation_tolerance, 'scale': scale_tolerance}
+    exceeded = [f"{name} {errors[name]:.3g} > {tolerances[name]:.3g}"
+                for name in errors if not _within(errors[name], tolerances[name])]
+    if exceeded:
+        raise ValueError(f"Tolérance de quantification dépassée: {', '.join(exceeded)}")
+    return errors
+
+
+def write_quantized(output_file: str, categories: Dict[str, PositionArrays], **tolerances) -> int:
+    """
+    Écrit le document quantifié en JSON compact.
+
+    Returns:
+        Taille du fichier en octets
+    """
+    document = encode_quantized(categories, **tolerances)
+    text = json.dumps(document, separators=(',', ':'), ensure_ascii=False)
+    with open(output_file, 'w', encoding='utf-8') as f:
+        f.write(text)
+    return len(text.encode('utf-8'))
@@ -0,0 +1,1118 @@
+import heapq
+import math
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple, Any
+
+import numpy as np
+
+# Distance maximale attendue utilisée par calculate_normalized_distance
+MAX_EXPECTED_DISTANCE = 200.0
+
+# Marge relative ajoutée au rayon de recherche pour absorber les arrondis
+# (d / 200 < seuil n'implique pas toujours exactement d < seuil * 200)
+RADIUS_EPSILON = 1e-9
+
+# Nombre d'objets requêtés par lot lors de la génération des paires candidates
+PAIR_BATCH_SIZE = 65536
+
+# Nombre maximal de cellules par axe (évite le débordement des clés entières)
+MAX_CELLS_PER_AXIS = 1 << 24
+
+# Nombre maximal de paires candidates produites à la fois (borne la mémoire des lots)
+MAX_PAIRS_PER_CHUNK = 1 << 22
+
+# Nombre maximal d'objets d'un lot départagés entre eux par greedy_thin (ceux
+# qu'aucun objet déjà conservé ne bloque) : borne les paires internes au lot
+MAX_BLOCK_SURVIVORS = 1024
+
+# Proportion d'objets d'un lot non bloqués au-delà de laquelle la limite de
+# survivants double au lot suivant (export clairsemé : presque tout est conservé)
+SPARSE_SURVIVOR_RATIO = 0.5
+
+# Paires par survivant tolérées dans les cellules d'un lot élargi (au-delà, le lot
+# revient à MAX_BLOCK_SURVIVORS survivants)
+SPARSE_PAIRS_PER_SURVIVOR = 4
+
+# Part minimale des objets en attente décidés par tour de resolve_first_wins ;
+# en dessous (longues chaînes de dépendances), le reste est résolu par le parcours séquentiel
+MIN_ROUND_PROGRESS = 0.01
+
+# Niveaux de densité par défaut (proportion d'instances conservées par niveau)
+DEFAULT_TIER_FRACTIONS = (1.0, 0.5, 0.1)
+
+# Nombre d'itérations de la dichotomie sur le rayon d'un niveau
+TIER_SEARCH_ITERATIONS = 32
+
+# Écart relatif accepté avant complément, pour limiter le nombre d'itérations
+TIER_COUNT_TOLERANCE = 0.01
+
+# Ordre de parcours du filtrage : 'first' (ordre du fichier, le premier rencontré gagne)
+# ou 'poisson' (ordre aléatoire reproductible, ou par taille décroissante)
+SELECTION_MODES = ('first', 'poisson')
+
+# Graine par défaut du mode 'poisson' (même sélection d'une exécution à l'autre)
+DEFAULT_SEED = 0
+
+
+def search_radius(threshold: float,
+                  use_normalized: bool = True,
+                  max_expected_distance: float = MAX_EXPECTED_DISTANCE) -> float:
+    """
+    Convertit un seuil de filtrage en rayon de recherche sur les positions.
+
+    Toute paire d'objets dont la distance (normalisée ou brute) est sous le seuil
+    a forcément une distance de position inférieure à ce rayon.
+
+    Args:
+        threshold: Seuil de proximité utilisé par remove_close_objects
+        use_normalized: True si le seuil s'applique à la distance normalisée
+        max_expected_distance: Distance de normalisation (200 unités par défaut)
+
+    Returns:
+        Rayon de recherche en unités de scène (math.inf si tout est "trop proche")
+    """
+    if use_normalized:
+        # La distance normalisée plafonne à 1.0 : au-delà, tous les objets sont proches
+        if threshold > 1.0:
+            return math.inf
+        radius = threshold * max_expected_distance
+    else:
+        radius = threshold
+
+    return radius * (1.0 + RADIUS_EPSILON)
+
+
+class SpatialGrid:
+    """
+    Grille uniforme sur le plan XZ (sol de la forêt) indexant des objets acceptés.
+
+    La taille de cellule est égale au rayon de recherche : un voisin à moins de ce
+    rayon se trouve toujours dans l'une des 9 cellules autour de la position requêtée.
+    """
+
+    def __init__(self, cell_size: float):
+        self.cell_size = cell_size
+        self.cells: Dict[Tuple[int, int], List[int]] = {}
+
+    def cell_of(self, x: float, z: float) -> Tuple[int, int]:
+        if math.isinf(self.cell_size):
+            return 0, 0
+        return math.floor(x / self.cell_size), math.floor(z / self.cell_size)
+
+    def insert(self, item: int, x: float, z: float):
+        key = self.cell_of(x, z)
+        bucket = self.cells.get(key)
+        if bucket is None:
+            self.cells[key] = [item]
+        else:
+            bucket.append(item)
+
+    def remove(self, item: int, x: float, z: float):
+        # (x, z) : position donnée à l'insertion
+        key = self.cell_of(x, z)
+        bucket = self.cells[key]
+        bucket.remove(item)
+        if not bucket:
+            del self.cells[key]
+
+    def query(self, x: float, z: float) -> Iterator[int]:
+        """
+        Renvoie les éléments des cellules voisines (3x3) de la position donnée.
+        """
+        cx, cz = self.cell_of(x, z)
+        cells = self.cells
+        for dx in (-1, 0, 1):
+            for dz in (-1, 0, 1):
+                bucket = cells.get((cx + dx, cz + dz))
+                if bucket:
+                    yield from bucket
+
+
+class GreedyThinner:
+    """
+    Filtrage glouton incrémental : les objets sont proposés un par un, dans l'ordre.
+
+    Seules les positions des objets acceptés sont indexées, ce qui permet de filtrer
+    un flux d'objets sans garder le document complet en mémoire.
+    """
+
+    def __init__(self,
+                 threshold: float,
+                 distance_func: Callable[[Any, Any], float],
+                 radius: float):
+        self.threshold = threshold
+        self.distance_func = distance_func
+        self.radius = radius
+        self.grid = SpatialGrid(radius) if radius > 0 else None
+        self.accepted: List[Any] = []
+
+    def offer(self, item: Any, x: float, z: float) -> Tuple[int, float]:
+        """
+        Propose un objet (item est passé à distance_func, x/z servent à l'indexation).
+
+        Returns:
+            (closest_index, closest_distance) : closest_index vaut -1 si l'objet est
+            accepté, sinon c'est le rang de l'objet accepté qui le fait supprimer
+        """
+        closest_index = -1
+        closest_distance = math.inf
+
+        # Aucune distance n'est négative : rien ne peut être sous un seuil nul
+        if self.grid is None:
+            self.accepted.append(item)
+            return closest_index, closest_distance
+
+        # Le parcours complet s'arrête sur le premier objet accepté sous le seuil :
+        # c'est donc le plus petit rang parmi les voisins sous le seuil
+        for rank in self.grid.query(x, z):
+            if closest_index != -1 and rank > closest_index:
+                continue
+            distance = self.distance_func(item, self.accepted[rank])
+            if distance < self.threshold:
+                closest_index = rank
+                closest_distance = distance
+
+        if closest_index == -1:
+            self.grid.insert(len(self.accepted), x, z)
+            self.accepted.append(item)
+
+        return closest_index, closest_distance
+
+
+def iter_greedy_decisions(objects: Iterable[Dict[str, Any]],
+                          threshold: float,
+                          distance_func: Callable[[Dict[str, Any], Dict[str, Any]], float],
+                          radius: float) -> Iterator[Tuple[int, int, float]]:
+    """
+    Filtrage glouton "premier rencontré gagne" accéléré par une grille spatiale.
+
+    Produit exactement les mêmes décisions que le parcours de tous les objets déjà
+    acceptés, mais en ne comparant que le voisinage local de chaque objet.
+    distance_func doit être supérieure ou égale à la distance entre positions.
+
+    Args:
+        objects: Objets JSON (positions ORIGINALES), liste ou flux
+        threshold: Seuil de proximité appliqué à distance_func
+        distance_func: Fonction de distance entre deux objets
+        radius: Rayon de recherche sur les positions (voir search_radius)
+
+    Returns:
+        Générateur de tuples (index, closest_index, closest_distance) dans l'ordre
+        des objets. closest_index vaut -1 si l'objet est conservé, sinon c'est le
+        rang (parmi les objets conservés) de l'objet qui l'a fait supprimer.
+    """
+    thinner = GreedyThinner(threshold, distance_func, radius)
+    for i, current_obj in enumerate(objects):
+        closest_index, closest_distance = thinner.offer(current_obj, current_obj['x'], current_obj['z'])
+        yield i, closest_index, closest_distance
+
+
+def cell_keys(x: np.ndarray, z: np.ndarray, cell_size: float) -> Tuple[np.ndarray, int]:
+    """
+    Clé de la cellule (carrée, de côté cell_size) de chaque objet sur le plan XZ.
+
+    Les 9 cellules autour de la clé k sont k + dx * width + dz (dx, dz dans -1, 0, 1).
+    Une cellule plus grande que le rayon de recherche reste correcte (moins
+    sélective) ; un rayon infini donne une cellule unique.
+
+    Returns:
+        (keys, width)
+    """
+    x_min, x_max = float(x.min()), float(x.max())
+    z_min, z_max = float(z.min()), float(z.max())
+    extent = max(x_max - x_min, z_max - z_min)
+    cell_size = max(cell_size, extent / MAX_CELLS_PER_AXIS)
+
+    cell_x = np.floor((x - x_min) / cell_size).astype(np.int64) + 1
+    cell_z = np.floor((z - z_min) / cell_size).astype(np.int64) + 1
+    width = int(cell_z.max()) + 2
+    return cell_x * width + cell_z, width
+
+
+def _neighbour_offsets(width: int) -> List[int]:
+    return [dx * width + dz for dx in (-1, 0, 1) for dz in (-1, 0, 1)]
+
+
+def _expand_ranges(queries: np.ndarray,
+                   lo: np.ndarray,
+                   hi: np.ndarray,
+                   items: np.ndarray,
+                   max_pairs: int = MAX_PAIRS_PER_CHUNK) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Paires (queries[k], items[lo[k]:hi[k]]) par tranches d'au plus max_pairs paires
+    (une requête dont la plage dépasse max_pairs forme à elle seule une tranche).
+    """
+    counts = hi - lo
+    ends = np.cumsum(counts)
+    if len(ends) == 0 or ends[-1] == 0:
+        return
+
+    start = 0
+    while start < len(queries):
+        base = int(ends[start - 1]) if start else 0
+        stop = max(int(np.searchsorted(ends, base + max_pairs, side='right')), start + 1)
+        total = int(ends[stop - 1]) - base
+        if total:
+            segment = counts[start:stop]
+            pair_query = np.repeat(queries[start:stop], segment)
+            # Position dans items de chaque paire : lo[k] + (0 .. counts[k] - 1)
+            first = np.repeat(lo[start:stop] - (ends[start:stop] - base - segment), segment)
+            yield pair_query, items[first + np.arange(total, dtype=np.int64)]
+        start = stop
+
+
+def _row_offsets(width: int) -> List[int]:
+    # Les 3 cellules d'une même colonne (dz = -1, 0, 1) ont des clés consécutives :
+    # les 9 cellules voisines forment 3 plages [k + offset - 1, k + offset + 1]
+    return [dx * width for dx in (-1, 0, 1)]
+
+
+def _grid_pairs(keys: np.ndarray, width: int, batch_size: int) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    row_offsets = _row_offsets(width)
+
+    # Lots pris dans l'ordre des cellules : searchsorted parcourt les clés dans l'ordre
+    for start in range(0, len(keys), batch_size):
+        batch = order[start:start + batch_size]
+        batch_keys = sorted_keys[start:start + batch_size]
+
+        for offset in row_offsets:
+            lo = np.searchsorted(sorted_keys, batch_keys + (offset - 1), side='left')
+            hi = np.searchsorted(sorted_keys, batch_keys + (offset + 1), side='right')
+            for pair_i, pair_j in _expand_ranges(batch, lo, hi, order):
+                earlier = pair_j < pair_i
+                if earlier.any():
+                    yield pair_i[earlier], pair_j[earlier]
+
+
+def candidate_pairs(x: np.ndarray,
+                    z: np.ndarray,
+                    radius: float,
+                    batch_size: int = PAIR_BATCH_SIZE) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Génère par tranches toutes les paires (i, j), j < i, situées dans des cellules voisines.
+
+    Version vectorisée de SpatialGrid : les objets sont triés par cellule puis
+    chaque lot d'objets est joint aux 9 cellules qui l'entourent. Toute paire dont
+    la distance XZ est inférieure à radius est incluse. Chaque tranche compte au
+    plus MAX_PAIRS_PER_CHUNK paires, mais leur nombre total croît comme le carré
+    de la densité : le filtrage (greedy_thin) ne compare que les objets conservés.
+
+    Args:
+        x, z: Coordonnées au sol des objets
+        radius: Rayon de recherche (taille de cellule minimale)
+        batch_size: Nombre d'objets requêtés par lot
+
+    Returns:
+        Générateur de tableaux (i, j) d'indices d'objets
+    """
+    if len(x) < 2:
+        return
+    keys, width = cell_keys(x, z, radius)
+    yield from _grid_pairs(keys, width, batch_size)
+
+
+def cross_candidate_pairs(x: np.ndarray,
+                          z: np.ndarray,
+                          query_x: np.ndarray,
+                          query_z: np.ndarray,
+                          radius: float,
+                          batch_size: int = PAIR_BATCH_SIZE) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Génère par tranches les paires (requête q, objet j) situées dans des cellules voisines.
+
+    Comme candidate_pairs, mais seuls les objets (x, z) sont indexés : chaque lot de
+    requêtes n'est joint qu'à eux, sans former les paires entre requêtes ni entre objets.
+
+    Args:
+        x, z: Coordonnées au sol des objets indexés
+        query_x, query_z: Coordonnées au sol des requêtes
+        radius: Rayon de recherche (taille de cellule minimale)
+        batch_size: Nombre de requêtes par lot
+
+    Returns:
+        Générateur de tableaux (q, j) : indices de requêtes et d'objets
+    """
+    if len(x) == 0 or len(query_x) == 0:
+        return
+    # Grille commune : les clés des requêtes et des objets sont comparables
+    keys, width = cell_keys(np.concatenate([x, query_x]), np.concatenate([z, query_z]), radius)
+    keys, query_keys = keys[:len(x)], keys[len(x):]
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    query_order = np.argsort(query_keys, kind='stable')
+    sorted_query_keys = query_keys[query_order]
+
+    # Lots pris dans l'ordre des cellules : searchsorted parcourt les clés dans l'ordre
+    for start in range(0, len(query_keys), batch_size):
+        batch = query_order[start:start + batch_size]
+        batch_keys = sorted_query_keys[start:start + batch_size]
+        for offset in _row_offsets(width):
+            lo = np.searchsorted(sorted_keys, batch_keys + (offset - 1), side='left')
+            hi = np.searchsorted(sorted_keys, batch_keys + (offset + 1), side='right')
+            yield from _expand_ranges(batch, lo, hi, order)
+
+
+def count_candidate_pairs(x: np.ndarray, z: np.ndarray, radius: float) -> int:
+    """
+    Nombre de paires que produirait candidate_pairs, sans les générer.
+    """
+    if len(x) < 2:
+        return 0
+    keys, width = cell_keys(x, z, radius)
+    cells, counts = np.unique(keys, return_counts=True)
+    neighbours = np.zeros(len(cells), dtype=np.int64)
+    for offset in _neighbour_offsets(width):
+        target = cells + offset
+        at = np.minimum(np.searchsorted(cells, target), len(cells) - 1)
+        found = cells[at] == target
+        neighbours[found] += counts[at[found]]
+    # Paires ordonnées des 9 cellules, moins chaque objet avec lui-même
+    return int((counts * neighbours - counts).sum() // 2)
+
+
+def _merge_first_blockers(pair_i: np.ndarray,
+                          pair_j: np.ndarray,
+                          pair_distance: np.ndarray,
+                          blocker: np.ndarray,
+                          blocker_distance: np.ndarray):
+    """
+    Retient pour chaque objet pair_i le voisin pair_j de plus petit indice (et sa
+    distance), s'il précède le bloqueur déjà enregistré.
+    """
+    if len(pair_i) == 0:
+        return
+    order = np.lexsort((pair_j, pair_i))
+    first_i = pair_i[order]
+    first = np.concatenate([[True], first_i[1:] != first_i[:-1]])
+    first_i, first_j = first_i[first], pair_j[order][first]
+    current = blocker[first_i]
+    better = (current == -1) | (first_j < current)
+    blocker[first_i[better]] = first_j[better]
+    blocker_distance[first_i[better]] = pair_distance[order][first][better]
+
+
+def greedy_from_pairs(count: int,
+                      pair_i: np.ndarray,
+                      pair_j: np.ndarray,
+                      pair_distance: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Résout le filtrage glouton "premier rencontré gagne" à partir des paires sous le seuil.
+
+    Args:
+        count: Nombre total d'objets
+        pair_i, pair_j: Paires (j < i) dont la distance est sous le seuil
+        pair_distance: Distance de chaque paire
+
+    Returns:
+        (blocker, blocker_distance) : pour chaque objet, l'indice du premier objet
+        conservé qui l'a fait supprimer (-1 si conservé) et la distance associée
+    """
+    order = np.lexsort((pair_j, pair_i))
+    pair_j = pair_j[order].tolist()
+    pair_distance = pair_distance[order]
+    bounds = np.searchsorted(pair_i[order], np.arange(count + 1)).tolist()
+
+    kept = [False] * count
+    blocker = [-1] * count
+    blocker_pair = [-1] * count
+
+    for i in range(count):
+        for k in range(bounds[i], bounds[i + 1]):
+            # Voisins triés par indice croissant : le premier conservé est celui
+            # sur lequel le parcours de la liste des acceptés s'arrêtait
+            if kept[pair_j[k]]:
+                blocker[i] = pair_j[k]
+                blocker_pair[i] = k
+                break
+        else:
+            kept[i] = True
+
+    blocker = np.array(blocker, dtype=np.int64)
+    blocker_pair = np.array(blocker_pair, dtype=np.int64)
+    blocker_distance = np.full(count, np.inf)
+    removed = blocker_pair >= 0
+    blocker_distance[removed] = pair_distance[blocker_pair[removed]]
+
+    return blocker, blocker_distance
+
+
+def resolve_first_wins(count: int,
+                       pair_i: np.ndarray,
+                       pair_j: np.ndarray,
+                       pair_distance: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Même résultat que greedy_from_pairs, calculé par tours vectorisés.
+
+    Un objet est conservé si aucun voisin d'indice inférieur n'est conservé. À
+    chaque tour, les objets dont un voisin antérieur est conservé sont supprimés
+    et ceux dont tous les voisins antérieurs sont supprimés sont conservés. Le
+    nombre de tours est la longueur des chaînes de dépendances, faible en
+    pratique ; si un tour progresse trop peu, le reste passe par greedy_from_pairs.
+
+    Returns:
+        (blocker, blocker_distance), voir greedy_from_pairs
+    """
+    undecided, kept, removed = 0, 1, 2
+    state = np.zeros(count, dtype=np.int8)
+    live_i, live_j = pair_i, pair_j
+
+    while True:
+        pending = state == undecided
+        remaining = int(pending.sum())
+        if remaining == 0:
+            break
+
+        neighbour = state[live_j]
+        blocked = np.bincount(live_i[neighbour == kept], minlength=count) > 0
+        state[pending & blocked] = removed
+        waiting = np.bincount(live_i[state[live_j] == undecided], minlength=count) > 0
+        state[(state == undecided) & ~waiting] = kept
+
+        live = state[live_i] == undecided
+        live_i, live_j = live_i[live], live_j[live]
+        if remaining - int((state == undecided).sum()) < MIN_ROUND_PROGRESS * remaining:
+            # Sous-problème des objets en attente, une fois retirés ceux qui ont un voisin
+            # conservé : leurs voisins déjà décidés sont alors tous supprimés
+            blocked = np.bincount(live_i[state[live_j] == kept], minlength=count) > 0
+            state[(state == undecided) & blocked] = removed
+            live = state[live_i] == undecided
+            live_i, live_j = live_i[live], live_j[live]
+            rest = np.flatnonzero(state == undecided)
+            inner = state[live_j] == undecided
+            local_blocker, _ = greedy_from_pairs(len(rest),
+                                                 np.searchsorted(rest, live_i[inner]),
+                                                 np.searchsorted(rest, live_j[inner]),
+                                                 np.zeros(int(inner.sum())))
+            state[rest] = np.where(local_blocker == -1, kept, removed)
+            break
+
+    # Premier voisin conservé (plus petit indice), comme le parcours séquentiel
+    blocker = np.full(count, -1, dtype=np.int64)
+    blocker_distance = np.full(count, np.inf)
+    by_kept = (state[pair_j] == kept) & (state[pair_i] == removed)
+    _merge_first_blockers(pair_i[by_kept], pair_j[by_kept], pair_distance[by_kept], blocker, blocker_distance)
+    return blocker, blocker_distance
+
+
+def priority_order(count: int, seed: int = DEFAULT_SEED, weights: np.ndarray = None) -> np.ndarray:
+    """
+    Ordre de parcours du mode 'poisson' : permutation aléatoire tirée avec seed,
+    ou objets de plus grand poids d'abord (égalités départagées par le tirage).
+
+    Args:
+        count: Nombre d'objets
+        seed: Graine du tirage (None = tirage différent à chaque appel)
+        weights: Priorité de chaque objet (ex: taille), None = aucune
+
+    Returns:
+        order : order[r] est l'objet examiné au rang r
+    """
+    order = np.random.default_rng(seed).permutation(count)
+    if weights is not None:
+        order = order[np.argsort(-np.asarray(weights)[order], kind='stable')]
+    return order
+
+
+def resolve_in_order(count: int,
+                     pair_i: np.ndarray,
+                     pair_j: np.ndarray,
+                     pair_distance: np.ndarray,
+                     order: np.ndarray = None,
+                     resolve: Callable = greedy_from_pairs) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Filtrage glouton parcouru dans l'ordre donné au lieu de l'ordre des indices.
+
+    Les paires sont renumérotées par rang dans order puis résolues par resolve
+    (greedy_from_pairs ou resolve_first_wins) : l'objet examiné en premier gagne.
+    Avec un ordre aléatoire, les objets conservés forment un échantillonnage
+    Poisson-disk maximal : deux objets conservés sont au moins au seuil l'un de
+    l'autre, et tout objet supprimé a un voisin conservé sous le seuil.
+
+    Returns:
+        (blocker, blocker_distance) en indices d'origine, voir greedy_from_pairs
+    """
+    if order is None:
+        return resolve(count, pair_i, pair_j, pair_distance)
+
+    rank = np.empty(count, dtype=np.int64)
+    rank[order] = np.arange(count, dtype=np.int64)
+    rank_i, rank_j = rank[pair_i], rank[pair_j]
+    ranked_blocker, ranked_distance = resolve(count,
+                                              np.maximum(rank_i, rank_j),
+                                              np.minimum(rank_i, rank_j),
+                                              pair_distance)
+
+    return _from_ranks(order, ranked_blocker, ranked_distance)
+
+
+def _from_ranks(order: np.ndarray,
+                ranked_blocker: np.ndarray,
+                ranked_distance: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # Résultat d'un parcours sur les objets renumérotés par rang, ramené aux indices d'origine
+    blocker = np.full(len(order), -1, dtype=np.int64)
+    removed = ranked_blocker >= 0
+    blocker[order[removed]] = order[ranked_blocker[removed]]
+    blocker_distance = np.empty(len(order))
+    blocker_distance[order] = ranked_distance
+    return blocker, blocker_distance
+
+
+def _in_order(order: np.ndarray, x: np.ndarray, z: np.ndarray,
+              pair_distance_func: Callable[[np.ndarray, np.ndarray], np.ndarray]):
+    # Coordonnées et distance des objets renumérotés par rang dans order
+    def ranked_distance_func(i, j):
+        return pair_distance_func(order[i], order[j])
+    return x[order], z[order], ranked_distance_func
+
+
+class KeptCells:
+    """
+    Objets conservés rangés par cellule, complétés par lots (voir greedy_thin).
+
+    Équivalent vectorisé de SpatialGrid : seuls les objets déjà conservés sont
+    indexés, comme dans GreedyThinner. Le nombre d'objets de chaque cellule est
+    connu d'avance : chaque cellule reçoit une plage réservée de slots, remplie au
+    fil des lots. Un ajout ne recopie donc pas les objets déjà conservés, et une
+    requête coûte O(objets requêtés + paires), quel que soit le nombre d'objets
+    conservés.
+
+    Args:
+        keys: Clé de cellule de tous les objets (voir cell_keys)
+        width: Largeur de la grille (voir cell_keys)
+    """
+
+    def __init__(self, keys: np.ndarray, width: int):
+        cells, cell_of, counts = np.unique(keys, return_inverse=True, return_counts=True)
+        self.cell_of = cell_of.reshape(-1)
+        self.start = np.cumsum(counts) - counts
+        self.filled = np.zeros(len(cells), dtype=np.int64)
+        self.slots = np.empty(len(keys), dtype=np.int64)
+        # Pour chaque cellule et chaque plage [k + offset - 1, k + offset + 1] des 9 voisines :
+        # première cellule existante et nombre de cellules existantes (au plus 3, consécutives)
+        self.neighbours = []
+        for offset in _row_offsets(width):
+            first = np.searchsorted(cells, cells + (offset - 1), side='left')
+            last = np.searchsorted(cells, cells + (offset + 1), side='right')
+            self.neighbours.append((first, (last - first).astype(np.int8)))
+
+    def insert(self, items: np.ndarray):
+        if len(items) == 0:
+            return
+        cells = self.cell_of[items]
+        order = np.argsort(cells, kind='stable')
+        cells, items = cells[order], items[order]
+        # Rang de chaque objet parmi ceux de sa cellule dans ce lot
+        rank = np.arange(len(cells)) - np.searchsorted(cells, cells, side='left')
+        self.slots[self.start[cells] + self.filled[cells] + rank] = items
+        touched, added = np.unique(cells, return_counts=True)
+        self.filled[touched] += added
+
+    def pairs(self, queries: np.ndarray) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Paires (objet requêté, objet conservé d'une des 9 cellules voisines), par tranches bornées.
+        """
+        query_cells = self.cell_of[queries]
+        for first, spans in self.neighbours:
+            first, spans = first[query_cells], spans[query_cells]
+            for step in range(3):
+                inside = spans > step
+                cell = first[inside] + step
+                lo = self.start[cell]
+                yield from _expand_ranges(queries[inside], lo, lo + self.filled[cell], self.slots)
+
+
+def _sparse_cells(keys: np.ndarray) -> bool:
+    # Les objets se répartissent-ils en cellules peu peuplées (peu de paires internes) ?
+    _, counts = np.unique(keys, return_counts=True)
+    return int((counts * counts).sum()) <= SPARSE_PAIRS_PER_SURVIVOR * len(keys)
+
+
+def _resolve_block(survivors: np.ndarray,
+                   keys: np.ndarray,
+                   width: int,
+                   threshold: float,
+                   pair_distance_func: Callable[[np.ndarray, np.ndarray], np.ndarray],
+                   batch_size: int) -> Tuple[np.ndarray, np.ndarray]:
+    # Filtrage glouton des objets d'un lot entre eux (indices locaux à survivors)
+    count = len(survivors)
+    close_i, close_j, close_distance = [], [], []
+    if count > 1:
+        for pair_i, pair_j in _grid_pairs(keys[survivors], width, batch_size):
+            distance = pair_distance_func(survivors[pair_i], survivors[pair_j])
+            close = distance < threshold
+            close_i.append(pair_i[close])
+            close_j.append(pair_j[close])
+            close_distance.append(distance[close])
+
+    if not close_i:
+        return np.full(count, -1, dtype=np.int64), np.full(count, np.inf)
+    return resolve_first_wins(count, np.concatenate(close_i), np.concatenate(close_j), np.concatenate(close_distance))
+
+
+def greedy_cells(count: int,
+                 keys: np.ndarray,
+                 width: int,
+                 threshold: float,
+                 pair_distance_func: Callable[[np.ndarray, np.ndarray], np.ndarray],
+                 batch_size: int = PAIR_BATCH_SIZE) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Filtrage glouton "premier rencontré gagne" sur des clés de cellule déjà calculées
+    (voir cell_keys ; des cellules plus grandes que le rayon du seuil restent correctes).
+
+    Les objets sont traités par lots, dans l'ordre des indices. Chaque lot est
+    d'abord comparé aux seuls objets déjà conservés (KeptCells), tous d'indice
+    inférieur : un objet proche de l'un d'eux est supprimé. Les objets restants,
+    au plus MAX_BLOCK_SURVIVORS, sont départagés entre eux (resolve_first_wins),
+    puis les conservés sont indexés. Le coût d'un objet dépend donc du nombre
+    d'objets conservés autour de lui, borné par le seuil, et non de la densité de
+    l'export. La taille du lot suivant est ajustée à la proportion d'objets restants.
+
+    Sur un export clairsemé (presque tout est conservé), la limite de survivants
+    double à chaque lot jusqu'à batch_size, tant que les survivants restent
+    dispersés dans des cellules peu peuplées (SPARSE_PAIRS_PER_SURVIVOR).
+
+    Returns:
+        (blocker, blocker_distance), voir greedy_from_pairs
+    """
+    blocker = np.full(count, -1, dtype=np.int64)
+    blocker_distance = np.full(count, np.inf)
+    kept_cells = KeptCells(keys, width)
+    block_size = survivor_limit = MAX_BLOCK_SURVIVORS
+
+    start = 0
+    while start < count:
+        block = np.arange(start, min(start + block_size, count), dtype=np.int64)
+        # Objets déjà supprimés lors du passage précédent (lot tronqué) : décision définitive
+        block = block[blocker[block] == -1]
+
+        for pair_i, pair_j in kept_cells.pairs(block):
+            distance = pair_distance_func(pair_i, pair_j)
+            close = distance < threshold
+            _merge_first_blockers(pair_i[close], pair_j[close], distance[close], blocker, blocker_distance)
+
+        survivors = block[blocker[block] == -1]
+        queried, remaining = len(block), len(survivors)
+        stop = min(start + block_size, count)
+        if survivor_limit > MAX_BLOCK_SURVIVORS and remaining > MAX_BLOCK_SURVIVORS \
+                and not _sparse_cells(keys[survivors[:survivor_limit]]):
+            # Survivants regroupés : retour aux lots de taille bornée
+            survivor_limit = MAX_BLOCK_SURVIVORS
+        if remaining > survivor_limit:
+            # Les objets suivants seront de nouveau comparés, aux conservés de ce lot compris
+            stop = int(survivors[survivor_limit])
+            survivors = survivors[:survivor_limit]
+
+        local_blocker, local_distance = _resolve_block(survivors, keys, width, threshold,
+                                                       pair_distance_func, batch_size)
+        removed = local_blocker >= 0
+        blocker[survivors[removed]] = survivors[local_blocker[removed]]
+        blocker_distance[survivors[removed]] = local_distance[removed]
+        kept = survivors[~removed]
+        kept_cells.insert(kept)
+
+        if remaining >= SPARSE_SURVIVOR_RATIO * queried and len(kept) >= SPARSE_SURVIVOR_RATIO * len(survivors):
+            survivor_limit = min(2 * survivor_limit, max(batch_size, MAX_BLOCK_SURVIVORS))
+        else:
+            survivor_limit = MAX_BLOCK_SURVIVORS
+
+        # Lot suivant : environ survivor_limit objets non bloqués attendus
+        block_size = int(min(batch_size, survivor_limit * max(queried, 1) / max(remaining, 1)))
+        block_size = max(block_size, survivor_limit)
+        start = stop
+
+    return blocker, blocker_distance
+
+
+def greedy_thin(count: int,
+                x: np.ndarray,
+                z: np.ndarray,
+                threshold: float,
+                pair_distance_func: Callable[[np.ndarray, np.ndarray], np.ndarray],
+                radius: float,
+                batch_size: int = PAIR_BATCH_SIZE,
+                order: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Filtrage glouton vectorisé : chaque lot n'est comparé qu'aux objets déjà conservés
+    (voir greedy_cells).
+
+    Args:
+        count: Nombre d'objets
+        x, z: Coordonnées au sol (positions ORIGINALES)
+        threshold: Seuil de proximité appliqué à pair_distance_func
+        pair_distance_func: Distance vectorisée f(i, j) -> tableau de distances
+        radius: Rayon de recherche sur les positions (voir search_radius)
+        batch_size: Nombre maximal d'objets par lot
+        order: Ordre de parcours (voir priority_order), None = ordre des indices
+
+    Returns:
+        (blocker, blocker_distance), voir greedy_from_pairs
+    """
+    if count == 0 or radius <= 0:
+        return np.full(count, -1, dtype=np.int64), np.full(count, np.inf)
+
+    if order is not None:
+        x, z, ranked_distance_func = _in_order(order, x, z, pair_distance_func)
+        return _from_ranks(order, *greedy_thin(count, x, z, threshold, ranked_distance_func, radius, batch_size))
+
+    if math.isinf(radius):
+        # Seuil au-delà de la distance normalisée maximale : tout est proche du premier
+        others = np.arange(1, count, dtype=np.int64)
+        blocker = np.zeros(count, dtype=np.int64)
+        blocker[0] = -1
+        blocker_distance = np.full(count, np.inf)
+        blocker_distance[1:] = pair_distance_func(others, np.zeros_like(others))
+        return blocker, blocker_distance
+
+    keys, width = cell_keys(x, z, radius)
+    return greedy_cells(count, keys, width, threshold, pair_distance_func, batch_size)
+
+
+class ThresholdIndex:
+    """
+    Grille de cellules calculée une seule fois pour essayer plusieurs seuils.
+
+    Les clés de cellule sont calculées pour le rayon de max_threshold (et l'ordre
+    de parcours appliqué) une fois ; chaque essai d'un seuil inférieur relance
+    seulement greedy_cells sur cette grille, qui ne compare chaque lot qu'aux
+    objets déjà conservés (même résultat que greedy_thin avec ce seuil). Aucune
+    paire n'est conservée entre deux essais : la mémoire reste proportionnelle au
+    nombre d'objets.
+
+    Args:
+        count: Nombre d'objets
+        x, z: Coordonnées au sol (positions ORIGINALES)
+        pair_distance_func: Distance vectorisée f(i, j) -> tableau de distances
+        max_threshold: Plus grand seuil qui pourra être essayé
+        radius: Rayon de recherche correspondant à max_threshold (voir search_radius)
+        batch_size: Nombre maximal d'objets par lot
+        order: Ordre de parcours de chaque essai (voir priority_order), None = ordre des indices
+    """
+
+    def __init__(self,
+                 count: int,
+                 x: np.ndarray,
+                 z: np.ndarray,
+                 pair_distance_func: Callable[[np.ndarray, np.ndarray], np.ndarray],
+                 max_threshold: float,
+                 radius: float,
+                 batch_size: int = PAIR_BATCH_SIZE,
+                 order: np.ndarray = None):
+        self.count = count
+        self.max_threshold = max_threshold
+        self.batch_size = batch_size
+        self.order = order
+
+        if order is not None:
+            x, z, pair_distance_func = _in_order(order, x, z, pair_distance_func)
+        self.pair_distance_func = pair_distance_func
+        self.keys = self.width = None
+        if count > 0 and radius > 0:
+            self.keys, self.width = cell_keys(x, z, radius)
+
+    def select(self, threshold: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns:
+            (blocker, blocker_distance) pour ce seuil, voir greedy_from_pairs
+        """
+        if threshold > self.max_threshold:
+            raise ValueError(f"Seuil {threshold} au-delà du seuil de l'index ({self.max_threshold})")
+        if self.keys is None or threshold <= 0:
+            return np.full(self.count, -1, dtype=np.int64), np.full(self.count, np.inf)
+        result = greedy_cells(self.count, self.keys, self.width, threshold, self.pair_distance_func, self.batch_size)
+        if self.order is not None:
+            return _from_ranks(self.order, *result)
+        return result
+
+    def kept(self, threshold: float) -> np.ndarray:
+        """
+        Masque des objets conservés avec ce seuil.
+        """
+        return self.select(threshold)[0] == -1
+
+
+# Décision d'un objet exclu du filtrage (voir IncrementalGreedy)
+INACTIVE = -2
+
+
+class IncrementalGreedy:
+    """
+    Décisions "premier rencontré gagne" mises à jour quand quelques objets changent.
+
+    Tous les objets (conservés ou non) sont indexés dans une SpatialGrid, et chaque
+    objet supprimé est rattaché à l'objet conservé qui le bloque. La décision d'un
+    objet ne dépend que des objets conservés d'indice inférieur dans son voisinage :
+    après une modification, seuls les objets modifiés sont réévalués, puis, dans
+    l'ordre des indices, ceux qu'un changement peut atteindre (objets bloqués par
+    un objet qui n'est plus conservé ou qui a bougé, voisins d'indice supérieur
+    d'un objet conservé à sa nouvelle position). Le résultat est identique à un
+    nouveau greedy_thin sur les objets actifs.
+
+    Args:
+        x, z: Coordonnées au sol (positions ORIGINALES)
+        pair_distance_func: Distance vectorisée f(i, j) -> tableau de distances
+        threshold: Seuil de proximité appliqué à pair_distance_func
+        radius: Rayon de recherche sur les positions (voir search_radius)
+        active: Objets soumis au filtrage (None = tous) ; les autres sont supprimés
+            sans bloquer personne (ex: doublons retirés avant le filtrage)
+    """
+
+    def __init__(self,
+                 x: np.ndarray,
+                 z: np.ndarray,
+                 pair_distance_func: Callable[[np.ndarray, np.ndarray], np.ndarray],
+                 threshold: float,
+                 radius: float,
+                 active: np.ndarray = None):
+        count = len(x)
+        self.threshold = threshold
+        self.x, self.z = np.array(x, dtype=np.float64), np.array(z, dtype=np.float64)
+        active = np.ones(count, dtype=bool) if active is None else active
+
+        # Premier passage : filtrage vectorisé des objets actifs
+        self.blocker = np.full(count, INACTIVE, dtype=np.int64)
+        self.blocker_distance = np.full(count, np.inf)
+        rows = np.flatnonzero(active)
+        self.blocker[rows] = -1
+        if len(rows) and radius > 0:
+            def rows_distance_func(i, j):
+                return pair_distance_func(rows[i], rows[j])
+            blocker, blocker_distance = greedy_thin(len(rows), self.x[rows], self.z[rows], threshold,
+                                                    rows_distance_func, radius)
+            removed = blocker >= 0
+            self.blocker[rows[removed]] = rows[blocker[removed]]
+            self.blocker_distance[rows] = blocker_distance
+
+        self.grid = SpatialGrid(radius) if radius > 0 else None
+        if self.grid is not None:
+            for i, (item_x, item_z) in enumerate(zip(self.x.tolist(), self.z.tolist())):
+                self.grid.insert(i, item_x, item_z)
+
+        self.dependents: Dict[int, set] = {}
+        for i in np.flatnonzero(self.blocker >= 0).tolist():
+            self.dependents.setdefault(int(self.blocker[i]), set()).add(i)
+
+    def kept(self) -> np.ndarray:
+        """
+        Masque des objets conservés.
+        """
+        return self.blocker == -1
+
+    def _decide(self, i: int, pair_distance_func) -> Tuple[int, float]:
+        # Plus petit indice conservé sous le seuil parmi les voisins d'indice inférieur
+        candidates = np.array([j for j in self.grid.query(self.x[i], self.z[i])
+                               if j < i and self.blocker[j] == -1], dtype=np.int64)
+        if len(candidates) == 0:
+            return -1, math.inf
+        distance = pair_distance_func(np.full(len(candidates), i, dtype=np.int64), candidates)
+        close = np.flatnonzero(distance < self.threshold)
+        if len(close) == 0:
+            return -1, math.inf
+        k = close[np.argmin(candidates[close])]
+        return int(candidates[k]), float(distance[k])
+
+    def update(self,
+               x: np.ndarray,
+               z: np.ndarray,
+               pair_distance_func: Callable[[np.ndarray, np.ndarray], np.ndarray],
+               changed: np.ndarray,
+               active: np.ndarray = None) -> int:
+        """
+        Met à jour les décisions après modification des objets changed (même nombre d'objets).
+
+        Args:
+            x, z, pair_distance_func: Nouvelles coordonnées et distance
+            changed: Indices des objets modifiés (n'importe quel champ) ou dont
+                l'appartenance à active a changé
+            active: Nouveaux objets actifs (None = tous)
+
+        Returns:
+            Nombre d'objets réévalués
+        """
+        changed = np.unique(np.asarray(changed, dtype=np.int64)).tolist()
+        x, z = np.array(x, dtype=np.float64), np.array(z, dtype=np.float64)
+        if self.grid is not None:
+            for i in changed:
+                self.grid.remove(i, self.x[i], self.z[i])
+                self.grid.insert(i, x[i], z[i])
+        self.x, self.z = x, z
+
+        modified = set(changed)
+        pending = list(changed)
+        queued = set(pending)
+        heapq.heapify(pending)
+        evaluated = 0
+        while pending:
+            # Ordre croissant : les décisions des indices inférieurs sont déjà à jour
+            i = heapq.heappop(pending)
+            queued.discard(i)
+            evaluated += 1
+
+            if active is not None and not active[i]:
+                decision, distance = INACTIVE, math.inf
+            elif self.grid is None:
+                decision, distance = -1, math.inf
+            else:
+                decision, distance = self._decide(i, pair_distance_func)
+
+            previous = int(self.blocker[i])
+            if previous >= 0:
+                self.dependents[previous].discard(i)
+            if decision >= 0:
+                self.dependents.setdefault(decision, set()).add(i)
+            self.blocker[i], self.blocker_distance[i] = decision, distance
+
+            was_kept, is_kept = previous == -1, decision == -1
+            if was_kept == is_kept and i not in modified:
+                continue
+            reached = []
+            if was_kept:
+                reached.extend(self.dependents.get(i, ()))
+            if is_kept and self.grid is not None:
+                reached.extend(j for j in self.grid.query(x[i], z[i]) if j > i)
+            for j in reached:
+                if j not in queued:
+                    queued.add(j)
+                    heapq.heappush(pending, j)
+        return evaluated
+
+
+def nearest_distances(count: int,
+                      x: np.ndarray,
+                      z: np.ndarray,
+                      pair_distance_func: Callable[[np.ndarray, np.ndarray], np.ndarray],
+                      radius: float,
+                      batch_size: int = PAIR_BATCH_SIZE) -> np.ndarray:
+    """
+    Distance de chaque objet à son plus proche voisin, recherché dans le rayon donné.
+
+    Args:
+        count: Nombre d'objets
+        x, z: Coordonnées au sol
+        pair_distance_func: Distance vectorisée f(i, j) -> tableau de distances
+        radius: Rayon de recherche sur les positions (voir search_radius)
+        batch_size: Nombre d'objets requêtés par lot
+
+    Returns:
+        Distances (math.inf si aucun voisin dans le rayon)
+    """
+    nearest = np.full(count, np.inf)
+    if count < 2 or radius <= 0:
+        return nearest
+
+    if math.isinf(radius):
+        # Tous les objets sont voisins : des cellules couvrant toute l'étendue
+        radius = max(float(np.ptp(x)), float(np.ptp(z)), 1.0)
+
+    for pair_i, pair_j in candidate_pairs(x, z, radius, batch_size):
+        distance = pair_distance_func(pair_i, pair_j)
+        np.minimum.at(nearest, pair_i, distance)
+        np.minimum.at(nearest, pair_j, distance)
+    return nearest
+
+
+def kept_ranks(blocker: np.ndarray) -> np.ndarray:
+    """
+    Rang de chaque objet parmi les objets conservés (-1 pour les objets supprimés).
+    """
+    kept = blocker == -1
+    return np.where(kept, np.cumsum(kept) - 1, -1)
+
+
+def _position_distance_func(x: np.ndarray, y: np.ndarray, z: np.ndarray):
+    def pair_distance_func(i, j):
+        dx, dy, dz = x[i] - x[j], y[i] - y[j], z[i] - z[j]
+        return np.sqrt(dx * dx + dy * dy + dz * dz)
+    return pair_distance_func
+
+
+def thin_to_count(x: np.ndarray,
+                  y: np.ndarray,
+                  z: np.ndarray,
+                  target: int,
+                  iterations: int = TIER_SEARCH_ITERATIONS) -> np.ndarray:
+    """
+    Sélectionne exactement target objets bien répartis (ordre d'origine conservé).
+
+    Le rayon du filtrage glouton est ajusté par dichotomie pour conserver au plus
+    target objets (à TIER_COUNT_TOLERANCE près) ; le complément est pris parmi les
+    objets supprimés les plus éloignés de leur voisin conservé.
+
+    Returns:
+        Indices (triés) des objets sélectionnés
+    """
+    count = len(x)
+    if target >= count:
+        return np.arange(count, dtype=np.int64)
+    if target <= 0:
+        return np.zeros(0, dtype=np.int64)
+
+    pair_distance_func = _position_distance_func(x, y, z)
+
+    def probe(radius):
+        result = greedy_thin(count, x, z, radius, pair_distance_func, radius)
+        return int((result[0] == -1).sum()), result
+
+    # Encadrement exponentiel à partir de l'espacement moyen attendu : les petits
+    # rayons gardent peu de paires candidates, contrairement à l'étendue totale
+    area = max(float(np.ptp(x)) * float(np.ptp(z)), 1e-12)
+    low, high = 0.0, math.sqrt(area / target)
+    kept, best = probe(high)
+    while kept > target:
+        low, high = high, high * 2
+        kept, best = probe(high)
+
+    for _ in range(iterations):
+        if target * (1.0 - TIER_COUNT_TOLERANCE) <= kept <= target:
+            break
+        radius = (low + high) / 2
+        kept, result = probe(radius)
+        if kept > target:
+            low = radius
+        else:
+            high = radius
+            best = result
+
+    blocker, blocker_distance = best
+    selected = blocker == -1
+    missing = target - int(selected.sum())
+    if missing > 0:
+        candidates = np.flatnonzero(~selected)
+        farthest = candidates[np.argsort(-blocker_distance[candidates], kind='stable')[:missing]]
+        selected[farthest] = True
+
+    return np.flatnonzero(selected)
+
+
+def density_tiers(x: np.ndarray,
+                  y: np.ndarray,
+                  z: np.ndarray,
+                  fractions=DEFAULT_TIER_FRACTIONS) -> Tuple[np.ndarray, List[int]]:
+    """
+    Construit des niveaux de densité imbriqués (ex: 100% / 50% / 10%).
+
+    Chaque niveau est un sous-ensemble bien réparti du niveau précédent, obtenu par
+    filtrage de type Poisson-disk avec un rayon croissant. Les objets sont réordonnés
+    du niveau le plus clairsemé au plus dense : le niveau k correspond au préfixe
+    des tier_counts[k] premiers objets, il suffit de tronquer le buffer.
+
+    Args:
+        x, y, z: Positions des objets
+        fractions: Proportions conservées par niveau (décroissantes, la première vaut 1.0)
+
+    Returns:
+        (order, tier_counts) : permutation à appliquer aux objets et taille de chaque niveau
+    """
+    count = len(x)
+    fractions = sorted(fractions, reverse=True)
+    tier_counts = [min(count, int(math.ceil(fraction * count))) for fraction in fractions]
+
+    # level[i] = niveau le plus clairsemé qui contient encore l'objet i
+    level = np.zeros(count, dtype=np.int64)
+    members = np.arange(count, dtype=np.int64)
+    for k, tier_count in enumerate(tier_counts):
+        members = members[thin_to_count(x[members], y[members], z[members], tier_count)]
+        level[members] = k
+
+    order = np.lexsort((np.arange(count), -level))
+    return order, tier_counts
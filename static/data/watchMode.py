@@ -0,0 +1,431 @@
+"""
+Mode surveillance : retraitement automatique des exports pendant l'édition de la scène.
+
+Au lieu de relancer clearerRoof.py ou clearerThinPlane.py à la main après chaque
+export Blender, un processus unique surveille les fichiers d'entrée (date de
+modification et taille, relevées toutes les POLL_INTERVAL secondes) et réécrit
+leur sortie dès qu'un export est terminé (fichier stable pendant SETTLE_TIME).
+
+Le processus reste chaud : modules et NumPy déjà chargés, et résultat de chaque
+catégorie conservé avec l'empreinte de ses objets d'entrée. À chaque export,
+seules les catégories dont les objets ont changé sont refiltrées ; les autres
+reprennent leur résultat précédent.
+
+Une catégorie modifiée n'est pas refiltrée en entier (IncrementalFilter) : ses
+colonnes, sa grille spatiale et les décisions de filtrage sont conservées d'un
+export à l'autre. Les objets modifiés sont repérés par comparaison des colonnes,
+puis seuls ces objets et ceux dont la décision en dépend sont réévalués (avec la
+règle "premier rencontré gagne", un objet déplacé peut changer les décisions
+d'une chaîne de voisins, que spatialIndex.IncrementalGreedy suit de proche en
+proche). Les objets conservés inchangés reprennent leur sortie transformée. Le
+fichier reste relu et décodé en entier à chaque export. Un export dont le nombre
+d'objets ou les champs changent reconstruit l'état de la catégorie ; les modes
+sans équivalent incrémental (budget, chunk_budget, sélection 'poisson') refiltrent
+toute la catégorie.
+
+La sortie est écrite dans un fichier temporaire puis renommée : le navigateur
+(rechargement à chaud de Vite) ne lit jamais un fichier partiel.
+"""
+import hashlib
+import inspect
+import json
+import os
+import tempfile
+import time
+from typing import Dict, Any, List, Tuple
+
+import numpy as np
+
+import clearerRoof
+import clearerThinPlane
+from clearerForest import DEFAULT_CONFIG, process_category, resolve_config
+from clearerPipeline import STAGES, DedupeStage, build_pipeline, config_to_spec
+from clearerReport import configure_logging, logger
+from duplicateHash import find_duplicates
+from jsonStream import load_positions
+from positionArrays import PositionArrays
+
+# Intervalle entre deux relevés des fichiers surveillés (secondes)
+POLL_INTERVAL = 0.1
+
+# Durée sans modification avant de traiter un fichier (export encore en cours d'écriture)
+SETTLE_TIME = 0.2
+
+TOOLS = ('roof', 'thinplane', 'forest')
+
+
+def _signature(path: str):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _objects_digest(objects: List[Dict[str, Any]]) -> str:
+    return hashlib.sha256(json.dumps(objects, separators=(',', ':')).encode()).hexdigest()
+
+
+def split_document(data: Any) -> Dict[Any, List[Dict[str, Any]]]:
+    """
+    Listes d'objets d'un document, par clé : None (liste directe), 'objects'
+    ou nom de catégorie ({catégorie: [objets]}).
+    """
+    if isinstance(data, list):
+        return {None: data}
+    if isinstance(data, dict) and isinstance(data.get('objects'), list):
+        return {'objects': data['objects']}
+    if isinstance(data, dict) and all(isinstance(objects, list) for objects in data.values()):
+        return dict(data)
+    raise ValueError("Format JSON non reconnu. Attendu: liste d'objets, dict avec clé 'objects' "
+                     "ou dict {catégorie: liste d'objets}")
+
+
+def join_document(data: Any, results: Dict[Any, List[Dict[str, Any]]]) -> Any:
+    """
+    Document de sortie de même forme que data (les autres clés sont conservées).
+    """
+    if None in results:
+        return results[None]
+    joined = dict(data)
+    joined.update(results)
+    return joined
+
+
+def write_json_atomic(output_file: str, data: Any):
+    directory = os.path.dirname(os.path.abspath(output_file))
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(temp_path, output_file)
+
+
+def run_tool(tool: str,
+             key: Any,
+             objects: List[Dict[str, Any]],
+             params: Dict[str, Any] = None,
+             category_config: Dict[str, Dict[str, Any]] = None,
+             default_config: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+    """
+    Filtre une liste d'objets avec l'outil demandé (voir WatchJob pour les paramètres).
+
+    Args:
+        key: Clé de la liste dans le document (voir split_document), catégorie de l'outil 'forest'
+    """
+    if tool == 'roof':
+        return clearerRoof.remove_close_objects(objects, **(params or {}))
+    if tool == 'thinplane':
+        return clearerThinPlane.remove_close_objects(objects, **(params or {}))
+    config = resolve_config('objects' if key is None else key, category_config, default_config)
+    kept, _ = process_category(PositionArrays.from_objects(objects), config)
+    return kept.to_objects()
+
+
+def check_tool_params(tool: str,
+                      params: Dict[str, Any] = None,
+                      category_config: Dict[str, Dict[str, Any]] = None,
+                      default_config: Dict[str, Any] = None):
+    """
+    Vérifie les paramètres d'un outil avant tout traitement (une faute de frappe
+    échouerait sinon au premier appel de remove_close_objects, ou serait ignorée
+    par resolve_config).
+
+    Raises:
+        ValueError: outil inconnu, paramètre inconnu de l'outil
+    """
+    if tool not in TOOLS:
+        raise ValueError(f"Outil inconnu: {tool} (disponibles: {', '.join(TOOLS)})")
+
+    if tool == 'forest':
+        if params:
+            raise ValueError("L'outil 'forest' prend category_config / default_config, pas params")
+        configs = [('default_config', default_config or {})]
+        configs += [(f"category_config['{category}']", config)
+                    for category, config in (category_config or {}).items()]
+        allowed = set(DEFAULT_CONFIG)
+    else:
+        module = clearerRoof if tool == 'roof' else clearerThinPlane
+        configs = [('params', params or {})]
+        allowed = set(inspect.signature(module.remove_close_objects).parameters) - {'objects', 'report'}
+
+    for where, config in configs:
+        unknown = sorted(set(config) - allowed)
+        if unknown:
+            raise ValueError(f"{where}: paramètre(s) inconnu(s) pour '{tool}': {', '.join(unknown)} "
+                             f"(disponibles: {', '.join(sorted(allowed))})")
+
+
+def _mask(masks: Dict[str, np.ndarray], field: str, count: int, default: bool) -> np.ndarray:
+    mask = masks.get(field)
+    return mask if mask is not None else np.full(count, default)
+
+
+def _changed_rows(old: PositionArrays, new: PositionArrays) -> np.ndarray:
+    """
+    Indices des objets dont un champ a changé, None si les deux exports ne se
+    comparent pas objet par objet (nombre d'objets, schéma ou champs différents).
+    """
+    if (old.count != new.count or old.schema != new.schema or set(old.columns) != set(new.columns)
+            or (old.ids is None) != (new.ids is None) or (old.extras is None) != (new.extras is None)):
+        return None
+
+    count = new.count
+    changed = np.zeros(count, dtype=bool)
+    for field, column in new.columns.items():
+        present = _mask(new.present, field, count, True)
+        # Comparaison des bits : -0.0 et 0.0 s'écrivent différemment en sortie
+        differs = column.view(np.uint64) != old.columns[field].view(np.uint64)
+        changed |= (differs & present) | (present != _mask(old.present, field, count, True))
+    for field in set(old.filled) | set(new.filled):
+        changed |= _mask(old.filled, field, count, False) != _mask(new.filled, field, count, False)
+    if new.ids is not None:
+        changed |= old.ids != new.ids
+    if new.extras is not None:
+        changed |= np.array([a != b for a, b in zip(old.extras, new.extras)], dtype=bool)
+    return np.flatnonzero(changed)
+
+
+class IncrementalFilter:
+    """
+    Résultat d'une liste d'objets tenu à jour d'un export à l'autre (mode 'first').
+
+    Les décisions de filtrage (DedupeStage.incremental) et la sortie transformée de
+    chaque objet conservé sont gardées : seuls les objets modifiés et ceux dont la
+    décision en dépend sont réévalués. Les étapes qui ne sont pas élément par
+    élément (tiers) sont rejouées sur tous les objets conservés.
+
+    Args:
+        threshold: Seuil de proximité
+        transform_spec: Étapes appliquées aux objets conservés (voir clearerPipeline.build_pipeline)
+        use_normalized, weighted: Mesure de distance (voir DedupeStage)
+        duplicate_tolerance: Pas des doublons retirés avant le filtrage si threshold > 0
+            (None = aucun, voir duplicateHash.py)
+    """
+
+    def __init__(self,
+                 threshold: float,
+                 transform_spec: List[Dict[str, Any]],
+                 use_normalized: bool = True,
+                 weighted: bool = False,
+                 duplicate_tolerance: float = None):
+        self.dedupe = DedupeStage(threshold=threshold, use_normalized=use_normalized, weighted=weighted)
+        self.duplicate_tolerance = duplicate_tolerance if threshold > 0 else None
+        self.pipeline = build_pipeline(transform_spec)
+        self.elementwise = all(STAGES[step['stage']].elementwise for step in transform_spec)
+        self.arrays = None
+        self.active = None
+        self.greedy = None
+        self.transformed: Dict[int, Dict[str, Any]] = {}
+
+    def _active(self, arrays: PositionArrays):
+        if self.duplicate_tolerance is None:
+            return None
+        return find_duplicates(arrays, self.duplicate_tolerance) == -1
+
+    def process(self, objects: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Filtre la nouvelle version de la liste.
+
+        Returns:
+            (objets conservés et modifiés, nombre d'objets réévalués)
+        """
+        arrays = PositionArrays.from_objects(objects)
+        if arrays.count == 0:
+            self.arrays = self.greedy = None
+            return [], 0
+
+        active = self._active(arrays)
+        changed = _changed_rows(self.arrays, arrays) if self.arrays is not None else None
+        if changed is None:
+            self.greedy = self.dedupe.incremental(arrays, active)
+            self.transformed = {}
+            evaluated = arrays.count
+        else:
+            if active is not None:
+                # Un objet devenu (ou qui n'est plus) doublon change aussi de décision
+                changed = np.union1d(changed, np.flatnonzero(active != self.active))
+            evaluated = self.dedupe.update(self.greedy, arrays, changed, active)
+            for i in changed.tolist():
+                self.transformed.pop(i, None)
+        self.arrays, self.active = arrays, active
+
+        kept = np.flatnonzero(self.greedy.kept())
+        if not self.elementwise:
+            result, _ = self.pipeline.run(arrays.take(kept))
+            return result.to_objects(), evaluated
+
+        missing = [i for i in kept.tolist() if i not in self.transformed]
+        if missing:
+            result, _ = self.pipeline.run(arrays.take(missing))
+            self.transformed.update(zip(missing, result.to_objects()))
+        return [self.transformed[i] for i in kept.tolist()], evaluated
+
+
+def incremental_filter(tool: str,
+                       key: Any,
+                       params: Dict[str, Any] = None,
+                       category_config: Dict[str, Dict[str, Any]] = None,
+                       default_config: Dict[str, Any] = None) -> IncrementalFilter:
+    """
+    IncrementalFilter équivalent à run_tool pour ces paramètres, None si le mode
+    demandé n'a pas d'équivalent incrémental (budget, chunk_budget, sélection 'poisson').
+    """
+    if tool == 'forest':
+        config = resolve_config('objects' if key is None else key, category_config, default_config)
+        if config.get('budget') is not None or config.get('chunk_budget') is not None \
+                or config.get('selection', 'first') != 'first':
+            return None
+        return IncrementalFilter(config['threshold'], config_to_spec(config, include_dedupe=False),
+                                 duplicate_tolerance=config.get('duplicate_tolerance'))
+
+    module = clearerRoof if tool == 'roof' else clearerThinPlane
+    arguments = inspect.signature(module.remove_close_objects).bind_partial(**(params or {}))
+    arguments.apply_defaults()
+    arguments = arguments.arguments
+    if arguments['budget'] is not None or arguments['selection'] != 'first':
+        return None
+    transform_names = inspect.signature(module.transform_spec).parameters
+    spec = module.transform_spec(**{name: arguments[name] for name in transform_names})
+    return IncrementalFilter(arguments['threshold'], spec, arguments['use_normalized'], module.WEIGHTED_DISTANCE,
+                             arguments['duplicate_tolerance'])
+
+
+class WatchJob:
+    """
+    Un fichier surveillé, son outil de traitement et ses résultats par catégorie.
+
+    Args:
+        input_file: Export à surveiller
+        output_file: Sortie réécrite à chaque export
+        tool: 'roof' (clearerRoof), 'thinplane' (clearerThinPlane) ou 'forest' (clearerForest)
+        params: Paramètres de remove_close_objects pour 'roof' / 'thinplane'
+            (threshold, scale_factor, y_offset, min_height, rotation_offset, budget, duplicate_tolerance)
+        category_config, default_config: Paramètres de 'forest' (voir clearerForest.resolve_config)
+    """
+
+    def __init__(self,
+                 input_file: str,
+                 output_file: str,
+                 tool: str = 'roof',
+                 params: Dict[str, Any] = None,
+                 category_config: Dict[str, Dict[str, Any]] = None,
+                 default_config: Dict[str, Any] = None):
+        check_tool_params(tool, params, category_config, default_config)
+        self.input_file = input_file
+        self.output_file = output_file
+        self.tool = tool
+        self.params = params or {}
+        self.category_config = category_config
+        self.default_config = default_config
+        self.results: Dict[Any, Tuple[str, List[Dict[str, Any]]]] = {}
+        self.filters: Dict[Any, IncrementalFilter] = {}
+        self.processed = None
+        self.seen = None
+        self.seen_at = 0.0
+
+    def _process_objects(self, key: Any, objects: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], int]:
+        if key not in self.filters:
+            self.filters[key] = incremental_filter(self.tool, key, self.params, self.category_config,
+                                                   self.default_config)
+        incremental = self.filters[key]
+        if incremental is None:
+            return run_tool(self.tool, key, objects, self.params, self.category_config, self.default_config), \
+                len(objects)
+        return incremental.process(objects)
+
+    def poll(self, now: float) -> bool:
+        """
+        Relève le fichier ; le traite s'il a changé et n'a plus bougé depuis SETTLE_TIME.
+
+        Returns:
+            True si la sortie a été réécrite
+        """
+        signature = _signature(self.input_file)
+        if signature != self.seen:
+            self.seen, self.seen_at = signature, now
+            return False
+        if signature is None or signature == self.processed or now - self.seen_at < SETTLE_TIME:
+            return False
+        return self.run(signature)
+
+    def run(self, signature=None) -> bool:
+        """
+        Retraite le fichier : seules les catégories dont les objets ont changé sont
+        refiltrées, et seuls leurs objets touchés par le changement sont réévalués.
+        """
+        start = time.perf_counter()
+        self.processed = signature if signature is not None else _signature(self.input_file)
+        try:
+            data = load_positions(self.input_file)
+            parts = split_document(data)
+        except (OSError, ValueError) as e:
+            # json.JSONDecodeError dérive de ValueError : export illisible, on attend le suivant
+            logger.warning(f"{self.input_file}: {e} ; en attente du prochain export")
+            return False
+
+        results = {}
+        changed = 0
+        evaluated = 0
+        for key, objects in parts.items():
+            digest = _objects_digest(objects)
+            previous = self.results.get(key)
+            if previous is not None and previous[0] == digest:
+                results[key] = previous
+                continue
+            kept, key_evaluated = self._process_objects(key, objects)
+            results[key] = (digest, kept)
+            changed += 1
+            evaluated += key_evaluated
+        self.results = results
+        # Une catégorie disparue de l'export repart de zéro si elle revient
+        self.filters = {key: incremental for key, incremental in self.filters.items() if key in parts}
+
+        write_json_atomic(self.output_file, join_document(data, {key: kept for key, (_, kept) in results.items()}))
+        elapsed = (time.perf_counter() - start) * 1000.0
+        logger.info(f"{self.input_file}: {changed}/{len(parts)} liste(s) recalculée(s), {evaluated} objet(s) "
+                    f"réévalué(s) en {elapsed:.0f} ms → {self.output_file}")
+        return True
+
+
+def watch(jobs: List[WatchJob], poll_interval: float = POLL_INTERVAL, max_polls: int = None):
+    """
+    Traite chaque fichier une première fois, puis surveille les exports jusqu'à Ctrl+C.
+
+    Args:
+        jobs: Fichiers surveillés
+        poll_interval: Intervalle entre deux relevés (secondes)
+        max_polls: Nombre de relevés avant l'arrêt (None = sans fin)
+    """
+    for job in jobs:
+        if _signature(job.input_file) is None:
+            logger.warning(f"Fichier {job.input_file} non trouvé ; traité dès sa création")
+            continue
+        job.seen = job.processed = _signature(job.input_file)
+        job.run(job.processed)
+
+    logger.info(f"\nSurveillance de {len(jobs)} fichier(s) (Ctrl+C pour arrêter)")
+    polls = 0
+    try:
+        while max_polls is None or polls < max_polls:
+            time.sleep(poll_interval)
+            now = time.monotonic()
+            for job in jobs:
+                job.poll(now)
+            polls += 1
+    except KeyboardInterrupt:
+        logger.info("Surveillance arrêtée")
+
+
+if __name__ == "__main__":
+    # Fichiers surveillés (mêmes paramètres que les __main__ de clearerRoof et clearerThinPlane)
+    WATCH_JOBS = [
+        WatchJob('treePositions_ThreeRoof2.json', 'output_ThreeRoof.json', 'roof',
+                 {'threshold': 0.02, 'min_height': 5.25}),
+        WatchJob('treePositions_ThinTrunkPlane.json', 'output_ThinTrunkPlane.json', 'thinplane',
+                 {'threshold': 0.001, 'scale_factor': 0.2150344,
+                  'rotation_offset': {'rotationX': -3.141592653589793, 'rotationY': 0.0, 'rotationZ': 0.0}}),
+    ]
+    LOG_LEVEL = 'INFO'  # 'WARNING' n'affiche plus que les exports illisibles
+
+    configure_logging(LOG_LEVEL)
+    watch(WATCH_JOBS)